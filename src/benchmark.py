@@ -0,0 +1,101 @@
+import argparse
+from pathlib import Path
+
+from inv3d_generator.benchmark.orchestration import benchmark_orchestration
+from inv3d_generator.benchmark.supplementary import benchmark_supplementary, GENERATORS
+from inv3d_generator.benchmark.surfaces import SURFACES
+from inv3d_generator.formats import save_json
+
+
+def run_supplementary(args: argparse.Namespace):
+    results = benchmark_supplementary(surfaces=args.surfaces,
+                                      resolutions_rendering=args.resolutions_rendering,
+                                      resolutions_bm=args.resolutions_bm,
+                                      generators=args.generators,
+                                      repeats=args.repeats,
+                                      seed=args.seed)
+
+    if args.output_file != '':
+        save_json(Path(args.output_file), {"supplementary": results}, exist=None)
+
+
+def run_orchestration(args: argparse.Namespace):
+    stage_workers = {
+        "invoice": args.invoice_workers,
+        "render": args.render_workers,
+        "supplementary": args.supplementary_workers,
+    } if args.pipeline else None
+
+    results = benchmark_orchestration(num_samples=args.num_samples,
+                                      worker_counts=[0] if args.pipeline else args.num_workers,
+                                      web_latency=args.web_latency,
+                                      blender_latency=args.blender_latency,
+                                      document_dpi=args.document_dpi,
+                                      resolution_rendering=args.resolution_rendering,
+                                      resolution_bm=args.resolution_bm,
+                                      stage_workers=stage_workers,
+                                      seed=args.seed)
+
+    if args.output_file != '':
+        save_json(Path(args.output_file), {"orchestration": results}, exist=None)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output_file', nargs='?', type=str, default='',
+                        help='JSON file to store the benchmark results')
+    parser.add_argument('--seed', nargs='?', type=int, default=42,
+                        help='Seed for the synthetic inputs')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    parser_supplementary = subparsers.add_parser('supplementary',
+                                                 help='Benchmarks the supplementary map generators on synthetic surfaces')
+    parser_supplementary.add_argument('--surfaces', nargs='+', type=str, default=list(SURFACES), choices=SURFACES,
+                                      help='Analytic surfaces used to create the UV and WC maps')
+    parser_supplementary.add_argument('--resolutions_rendering', nargs='+', type=int, default=[448, 1024, 1600],
+                                      help='X and Y-resolutions of the synthetic UV and WC maps')
+    parser_supplementary.add_argument('--resolutions_bm', nargs='+', type=int, default=[128, 512, 1024],
+                                      help='X and Y-resolutions of the backward mappings')
+    parser_supplementary.add_argument('--generators', nargs='+', type=str, default=list(GENERATORS),
+                                      choices=GENERATORS, help='Supplementary generators to benchmark')
+    parser_supplementary.add_argument('--repeats', nargs='?', type=int, default=3,
+                                      help='Number of runs per configuration')
+    parser_supplementary.set_defaults(func=run_supplementary)
+
+    parser_orchestration = subparsers.add_parser('orchestration',
+                                                 help='Benchmarks the task processing with fake Chrome and Blender '
+                                                      'backends')
+    parser_orchestration.add_argument('--num_samples', nargs='?', type=int, default=200,
+                                      help='Number of samples generated per run')
+    parser_orchestration.add_argument('--num_workers', nargs='+', type=int, default=[0, 1, 2, 4],
+                                      help='Worker counts to compare (0: sequential execution)')
+    parser_orchestration.add_argument('--web_latency', nargs='?', type=float, default=0.0,
+                                      help='Seconds per page load of the fake web backend')
+    parser_orchestration.add_argument('--blender_latency', nargs='?', type=float, default=0.0,
+                                      help='Seconds per pass rendered by the fake blender backend')
+    parser_orchestration.add_argument('--document_dpi', nargs='?', type=int, default=50,
+                                      help='Y-resolution of the flat documents')
+    parser_orchestration.add_argument('--resolution_rendering', nargs='?', type=int, default=128,
+                                      help='X and Y-resolution for warped image rendering')
+    parser_orchestration.add_argument('--resolution_bm', nargs='?', type=int, default=64,
+                                      help='X and Y-resolution for backward mapping')
+    parser_orchestration.add_argument('--pipeline', nargs='?', type=bool, default=False,
+                                      help='Use pipelined execution instead of the given worker counts')
+    parser_orchestration.add_argument('--invoice_workers', nargs='?', type=int, default=2,
+                                      help='Number of processes creating flat invoices in pipelined execution')
+    parser_orchestration.add_argument('--render_workers', nargs='?', type=int, default=1,
+                                      help='Number of processes rendering warped documents in pipelined execution')
+    parser_orchestration.add_argument('--supplementary_workers', nargs='?', type=int, default=1,
+                                      help='Number of processes creating supplementary files in pipelined execution')
+    parser_orchestration.set_defaults(func=run_orchestration)
+
+    args = parser.parse_args()
+
+    for key, value in args.__dict__.items():
+        print(f"SETTING {key}: {value}")
+
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
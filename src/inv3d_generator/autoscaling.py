@@ -0,0 +1,201 @@
+import concurrent.futures
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+
+@dataclass(frozen=True)
+class AutoscalePolicy:
+    min_workers: int = 1
+    interval: float = 5.0  # seconds between two scaling decisions
+    target_cpu: float = 0.9  # workers are added only below this cpu utilization
+    memory_reserve: float = 0.1  # fraction of the memory kept available, workers are removed below it
+
+
+class HostLoad:
+    # CPU utilization and available memory of the host or, within a container, of its cgroup (v2 or v1)
+
+    CGROUP_DIR = Path("/sys/fs/cgroup")
+
+    def __init__(self):
+        assert Path("/proc/stat").is_file() and Path("/proc/meminfo").is_file(), "Host load requires /proc!"
+        self.cpu_quota = self._read_cpu_quota()
+        self.last_cpu = self._read_cpu_times()
+
+    def cpu_utilization(self) -> float:
+        # average utilization since the previous call
+        busy, total = self._read_cpu_times()
+        last_busy, last_total = self.last_cpu
+        self.last_cpu = (busy, total)
+        return (busy - last_busy) / max(total - last_total, 1e-6)
+
+    def memory(self) -> Tuple[int, int]:
+        # available and total memory in bytes
+        meminfo = {}
+        with open("/proc/meminfo", "r") as fp:
+            for line in fp:
+                key, value = line.split(":", maxsplit=1)
+                meminfo[key] = int(value.split()[0]) * 1024
+
+        available, total = meminfo["MemAvailable"], meminfo["MemTotal"]
+
+        limit_usage = self._read_cgroup_memory()
+        if limit_usage is not None and limit_usage[0] < total:
+            limit, usage = limit_usage
+            return min(available, limit - usage), limit
+
+        return available, total
+
+    def _read_cpu_times(self) -> Tuple[float, float]:
+        # busy and total cpu seconds
+        if self.cpu_quota is not None:
+            with (self.CGROUP_DIR / "cpu.stat").open("r") as fp:
+                usage = dict(line.split() for line in fp)
+            return int(usage["usage_usec"]) / 1e6, time.monotonic() * self.cpu_quota
+
+        with open("/proc/stat", "r") as fp:
+            values = [int(value) / os.sysconf("SC_CLK_TCK") for value in fp.readline().split()[1:]]
+        idle = values[3] + values[4]  # idle and iowait
+        return sum(values) - idle, sum(values)
+
+    def _read_cpu_quota(self) -> Optional[float]:
+        # number of cpus available to the cgroup if limited (cgroup v2 only)
+        cpu_max = self.CGROUP_DIR / "cpu.max"
+        if not cpu_max.is_file() or not (self.CGROUP_DIR / "cpu.stat").is_file():
+            return None
+
+        quota, period = cpu_max.read_text().split()
+        return None if quota == "max" else int(quota) / int(period)
+
+    def _read_cgroup_memory(self) -> Optional[Tuple[int, int]]:
+        for limit_file, usage_file in [("memory.max", "memory.current"),
+                                       ("memory/memory.limit_in_bytes", "memory/memory.usage_in_bytes")]:
+            if (self.CGROUP_DIR / limit_file).is_file() and (self.CGROUP_DIR / usage_file).is_file():
+                limit = (self.CGROUP_DIR / limit_file).read_text().strip()
+                if limit.isdigit():
+                    return int(limit), int((self.CGROUP_DIR / usage_file).read_text().strip())
+        return None
+
+
+class Autoscaler:
+    # Adjusts the number of concurrently running tasks per worker pool within bounds.
+    # Workers are added one at a time while the cpus are not saturated, the memory suffices for one more worker and
+    # tasks are waiting; the pool with the highest pressure (waiting work per worker) is scaled first.
+    # Workers are removed when the available memory falls below the reserve (halved below half the reserve), new
+    # workers are only added again after a cooldown.
+
+    COOLDOWN_STEPS = 3
+
+    def __init__(self, bounds: Dict[str, Tuple[int, int]], pressure: Callable[[str], float],
+                 policy: AutoscalePolicy = AutoscalePolicy()):
+        assert all(0 < lower <= upper for lower, upper in bounds.values())
+        assert 0 < policy.target_cpu <= 1 and 0 <= policy.memory_reserve < 1 and policy.interval > 0
+
+        self.bounds = bounds
+        self.pressure = pressure
+        self.policy = policy
+        self.limits = {key: lower for key, (lower, _) in bounds.items()}
+
+        self.load = HostLoad()
+        self.baseline_used = self._used_memory()
+        self.cooldown = 0
+
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def limit(self, key: str) -> int:
+        return self.limits[key]
+
+    def start(self):
+        print(f"AUTOSCALE starting with workers {self.limits} within bounds {self.bounds}")
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def _run(self):
+        while not self.stopped.wait(self.policy.interval):
+            self.step()
+
+    def _used_memory(self) -> int:
+        available, total = self.load.memory()
+        return total - available
+
+    def step(self):
+        cpu = self.load.cpu_utilization()
+        available, total = self.load.memory()
+
+        # memory used by the workers beyond the usage at the start
+        per_worker = max(total - available - self.baseline_used, 0) / sum(self.limits.values())
+        reserve = self.policy.memory_reserve * total
+
+        if available < reserve:
+            candidates = [key for key in self.limits if self.limits[key] > self.bounds[key][0]]
+            if len(candidates) > 0:
+                key = min(candidates, key=self.pressure)
+                limit = self.limits[key] // 2 if available < reserve / 2 else self.limits[key] - 1
+                self._set_limit(key, max(limit, self.bounds[key][0]), cpu, available / total)
+            self.cooldown = self.COOLDOWN_STEPS
+
+        elif self.cooldown > 0:
+            self.cooldown -= 1
+
+        elif cpu < self.policy.target_cpu and available - per_worker >= reserve:
+            candidates = [key for key in self.limits
+                          if self.limits[key] < self.bounds[key][1] and self.pressure(key) > 0]
+            if len(candidates) > 0:
+                key = max(candidates, key=self.pressure)
+                self._set_limit(key, self.limits[key] + 1, cpu, available / total)
+
+    def _set_limit(self, key: str, limit: int, cpu: float, available: float):
+        print(f"AUTOSCALE {key}: {self.limits[key]} -> {limit} workers "
+              f"(cpu {cpu:.0%}, available memory {available:.0%})")
+        self.limits[key] = limit
+
+
+class ScaledProcessPool(concurrent.futures.Executor):
+    # Process pool following a worker limit. Limiting only the submitted tasks would keep all worker processes with
+    # their caches and browsers alive. Instead, a changed limit replaces the pool with one of the new size: the replaced
+    # pool finishes the tasks submitted to it, then its worker processes exit and free their memory.
+
+    def __init__(self, size: Callable[[], int], **kwargs):
+        self.size = size
+        self.kwargs = kwargs
+
+        self.executor_size = size()
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.executor_size, **kwargs)
+        self.retired = []  # type: List[concurrent.futures.ProcessPoolExecutor]
+
+        self.outstanding = set()  # type: Set[concurrent.futures.Future]
+        self.lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs) -> concurrent.futures.Future:
+        size = self.size()
+        if size != self.executor_size:
+            self.executor.shutdown(wait=False)
+            self.retired.append(self.executor)
+            self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=size, **self.kwargs)
+            self.executor_size = size
+
+        future = self.executor.submit(fn, *args, **kwargs)
+        with self.lock:
+            self.outstanding.add(future)
+        future.add_done_callback(self._discard)
+        return future
+
+    def num_outstanding(self) -> int:
+        # submitted tasks which did not finish yet, running or waiting for a worker
+        with self.lock:
+            return len(self.outstanding)
+
+    def shutdown(self, wait: bool = True):
+        for executor in self.retired + [self.executor]:
+            executor.shutdown(wait=wait)
+
+    def _discard(self, future: concurrent.futures.Future):
+        with self.lock:
+            self.outstanding.discard(future)
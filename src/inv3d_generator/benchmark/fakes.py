@@ -0,0 +1,256 @@
+'''
+Local stand-ins for Chrome and Blender to run the dataset generation offline.
+
+install_fake_backends() replaces the external renderers within the current process. Worker processes started
+afterwards inherit the replacements (requires the "fork" start method, the default on Linux).
+The fakes write correctly shaped synthetic outputs after a configurable latency. All remaining steps of the
+generation (template filling, bounding boxes, word extraction, supplementary maps, ...) are executed as usual.
+'''
+import html
+import io
+import json
+import os
+import random
+import re
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# must be set before opencv reads or writes the first exr file
+os.environ["OPENCV_IO_ENABLE_OPENEXR"] = "1"
+
+import cv2  # noqa: E402
+import numpy as np  # noqa: E402
+from PIL import Image, ImageDraw  # noqa: E402
+
+from .surfaces import SURFACES, create_surface  # noqa: E402
+from ..formats import load_json  # noqa: E402
+from ..rendering.blender_server import BlenderJobResult  # noqa: E402
+from ..util import check_dir, check_file, resident_set_size  # noqa: E402
+
+A4_SIZE_INCH = (8.27, 11.69)
+A4_SIZE_PT = (595, 842)
+
+
+class FakeWebBackend:
+    latency = 0.0  # seconds per page load
+
+    @staticmethod
+    def convert_variants(source: str, targets: Dict[str, str], timeout: int = 2, print_options=None,
+                         install_driver: bool = True, script: Optional[str] = None,
+                         dpi: int = 200) -> Tuple[Dict[str, Dict[str, float]], Dict[str, bytes]]:
+        # the page is loaded once, all variants share the same text; the fake page is ready immediately
+        time.sleep(FakeWebBackend.latency)
+
+        html_file = Path(source[len("file://"):] if source.startswith("file://") else source)
+        lines = FakeWebBackend._text_lines(html_file.read_text(errors="ignore"))
+
+        results = {}
+        for variant, target in targets.items():
+            if target.endswith(".png"):
+                data = io.BytesIO()
+                FakeWebBackend._page_image(len(lines), dpi).save(data, format="png")
+                results[variant] = data.getvalue()
+            else:
+                results[variant] = FakeWebBackend._pdf(lines)
+
+            with open(target, "wb") as fp:
+                fp.write(results[variant])
+
+        return {"page_ready": {"wall_time": 0.0}}, results
+
+    @staticmethod
+    def rasterize_pdf(data: bytes, dpi: int) -> np.ndarray:
+        num_lines = len(re.findall(rb"\) Tj", data))
+        return np.asarray(FakeWebBackend._page_image(num_lines, dpi))[:, :, ::-1].copy()
+
+    @staticmethod
+    def _page_image(num_lines: int, dpi: int) -> Image.Image:
+        # text lines are drawn as dark bars at the positions used in the fake pdf
+        width, height = (round(size * dpi) for size in A4_SIZE_INCH)
+        image = Image.new("RGB", (width, height), "white")
+        draw = ImageDraw.Draw(image)
+
+        scale = dpi / 72
+        rng = random.Random(num_lines)  # keeps the global random state of the generation untouched
+        for idx in range(num_lines):
+            top = (A4_SIZE_PT[1] - 790 + idx * 14 - 8) * scale
+            draw.rectangle([50 * scale, top, (50 + rng.randint(100, 450)) * scale, top + 8 * scale], fill="black")
+
+        return image
+
+    @staticmethod
+    def _text_lines(content: str, words_per_line: int = 10, max_lines: int = 50) -> List[str]:
+        content = re.sub(r"<(script|style)[^>]*>.*?</\1>", " ", content, flags=re.S | re.I)
+        words = html.unescape(re.sub(r"<[^>]+>", " ", content)).split()
+        words = [word.encode("ascii", errors="ignore").decode() for word in words]
+        words = [word for word in words if len(word) > 0]
+
+        return [" ".join(words[idx:idx + words_per_line])
+                for idx in range(0, min(len(words), words_per_line * max_lines), words_per_line)]
+
+    @staticmethod
+    def _pdf(lines: List[str]) -> bytes:
+        # single page pdf with real text objects such that pdf parsers find the words
+        def escape(text: str) -> str:
+            return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+        stream = "BT /F1 10 Tf 14 TL 50 790 Td " + " T* ".join(f"({escape(line)}) Tj" for line in lines) + " ET"
+
+        objects = [
+            "<< /Type /Catalog /Pages 2 0 R >>",
+            "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {} {}] /Contents 4 0 R "
+            "/Resources << /Font << /F1 5 0 R >> >> >>".format(*A4_SIZE_PT),
+            f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream",
+            "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        ]
+
+        data = b"%PDF-1.4\n"
+        offsets = []
+        for idx, obj in enumerate(objects):
+            offsets.append(len(data))
+            data += f"{idx + 1} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+
+        xref_offset = len(data)
+        data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+        data += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+        data += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode(
+            "latin-1")
+
+        return data
+
+
+class FakeBlenderServer:
+    latency = 0.0  # seconds per blender pass
+
+    def __init__(self, num_slots: int = 1, threads_per_slot: int = 0, max_jobs_per_worker: int = 100):
+        pass
+
+    def stop(self):
+        pass
+
+    @classmethod
+    def execute_script(cls, code_file: Path, config_file: Path, output_dir: Optional[Path] = None) -> BlenderJobResult:
+        check_file(code_file, suffix=".py")
+        start_time = time.time()
+        time.sleep(cls.latency)
+
+        config = load_json(config_file)
+        name = code_file.stem.replace("doc3D_render_", "")
+
+        if name in ["mesh", "all"]:
+            cls._render_mesh(config, with_all_passes=name == "all")
+        elif name in ["recon", "alb", "dmap", "norm"]:
+            # the resolution of the separate passes is stored in the blender file of the mesh pass
+            with open(config["blender_file"], "r") as fp:
+                resolution = json.load(fp)["resolution"]
+            cls._render_pass(name, Path(config["output_dir"]), resolution, config["seed"])
+        else:
+            raise ValueError(f"Unknown blender script '{code_file.name}'!")
+
+        output_files = []
+        if output_dir is not None and output_dir.is_dir():
+            output_files = sorted(file for file in output_dir.rglob("*") if file.is_file())
+
+        return BlenderJobResult(exit_code=0, wall_time=time.time() - start_time, output_files=output_files,
+                                cpu_time=0.0, max_rss=resident_set_size())
+
+    @classmethod
+    def _render_mesh(cls, config, with_all_passes: bool):
+        base_dir = check_dir(config["output_base_dir"])
+        resolution = config["resolution"]
+        seed = config["seed"]
+
+        uv, wc = create_surface(SURFACES[seed % len(SURFACES)], resolution=resolution, seed=seed)
+
+        cls._write(base_dir / "img", "warped.png", cls._shaded_image(config["tex_file"], uv))
+        cls._write(base_dir / "uv", "warped.exr", uv)
+        cls._write(base_dir / "wc", "warped.exr", wc)
+
+        if with_all_passes:
+            for name in ["recon", "alb", "dmap", "norm"]:
+                cls._render_pass(name, base_dir / name, resolution, seed)
+        else:
+            (base_dir / "bld").mkdir()
+            with (base_dir / "bld" / "warped.blend").open("w") as fp:
+                json.dump({"resolution": resolution, "seed": seed}, fp)
+
+    @classmethod
+    def _render_pass(cls, name: str, output_dir: Path, resolution: int, seed: int):
+        rng = np.random.RandomState(seed)
+
+        if name in ["recon", "alb"]:
+            data = rng.randint(0, 256, size=(resolution, resolution, 3)).astype("uint8")
+            cls._write(output_dir, "warped0001.png", data)
+        else:
+            data = rng.uniform(0, 1, size=(resolution, resolution, 3)).astype("float32")
+            cls._write(output_dir, "warped0001.exr", data)
+
+    @staticmethod
+    def _shaded_image(tex_file: str, uv: np.ndarray) -> np.ndarray:
+        texture = cv2.imread(tex_file, cv2.IMREAD_COLOR)
+        height, width, _ = texture.shape
+
+        map_y = ((1 - uv[..., 1]) * (height - 1)).astype("float32")
+        map_x = (uv[..., 2] * (width - 1)).astype("float32")
+        image = cv2.remap(texture, map_x, map_y, interpolation=cv2.INTER_LINEAR)
+        image[uv[..., 0] <= 0.5] = 0
+        return image
+
+    @staticmethod
+    def _write(output_dir: Path, file_name: str, data: np.ndarray):
+        output_dir.mkdir(exist_ok=True)
+        assert cv2.imwrite(str(output_dir / file_name), data), f"Could not write {file_name}!"
+
+
+def install_fake_backends(web_latency: float = 0.0, blender_latency: float = 0.0):
+    from .. import generator
+    from ..invoice import web_renderer
+    from ..rendering import blender_renderer
+
+    FakeWebBackend.latency = web_latency
+    FakeBlenderServer.latency = blender_latency
+
+    web_renderer.convert_variants = FakeWebBackend.convert_variants
+    web_renderer.rasterize_pdf = FakeWebBackend.rasterize_pdf
+    generator.BlenderServer = FakeBlenderServer
+    blender_renderer.BlenderServer = FakeBlenderServer
+
+
+def create_fake_assets(assets_dir: Path, source_assets_dir: Path, num_meshes: int = 10, num_environments: int = 10,
+                       num_logos: int = 10, num_products: int = 100, seed: int = 42):
+    # templates and fonts are taken from the project assets, all remaining assets are synthetic
+    check_dir(assets_dir, exist=False)
+    check_dir(source_assets_dir, exist=True)
+    rng = np.random.RandomState(seed)
+
+    assets_dir.mkdir()
+    for name in ["templates", "fonts"]:
+        (assets_dir / name).symlink_to(check_dir(source_assets_dir / name).resolve(), target_is_directory=True)
+    for name in ["chess48.png", "payment_terms.csv"]:
+        shutil.copyfile(str(check_file(source_assets_dir / name)), str(assets_dir / name))
+
+    (assets_dir / "logos").mkdir()
+    for idx in range(num_logos):
+        logo = np.full((64, 192, 3), rng.randint(0, 256, size=3), dtype=np.uint8)
+        cv2.imwrite(str(assets_dir / "logos" / f"logo_{idx}.png"), logo)
+
+    # mesh files are never read by the fake blender server, only their names are parsed
+    (assets_dir / "meshes").mkdir()
+    for idx in range(num_meshes):
+        (assets_dir / "meshes" / f"{idx}_0.obj").write_text("v 0 0 0\nv 1 0 0\nv 0 1 0\nf 1 2 3\n")
+
+    (assets_dir / "environments").mkdir()
+    for idx in range(num_environments):
+        environment = rng.uniform(0, 1, size=(16, 32, 3)).astype("float32")
+        cv2.imwrite(str(assets_dir / "environments" / f"environment_{idx}.hdr"), environment)
+
+    with (assets_dir / "ecommerce_data.csv").open("w") as fp:
+        fp.write("InvoiceNo,StockCode,Description,Quantity,InvoiceDate,UnitPrice,CustomerID,Country\n")
+        for idx in range(num_products):
+            fp.write(f"{500000 + idx},{10000 + idx},PRODUCT NUMBER {idx},{rng.randint(1, 10)},"
+                     f"1/1/2011 10:00,{rng.uniform(0.5, 50):.2f},{12000 + idx},United Kingdom\n")
+
+    return assets_dir
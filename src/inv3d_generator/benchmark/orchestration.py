@@ -0,0 +1,73 @@
+import argparse
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from .fakes import install_fake_backends, create_fake_assets
+from ..generator import Inv3DGenerator
+
+PROJECT_ASSETS_DIR = Path(__file__).parent.parent.parent.parent / "assets"
+
+
+def benchmark_orchestration(num_samples: int = 200, worker_counts: Sequence[int] = (0, 1, 2, 4),
+                            web_latency: float = 0.0, blender_latency: float = 0.0, document_dpi: int = 50,
+                            resolution_rendering: int = 128, resolution_bm: int = 64,
+                            stage_workers: Optional[Dict[str, int]] = None, seed: int = 42,
+                            source_assets_dir: Path = PROJECT_ASSETS_DIR) -> List[Dict]:
+    install_fake_backends(web_latency=web_latency, blender_latency=blender_latency)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        assets_dir = create_fake_assets(Path(tmp_dir) / "assets", source_assets_dir=source_assets_dir, seed=seed)
+
+        for num_workers in worker_counts:
+            args = argparse.Namespace(assets_dir=str(assets_dir), seed=seed, document_dpi=document_dpi,
+                                      resolution_rendering=resolution_rendering, resolution_bm=resolution_bm,
+                                      num_samples=num_samples, output_layout="flat")
+
+            gen = Inv3DGenerator(Path(tmp_dir) / f"out_{num_workers}", resume=False, args=args)
+
+            start_time = time.perf_counter()
+            gen.process_tasks(num_workers=num_workers, stage_workers=stage_workers)
+            wall_time = time.perf_counter() - start_time
+
+            parallelism = max(num_workers, 1) if stage_workers is None else sum(stage_workers.values())
+            results.append(summarize_run(gen, num_workers, parallelism, wall_time))
+
+    # scaling relative to the first measured worker count
+    for result in results:
+        result["scaling_efficiency"] = result["samples_per_minute"] / results[0]["samples_per_minute"] * \
+                                       results[0]["parallelism"] / result["parallelism"]
+        print_result(result)
+
+    return results
+
+
+def summarize_run(gen: Inv3DGenerator, num_workers: int, parallelism: int, wall_time: float) -> Dict:
+    entries = list(gen.journal.entries())
+    num_completed = len(entries)
+
+    # time spent within the stages of completed samples
+    stage_time = sum(entry["timings"][stage]["wall_time"]
+                     for entry in entries
+                     for stage in Inv3DGenerator.STAGES)
+
+    # stage work cannot exceed the wall time of all workers: the remaining capacity is orchestration overhead
+    return {
+        "num_workers": num_workers,
+        "parallelism": parallelism,
+        "num_samples": num_completed,
+        "wall_time": wall_time,
+        "samples_per_minute": 60 * num_completed / wall_time,
+        "stage_time_per_sample": stage_time / max(num_completed, 1),
+        "overhead_per_sample": (wall_time * parallelism - stage_time) / max(num_completed, 1),
+    }
+
+
+def print_result(result: Dict):
+    print(f"workers {result['num_workers']:>3} | {result['num_samples']:>6} samples in {result['wall_time']:8.1f}s | "
+          f"{result['samples_per_minute']:8.1f} samples/min | "
+          f"stages {result['stage_time_per_sample'] * 1000:8.1f}ms, "
+          f"overhead {result['overhead_per_sample'] * 1000:8.1f}ms per sample | "
+          f"scaling efficiency {result['scaling_efficiency']:.2f}")
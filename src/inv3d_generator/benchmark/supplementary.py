@@ -0,0 +1,104 @@
+import concurrent.futures
+import resource
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .surfaces import SURFACES, write_sample
+from ..supplementary.backward_mapping import BackwardMapping
+from ..supplementary.warped_angle import WarpedAngle
+from ..supplementary.warped_curvature import WarpedCurvature
+from ..supplementary.warped_text_mask import WarpedTextMask
+
+GENERATORS = ("backward_mapping", "curvature", "angle", "text_mask")
+BM_GENERATORS = ("backward_mapping", "angle")  # generators depending on resolution_bm
+
+
+def run_generator(generator: str, sample_dir: Path, resolution_bm: int):
+    uv_file = sample_dir / "warped_UV.npz"
+
+    if generator == "backward_mapping":
+        return BackwardMapping.from_uv_file(uv_file=uv_file, resolution_bm=resolution_bm)
+    elif generator == "curvature":
+        return WarpedCurvature.from_source_files(uv_file=uv_file, wc_file=sample_dir / "warped_WC.npz")
+    elif generator == "angle":
+        return WarpedAngle.from_uv_file(uv_file=uv_file, resolution_bm=resolution_bm)
+    elif generator == "text_mask":
+        return WarpedTextMask.from_source_files(uv_file=uv_file, text_only_file=sample_dir / "flat_text_mask.png")
+    else:
+        raise ValueError(f"Unknown generator '{generator}'!")
+
+
+def measure_generator(generator: str, sample_dir: Path, resolution_bm: int, repeats: int) -> Dict:
+    # runs within a fresh process such that the peak rss only covers this generator
+    wall_times = []
+
+    tracemalloc.start()
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        run_generator(generator, sample_dir, resolution_bm)
+        wall_times.append(time.perf_counter() - start_time)
+    _, peak_traced = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "wall_time_mean": float(np.mean(wall_times)),
+        "wall_time_min": float(np.min(wall_times)),
+        "samples_per_second": repeats / float(np.sum(wall_times)),
+        "peak_traced_memory": peak_traced,  # numpy allocations only, torch tensors are not traced
+        "max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+
+
+def run_isolated(fn, *args):
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+        return executor.submit(fn, *args).result()
+
+
+def benchmark_supplementary(surfaces: Sequence[str] = SURFACES,
+                            resolutions_rendering: Sequence[int] = (448, 1024, 1600),
+                            resolutions_bm: Sequence[int] = (128, 512, 1024),
+                            generators: Sequence[str] = GENERATORS,
+                            repeats: int = 3, seed: int = 42,
+                            work_dir: Optional[Path] = None) -> List[Dict]:
+    assert repeats > 0
+    assert all(generator in GENERATORS for generator in generators)
+
+    results = []
+    with tempfile.TemporaryDirectory(dir=None if work_dir is None else str(work_dir)) as tmp_dir:
+        for surface in surfaces:
+            for resolution_rendering in resolutions_rendering:
+                sample_dir = Path(tmp_dir) / f"{surface}_{resolution_rendering}"
+                sample_dir.mkdir()
+                run_isolated(write_sample, sample_dir, surface, resolution_rendering, (1754, 1240), seed)
+
+                for generator in generators:
+                    # generators independent of resolution_bm are measured only once
+                    bm_values = resolutions_bm if generator in BM_GENERATORS else [None]
+
+                    for resolution_bm in bm_values:
+                        result = run_isolated(measure_generator, generator, sample_dir, resolution_bm, repeats)
+
+                        row = {
+                            "generator": generator,
+                            "surface": surface,
+                            "resolution_rendering": resolution_rendering,
+                            "resolution_bm": resolution_bm,
+                            "repeats": repeats,
+                            **result
+                        }
+                        print_result(row)
+                        results.append(row)
+
+    return results
+
+
+def print_result(row: Dict):
+    resolution_bm = "-" if row["resolution_bm"] is None else row["resolution_bm"]
+    print(f"{row['generator']:>16} {row['surface']:>11} {row['resolution_rendering']:>5} {resolution_bm:>5} | "
+          f"{row['wall_time_mean']:8.3f}s {row['samples_per_second']:8.2f} samples/s | "
+          f"traced {row['peak_traced_memory'] / 2 ** 20:8.1f} MB, rss {row['max_rss'] / 2 ** 20:8.1f} MB")
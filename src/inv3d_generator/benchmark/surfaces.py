@@ -0,0 +1,91 @@
+from pathlib import Path
+from typing import Tuple
+
+import cv2
+import numpy as np
+
+from ..formats import save_image, save_npz
+from ..util import check_dir
+
+SURFACES = ("planar", "cylindrical", "crumpled")
+
+
+def create_surface(surface: str, resolution: int, seed: int = 42) -> Tuple[np.ndarray, np.ndarray]:
+    # Creates the UV and WC maps of an analytic document surface as rendered by blender.
+    # UV channels: 0 = mask, 1 = inverted y texture coordinate, 2 = x texture coordinate
+    # WC channels: 3D world coordinates
+    rng = np.random.RandomState(seed)
+
+    # relative pixel positions within the rendered image
+    y, x = np.mgrid[0:1:complex(0, resolution), 0:1:complex(0, resolution)]
+
+    # the page covers the center of the image
+    margin = 0.1
+    py = (y - margin) / (1 - 2 * margin)
+    px = (x - margin) / (1 - 2 * margin)
+
+    if surface == "planar":
+        angle = rng.uniform(-0.2, 0.2)
+        cy, cx = py - 0.5, px - 0.5
+        v = np.cos(angle) * cy - np.sin(angle) * cx + 0.5
+        u = np.sin(angle) * cy + np.cos(angle) * cx + 0.5
+        z = np.zeros_like(u)
+
+    elif surface == "cylindrical":
+        # page bent around a vertical cylinder and seen orthographically from the front
+        max_angle = rng.uniform(0.5, 1.2)
+        s = np.clip((px - 0.5) * 2 * np.sin(max_angle), -1, 1)
+        u = 0.5 + np.arcsin(s) / (2 * max_angle)
+        v = py
+        z = np.cos(np.arcsin(s))
+
+    elif surface == "crumpled":
+        # smooth random displacements small enough to keep the mapping injective
+        u, v, z = px.copy(), py.copy(), np.zeros_like(px)
+        for _ in range(8):
+            fy, fx = rng.uniform(1, 6, size=2)
+            phase_y, phase_x = rng.uniform(0, 2 * np.pi, size=2)
+            amplitude = rng.uniform(0.002, 0.008)
+            arg_y = 2 * np.pi * fy * py + phase_y
+            arg_x = 2 * np.pi * fx * px + phase_x
+            u += amplitude * np.sin(arg_y) * np.sin(arg_x)
+            v += amplitude * np.cos(arg_y) * np.cos(arg_x)
+            z += 10 * amplitude * np.sin(arg_y) * np.cos(arg_x)
+
+    else:
+        raise ValueError(f"Unknown surface '{surface}'!")
+
+    mask = (u >= 0) & (u <= 1) & (v >= 0) & (v <= 1)
+
+    uv = np.stack([mask, 1 - v, u], axis=2).astype("float32")
+    uv[~mask] = 0
+
+    wc = np.stack([x, y, z], axis=2).astype("float32")
+    wc[~mask] = 0
+
+    return uv, wc
+
+
+def create_text_mask(height: int, width: int, seed: int = 42) -> np.ndarray:
+    # black text lines on white background similar to flat_text_mask.png
+    rng = np.random.RandomState(seed)
+    image = np.full((height, width, 3), 255, dtype=np.uint8)
+
+    line_height = max(height // 60, 8)
+    for top in range(2 * line_height, height - 2 * line_height, 2 * line_height):
+        left = int(rng.uniform(0.05, 0.3) * width)
+        text = "".join(rng.choice(list("abcdefghijklmnopqrstuvwxyz0123456789 "), size=rng.randint(10, 60)))
+        cv2.putText(image, text, (left, top), cv2.FONT_HERSHEY_SIMPLEX, line_height / 30, (0, 0, 0), 1)
+
+    return image
+
+
+def write_sample(output_dir: Path, surface: str, resolution: int, document_size: Tuple[int, int] = (1754, 1240),
+                 seed: int = 42):
+    # writes the inputs of the supplementary stage; the default document size is A4 with 150 dpi
+    check_dir(output_dir)
+
+    uv, wc = create_surface(surface, resolution=resolution, seed=seed)
+    save_npz(output_dir / "warped_UV.npz", uv)
+    save_npz(output_dir / "warped_WC.npz", wc)
+    save_image(output_dir / "flat_text_mask.png", create_text_mask(*document_size, seed=seed))
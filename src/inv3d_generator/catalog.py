@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import struct
+import tempfile
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .util import check_dir
+
+
+class AssetCatalog:
+    # Index of all asset files which is stored next to the assets and updated incrementally.
+    # Adding, removing or renaming files changes the modification time of their directory. Only such directories are
+    # listed again; within them, only new files and files with a changed size or modification time are inspected.
+    # Files modified in place within an unchanged directory are not detected: delete the catalog file to rebuild it.
+
+    FILE_NAME = "catalog.sqlite"
+    SUFFIXES = {
+        "templates": (".htm",),
+        "logos": (".png",),
+        "environments": (".hdr", ".exr"),
+        "meshes": (".obj",),
+        "fonts": (".ttf",),
+    }
+    MESH_PATTERN = re.compile(r"^((?P<crop_id>\d+)_)?((?P<mesh_id>\d+)_(?P<augmentation_id>\d+).obj)$")
+    PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+    def __init__(self, assets_dir: Path, file: Optional[Path] = None):
+        self.assets_dir = check_dir(assets_dir).resolve()
+        self.file = self._default_file(self.assets_dir) if file is None else file
+
+        # category directories might be symbolic links, files are reported with resolved category directories
+        self.roots = {category: (self.assets_dir / category).resolve() for category in self.SUFFIXES}
+
+        with closing(self._connect()) as connection, connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS directories (path TEXT PRIMARY KEY, "
+                               "mtime_ns INTEGER NOT NULL, subdirs TEXT NOT NULL)")
+            connection.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, directory TEXT NOT NULL, "
+                               "category TEXT NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, "
+                               "mesh_id INTEGER, width INTEGER, height INTEGER, font_family TEXT)")
+            connection.execute("CREATE INDEX IF NOT EXISTS files_directory ON files (directory)")
+            connection.execute("CREATE INDEX IF NOT EXISTS files_category ON files (category)")
+
+        stats = self.update()
+        print(f"INFO: Asset catalog {self.file}: {stats['scanned']} directories scanned, "
+              f"{stats['reused']} directories unchanged")
+
+    @staticmethod
+    def _default_file(assets_dir: Path) -> Path:
+        if os.access(str(assets_dir), os.W_OK):
+            return assets_dir / AssetCatalog.FILE_NAME
+
+        # read-only assets: keep the catalog in the temporary directory of this machine
+        digest = hashlib.sha1(str(assets_dir).encode("utf-8")).hexdigest()[:16]
+        return Path(tempfile.gettempdir()) / f"inv3d_catalog_{digest}.sqlite"
+
+    def update(self) -> Dict[str, int]:
+        stats = {"scanned": 0, "reused": 0}
+
+        with closing(self._connect()) as connection, connection:
+            known = {path: (mtime_ns, json.loads(subdirs))
+                     for path, mtime_ns, subdirs in connection.execute("SELECT path, mtime_ns, subdirs "
+                                                                       "FROM directories")}
+
+            pending = [category for category in self.SUFFIXES if (self.assets_dir / category).is_dir()]
+            visited = set()
+            while len(pending) > 0:
+                directory = pending.pop()
+                visited.add(directory)
+
+                mtime_ns = os.stat(str(self.assets_dir / directory)).st_mtime_ns
+                if directory in known and known[directory][0] == mtime_ns:
+                    subdirs = known[directory][1]
+                    stats["reused"] += 1
+                else:
+                    subdirs = self._scan_directory(connection, directory, mtime_ns)
+                    stats["scanned"] += 1
+
+                pending.extend(subdirs)
+
+            removed = [(directory,) for directory in known if directory not in visited]
+            connection.executemany("DELETE FROM files WHERE directory = ?", removed)
+            connection.executemany("DELETE FROM directories WHERE path = ?", removed)
+
+        return stats
+
+    def _scan_directory(self, connection: sqlite3.Connection, directory: str, mtime_ns: int) -> List[str]:
+        category = directory.split("/")[0]
+        suffixes = self.SUFFIXES[category]
+
+        known = {path: (size, file_mtime_ns)
+                 for path, size, file_mtime_ns in connection.execute("SELECT path, size, mtime_ns FROM files "
+                                                                     "WHERE directory = ?", (directory,))}
+
+        subdirs = []
+        present = set()
+        rows = []
+        with os.scandir(str(self.assets_dir / directory)) as entries:
+            for entry in entries:
+                path = f"{directory}/{entry.name}"
+
+                if entry.is_dir():
+                    subdirs.append(path)
+                elif entry.is_file() and entry.name.endswith(suffixes):
+                    present.add(path)
+
+                    stat = entry.stat()
+                    if known.get(path) != (stat.st_size, stat.st_mtime_ns):
+                        rows.append((path, directory, category, stat.st_size, stat.st_mtime_ns,
+                                     *self._inspect(category, path)))
+
+        connection.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        connection.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in known if path not in present])
+        connection.execute("INSERT OR REPLACE INTO directories VALUES (?, ?, ?)",
+                           (directory, mtime_ns, json.dumps(sorted(subdirs))))
+
+        return subdirs
+
+    def _inspect(self, category: str, path: str) -> Tuple[Optional[int], Optional[int], Optional[int], Optional[str]]:
+        # returns mesh id, image width, image height and font family
+        parts = path.split("/")
+
+        if category == "meshes":
+            match = self.MESH_PATTERN.match(parts[-1])
+            return None if match is None else int(match.group("mesh_id")), None, None, None
+
+        if category == "fonts":
+            # fonts are stored in one directory per font family
+            return None, None, None, parts[1] if len(parts) == 3 else None
+
+        if path.endswith(".png"):
+            return (None, *self._png_size(self.assets_dir / path), None)
+
+        return None, None, None, None
+
+    @classmethod
+    def _png_size(cls, file: Path) -> Tuple[Optional[int], Optional[int]]:
+        # the size is stored in the IHDR chunk directly after the signature
+        with file.open("rb") as fp:
+            header = fp.read(24)
+
+        if len(header) < 24 or header[:8] != cls.PNG_SIGNATURE or header[12:16] != b"IHDR":
+            return None, None
+
+        return struct.unpack(">II", header[16:24])
+
+    def files(self, category: str, valid_images: bool = False) -> List[Path]:
+        assert category in self.SUFFIXES, f"Unknown asset category '{category}'!"
+
+        query = "SELECT path FROM files WHERE category = ?"
+        if valid_images:
+            query += " AND width > 0 AND height > 0"
+
+        with closing(self._connect()) as connection:
+            return [self._absolute(path) for path, in connection.execute(query + " ORDER BY path", (category,))]
+
+    def meshes(self) -> List[Tuple[Path, Optional[int]]]:
+        # mesh files with their mesh id, the id is None for unknown file name formats
+        with closing(self._connect()) as connection:
+            return [(self._absolute(path), mesh_id)
+                    for path, mesh_id in connection.execute("SELECT path, mesh_id FROM files "
+                                                            "WHERE category = 'meshes' ORDER BY path")]
+
+    def fonts(self) -> Dict[str, List[Path]]:
+        # font files per font family, including families without any font file
+        with closing(self._connect()) as connection:
+            row = connection.execute("SELECT subdirs FROM directories WHERE path = 'fonts'").fetchone()
+            families = {} if row is None else {directory.split("/")[-1]: [] for directory in json.loads(row[0])}
+
+            for path, font_family in connection.execute("SELECT path, font_family FROM files WHERE category = 'fonts' "
+                                                        "AND font_family IS NOT NULL ORDER BY path"):
+                families[font_family].append(self._absolute(path))
+
+        return families
+
+    def _absolute(self, path: str) -> Path:
+        category, relative_path = path.split("/", maxsplit=1)
+        return self.roots[category] / relative_path
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(str(self.file), timeout=60)
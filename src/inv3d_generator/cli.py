@@ -0,0 +1,93 @@
+import argparse
+
+from .autoscaling import AutoscalePolicy
+from .generator import Inv3DGenerator
+from .invoice.rendering.pyhtml2pdf import BrowserPool
+from .quarantine import RetryBudget
+
+
+def add_processing_arguments(parser: argparse.ArgumentParser):
+    # arguments controlling task processing shared by start.py and resume.py
+    parser.add_argument('--num_workers', nargs='?', type=int, default=0,
+                        help='Number of processes working in parallel to generate dataset')
+    parser.add_argument('--max_pending', nargs='?', type=int, default=0,
+                        help='Maximum number of submitted but unfinished tasks (0: twice the number of workers)')
+    parser.add_argument('--verbose', nargs='?', type=bool, default=False,
+                        help='Display detailed information. Only applicable for sequential task generation')
+    parser.add_argument('--combined_render', nargs='?', type=bool, default=False,
+                        help='Render all Blender passes of a sample within a single Blender session')
+    parser.add_argument('--blender_slots', nargs='?', type=int, default=1,
+                        help='Number of Blender renders running concurrently')
+    parser.add_argument('--blender_threads', nargs='?', type=int, default=0,
+                        help='Render threads per Blender slot (0: split all cores evenly between slots)')
+    parser.add_argument('--pipeline', nargs='?', type=bool, default=False,
+                        help='Run invoice creation, rendering and supplementary generation in separate worker pools')
+    parser.add_argument('--invoice_workers', nargs='?', type=int, default=2,
+                        help='Number of processes creating flat invoices. Only applicable for pipelined execution')
+    parser.add_argument('--render_workers', nargs='?', type=int, default=1,
+                        help='Number of processes rendering warped documents. Only applicable for pipelined execution')
+    parser.add_argument('--supplementary_workers', nargs='?', type=int, default=1,
+                        help='Number of processes creating supplementary files. Only applicable for pipelined execution')
+    parser.add_argument('--queue_size', nargs='?', type=int, default=4,
+                        help='Maximum number of samples waiting in front of each stage. '
+                             'Only applicable for pipelined execution')
+    parser.add_argument('--shard_size', nargs='?', type=int, default=0,
+                        help='Pack finished samples into tar shards with the given number of samples (0: disabled)')
+    parser.add_argument('--remove_packed', nargs='?', type=bool, default=False,
+                        help='Remove sample directories after packing them into shards')
+    parser.add_argument('--cooperative', nargs='?', type=bool, default=False,
+                        help='Claim tasks through lease files to share the output directory with other nodes. '
+                             'The manifest is only read, a final run without --cooperative records the completions')
+    parser.add_argument('--lease_timeout', nargs='?', type=int, default=300,
+                        help='Seconds after which leases of crashed nodes are reclaimed. '
+                             'Only applicable for cooperative execution')
+    parser.add_argument('--schedule', nargs='?', type=str, default='random', choices=Inv3DGenerator.SCHEDULES,
+                        help='Task order. "cost" starts the cheapest tasks last and longest first, using a cost model '
+                             'fitted to the recorded timings')
+    parser.add_argument('--tail_fraction', nargs='?', type=float, default=0.2,
+                        help='Fraction of the cheapest tasks run at the end, at most 10000 tasks. Only applicable for '
+                             'the cost schedule')
+    parser.add_argument('--autoscale', nargs='?', type=bool, default=False,
+                        help='Adapt the number of running workers to the cpu and memory load of the host. '
+                             'The given worker counts are used as upper bounds')
+    parser.add_argument('--min_workers', nargs='?', type=int, default=1,
+                        help='Initial and minimum number of workers per pool. Only applicable for autoscaling')
+    parser.add_argument('--target_cpu', nargs='?', type=float, default=0.9,
+                        help='CPU utilization below which workers are added. Only applicable for autoscaling')
+    parser.add_argument('--memory_reserve', nargs='?', type=float, default=0.1,
+                        help='Fraction of the memory kept available, workers are removed below it. '
+                             'Only applicable for autoscaling')
+    parser.add_argument('--autoscale_interval', nargs='?', type=float, default=5.0,
+                        help='Seconds between two scaling decisions. Only applicable for autoscaling')
+    parser.add_argument('--browser_backend', nargs='?', type=str, default='selenium', choices=BrowserPool.BACKENDS,
+                        help='Control Chrome through chromedriver ("selenium") or directly through the DevTools '
+                             'protocol ("cdp", no driver download required)')
+    parser.add_argument('--invoice_attempts', nargs='?', type=int, default=3,
+                        help='Maximum number of attempts to create the flat invoice of a sample')
+    parser.add_argument('--render_attempts', nargs='?', type=int, default=5,
+                        help='Maximum number of attempts to render the warped document of a sample')
+    parser.add_argument('--quarantine_after', nargs='?', type=int, default=3,
+                        help='Number of failures after which an asset is no longer used by later tasks')
+
+
+def process_tasks(gen: Inv3DGenerator, args: argparse.Namespace):
+    stage_workers = {
+        "invoice": args.invoice_workers,
+        "render": args.render_workers,
+        "supplementary": args.supplementary_workers,
+    } if args.pipeline else None
+
+    autoscale = AutoscalePolicy(min_workers=args.min_workers, interval=args.autoscale_interval,
+                                target_cpu=args.target_cpu,
+                                memory_reserve=args.memory_reserve) if args.autoscale else None
+
+    gen.process_tasks(num_workers=args.num_workers, verbose=args.verbose, combined_render=args.combined_render,
+                      blender_slots=args.blender_slots, blender_threads=args.blender_threads,
+                      stage_workers=stage_workers, queue_size=args.queue_size, max_pending=args.max_pending,
+                      shard_size=args.shard_size, remove_packed=args.remove_packed,
+                      cooperative=args.cooperative, lease_timeout=args.lease_timeout,
+                      retry_budget=RetryBudget(invoice_attempts=args.invoice_attempts,
+                                               render_attempts=args.render_attempts,
+                                               quarantine_after=args.quarantine_after),
+                      schedule=args.schedule, tail_fraction=args.tail_fraction, autoscale=autoscale,
+                      browser_backend=args.browser_backend)
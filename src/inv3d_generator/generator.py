@@ -1,39 +1,67 @@
 import argparse
 import concurrent.futures
+import functools
+import gc
+import os
 import random
-import re
 import shutil
+import socket
+import time
 import traceback
-from collections import defaultdict
-from itertools import chain
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from itertools import chain, islice
 from pathlib import Path
 from typing import *
 
 import numpy as np
 import tqdm
 
+from .autoscaling import Autoscaler, AutoscalePolicy, ScaledProcessPool
+from .catalog import AssetCatalog
 from .formats import load_json, save_json
-from .invoice.main import create_invoice
+from .invoice.main import create_invoice, draw_invoice_assets, warm_up_invoice
+from .invoice.rendering.pyhtml2pdf import BrowserPool
+from .journal import CompletionJournal
+from .leases import LeaseManager
+from .manifest import TaskManifest, Task
+from .provenance import SampleProvenance
+from .quarantine import AssetQuarantine, RetryBudget
 from .rendering.blender_server import BlenderServer
 from .rendering.main import render_3d
+from .scheduling import CostModel, schedule_tasks, recorded_wall_times
+from .shards import ShardWriter
 from .supplementary.main import create_supplementary
-from .util import check_dir, list_files, split_items, check_file, remove_common_path, list_dirs, Tee
+from .util import check_dir, split_items, check_file, remove_common_path, Tee, submit_windowed, StageTimer
 
 
 class Inv3DGenerator:
     RATIOS = {"train": 0.7, "val": 0.15, "test": 0.15}
+    STAGES = ("invoice", "render", "supplementary")
+    SUMMARY_SECTIONS = {"invoice": "invoice", "render": "warping", "supplementary": "supplementary"}
+    SCHEDULES = ("random", "cost")
+    MANIFEST_FILE_NAME = "manifest.sqlite"
+    JOURNAL_DIR_NAME = "journal"
+    SHARDS_DIR_NAME = "shards"
+    LEASES_DIR_NAME = "leases"
+    FAILURES_DIR_NAME = "failures"
+    TIMINGS_FILE_NAME = "timings.json"
 
     def __init__(self, output_dir: Path, resume: bool = False, args: Optional[argparse.Namespace] = None):
 
         self.output_dir = output_dir
         self.data_dir = output_dir / "data"
         self.settings_file = output_dir / "settings.json"
+        self.manifest_file = output_dir / self.MANIFEST_FILE_NAME
 
         if resume:
             check_dir(output_dir, exist=True)
             check_dir(self.data_dir, exist=True)
             check_file(self.settings_file, exist=True)
 
+            if not self.manifest_file.is_file():
+                self._migrate_task_files()
+
         else:
             assert args is not None
             check_dir(self.output_dir, exist=False)
@@ -44,6 +72,9 @@ class Inv3DGenerator:
             else:
                 self._create_tasks(args=args)
 
+        self.manifest = TaskManifest(self.manifest_file)
+        self.journal = CompletionJournal(output_dir / self.JOURNAL_DIR_NAME)
+
         Tee(str(output_dir / "log.txt"), "a")
 
     def _create_tasks(self, args: argparse.Namespace):
@@ -53,18 +84,21 @@ class Inv3DGenerator:
         assets_dir = Path(__file__).parent.parent.parent / "assets" if args.assets_dir == "" else Path(args.assets_dir)
         check_dir(assets_dir)
 
-        asset_dirs = {asset_dir.name: asset_dir.resolve()
-                      for asset_dir in assets_dir.glob("*")
-                      if asset_dir.is_dir()}
+        catalog = AssetCatalog(assets_dir)
 
-        template_files = list_files(asset_dirs["templates"], suffixes=[".htm"], recursive=True)
-        logo_files = list_files(asset_dirs["logos"], suffixes=[".png"], recursive=True)
-        env_files = list_files(asset_dirs["environments"], suffixes=[".hdr", ".exr"], recursive=True)
+        template_files = catalog.files("templates")
+        logo_files = catalog.files("logos")
+        env_files = catalog.files("environments")
 
         assert len(template_files) > 0, "Template files not found!"
         assert len(logo_files) > 0, "Logos not found!"
         assert len(env_files) > 0, "Environment files (.hdr or .exr) not found!"
 
+        # logos without a valid PNG header remain candidates, such that a seed yields the same samples as before
+        num_invalid_logos = len(logo_files) - len(catalog.files("logos", valid_images=True))
+        if num_invalid_logos > 0:
+            print(f"WARNING: Found {num_invalid_logos} logos without a valid PNG header!")
+
         print("INFO: Number of available templates: {}".format(len(template_files)))
         print("INFO: Number of available logos: {}".format(len(logo_files)))
         print("INFO: Number of available environments: {}".format(len(env_files)))
@@ -72,8 +106,8 @@ class Inv3DGenerator:
         template_files = split_items(items=template_files, ratios=self.RATIOS)
         logo_files = split_items(items=logo_files, ratios=self.RATIOS)
         env_files = split_items(items=env_files, ratios=self.RATIOS)
-        obj_files = self._gather_meshes(asset_dirs["meshes"])
-        font_files = self._gather_fonts(asset_dirs["fonts"])
+        obj_files = self._gather_meshes(catalog)
+        font_files = self._gather_fonts(catalog)
 
         settings = {
             split: {
@@ -91,9 +125,10 @@ class Inv3DGenerator:
             "resolution_rendering": args.resolution_rendering,
             "resolution_bm": args.resolution_bm,
             "assets_dir": str(assets_dir.resolve()),
+            "output_layout": args.output_layout,
         }
 
-        self._create_task_files(settings=settings, num_samples=args.num_samples)
+        self._create_manifest(settings=settings, num_samples=args.num_samples)
 
     def _create_tasks_from_settings_file(self, args: argparse.Namespace):
         settings_file = check_file(args.settings_file, suffix=".json", exist=True)
@@ -102,12 +137,12 @@ class Inv3DGenerator:
         random.seed(settings["base"]["seed"])
         np.random.seed(random.getrandbits(32))
 
-        suffixes = {
-            "env_files": [".hdr", ".exr"],
-            "font_files": ".ttf",
-            "logo_files": ".png",
-            "obj_files": ".obj",
-            "template_files": ".htm"
+        resource_types = {
+            "env_files": ("environments", [".hdr", ".exr"]),
+            "font_files": ("fonts", ".ttf"),
+            "logo_files": ("logos", ".png"),
+            "obj_files": ("meshes", ".obj"),
+            "template_files": ("templates", ".htm")
         }
 
         # validate settings
@@ -117,48 +152,65 @@ class Inv3DGenerator:
         assert isinstance(settings["base"]["resolution_rendering"], int)
         assert isinstance(settings["base"]["seed"], int)
 
+        settings["base"].setdefault("output_layout", args.output_layout)
+        assert settings["base"]["output_layout"] in TaskManifest.OUTPUT_LAYOUTS
+
+        # entries outside of the catalog (e.g. relative paths) are checked individually
+        catalog = AssetCatalog(Path(settings["base"]["assets_dir"]))
+        known_files = {category: set(map(str, catalog.files(category))) for category, _ in resource_types.values()}
+
         for split in ["train", "test", "val"]:
-            for resource_type, suffix in suffixes.items():
+            for resource_type, (category, suffix) in resource_types.items():
                 for entry in settings[split][resource_type]:
-                    check_file(entry, suffix=suffix, exist=True)
+                    if entry not in known_files[category]:
+                        check_file(entry, suffix=suffix, exist=True)
 
-        self._create_task_files(settings=settings, num_samples=args.num_samples)
+        self._create_manifest(settings=settings, num_samples=args.num_samples)
 
-    def _create_task_files(self, settings: Dict, num_samples: int):
+    def _create_manifest(self, settings: Dict, num_samples: int):
         save_json(self.settings_file, settings)
 
         all_tasks = split_items(items=list(range(num_samples)), ratios=self.RATIOS)
         fill_digits = len(str(num_samples))
 
-        with tqdm.tqdm(total=num_samples, desc="Creating tasks", smoothing=0) as progress_bar:
-            for split, tasks in all_tasks.items():
-                split_dir = self.data_dir / split
-                split_dir.mkdir()
+        def create_tasks():
+            with tqdm.tqdm(total=num_samples, desc="Creating tasks", smoothing=0) as progress_bar:
+                for split, tasks in all_tasks.items():
+                    split_dir = self.data_dir / split
+                    split_dir.mkdir()
+
+                    for idx in tasks:
+                        seed = random.getrandbits(32)
+
+                        # randomly switch to no background to ease learning process
+                        env_disabled = split in ["train", "val"] and random.random() <= 0.3
+
+                        yield Task(name=str(idx).zfill(fill_digits), split=split, seed=seed,
+                                   env_disabled=env_disabled)
+
+                        progress_bar.update(1)
+
+        TaskManifest.create(self.manifest_file, settings=settings, tasks=create_tasks())
 
-                for idx in tasks:
-                    task_name = str(idx).zfill(fill_digits)
-                    task_file = split_dir / f"task_{task_name}.json"
-                    task_settings = {
-                        **settings[split],
-                        **settings["base"],
-                        "seed": random.getrandbits(32),
-                        "name": task_name
-                    }
+    def _migrate_task_files(self):
+        # convert the task files of datasets created by earlier versions
+        task_files = list(self.data_dir.rglob("task_*.json"))
+        print(f"INFO: Migrating {len(task_files)} task files to {self.manifest_file.name}")
 
-                    # randomly switch to no background to ease learning process
-                    if split in ["train", "val"] and random.random() <= 0.3:
-                        task_settings["env_files"] = None
+        tasks = []
+        for task_file in task_files:
+            task_settings = load_json(task_file)
+            tasks.append(Task(name=str(task_settings["name"]), split=task_file.parent.name,
+                              seed=task_settings["seed"], env_disabled=task_settings["env_files"] is None))
 
-                    save_json(task_file, task_settings)
+        TaskManifest.create(self.manifest_file, settings=load_json(self.settings_file), tasks=tasks)
 
-                    progress_bar.update(1)
+        for task_file in task_files:
+            task_file.unlink()
 
     @classmethod
-    def _gather_fonts(cls, fonts_base_dir: Path, max_styles: int = 5) -> Dict[str, List[Path]]:
-        all_fonts = {
-            font_dir.name: list_files(font_dir, suffixes=[".ttf"])
-            for font_dir in list_dirs(fonts_base_dir)
-        }
+    def _gather_fonts(cls, catalog: AssetCatalog, max_styles: int = 5) -> Dict[str, List[Path]]:
+        all_fonts = catalog.fonts()
 
         # check if font files were found
         for font_name, font_files in all_fonts.items():
@@ -185,15 +237,10 @@ class Inv3DGenerator:
         return font_split
 
     @classmethod
-    def _gather_meshes(cls, mesh_base_dir: Path) -> Dict[str, List[Path]]:
-        pattern = r"^((?P<crop_id>\d+)_)?((?P<mesh_id>\d+)_(?P<augmentation_id>\d+).obj)$"
-
+    def _gather_meshes(cls, catalog: AssetCatalog) -> Dict[str, List[Path]]:
         all_meshes = defaultdict(list)
-        for mesh_file in list_files(mesh_base_dir, suffixes=[".obj"], recursive=True):
-            res = re.match(pattern, mesh_file.name)
-            assert res is not None, f"Mesh file {mesh_file} has an unknown format!"
-
-            mesh_id = int(res.groupdict()["mesh_id"])
+        for mesh_file, mesh_id in catalog.meshes():
+            assert mesh_id is not None, f"Mesh file {mesh_file} has an unknown format!"
             all_meshes[mesh_id].append(mesh_file)
 
         if len(all_meshes) < 10:
@@ -213,100 +260,730 @@ class Inv3DGenerator:
 
         return mesh_split
 
-    def process_tasks(self, num_workers: int = 0, verbose: bool = False):
-        task_files = list(self.data_dir.rglob("task_*.json"))
-        print(f"Found {len(task_files)} tasks to process!")
-
-        random.shuffle(task_files)
+    def process_tasks(self, num_workers: int = 0, verbose: bool = False, combined_render: bool = False,
+                      blender_slots: int = 1, blender_threads: int = 0, stage_workers: Optional[Dict[str, int]] = None,
+                      queue_size: int = 4, max_pending: int = 0, shard_size: int = 0, remove_packed: bool = False,
+                      cooperative: bool = False, lease_timeout: float = 300,
+                      retry_budget: RetryBudget = RetryBudget(), schedule: str = "random", tail_fraction: float = 0.2,
+                      autoscale: Optional[AutoscalePolicy] = None, browser_backend: str = "selenium"):
+        assert schedule in self.SCHEDULES, f"Unknown schedule '{schedule}'!"
+        assert browser_backend in BrowserPool.BACKENDS, f"Unknown browser backend '{browser_backend}'!"
+
+        # SQLite locking is unreliable on network file systems: cooperating nodes only read the manifest, their
+        # completions are kept in the journal and transferred by the next run without --cooperative
+        if cooperative:
+            assert self.manifest.has_ranks(), "Manifest of an earlier version! Resume once without --cooperative first"
+        else:
+            self.sync_journal()
+        self.report_progress(cooperative)
+
+        shard_writers = None
+        if shard_size > 0:
+            # cooperating nodes write separate shards
+            prefix = f"shard-{self._node_name()}" if cooperative else "shard"
+            shard_writers = {split: ShardWriter(self.output_dir / self.SHARDS_DIR_NAME / split, shard_size, prefix,
+                                                remove_packed=remove_packed)
+                             for split in self.RATIOS}
+
+            # pack samples completed by previous runs
+            if not cooperative:
+                self._pack_samples(shard_writers, self.manifest.done_tasks())
+
+        leases = None
+        if cooperative:
+            leases = LeaseManager(self.output_dir / self.LEASES_DIR_NAME, timeout=lease_timeout)
+            leases.start()
+
+        def on_finished(task: Task, success: bool):
+            if leases is not None:
+                if success:
+                    leases.complete(task.name)
+                else:
+                    leases.release(task.name)
+
+            if success and shard_writers is not None:
+                self._pack_samples(shard_writers, [task])
+
+        num_tasks = self.manifest.num_tasks(TaskManifest.STATUS_PENDING)
+        print(f"Found {num_tasks} tasks to process!")
+
+        # tasks are streamed from the manifest in random order, every node starts at its own position
+        start_rank = 0 if leases is None else random.Random().getrandbits(TaskManifest.RANK_BITS)
+        all_tasks = self.manifest.stream_pending_tasks(start_rank)
+
+        if schedule == "cost":
+            all_tasks = self._schedule_by_cost(all_tasks, num_tasks, tail_fraction)
+
+        if leases is None:
+            tasks = all_tasks
+        else:
+            # tasks are claimed only right before they are started
+            tasks = (task for task in all_tasks if leases.claim(task.name))
+
+        # forked workers share the caches of the main process copy-on-write; exclude them from garbage collection,
+        # which would otherwise touch and thereby copy their memory pages
+        self._init_worker(self.manifest_file, browser_backend)
+        gc.freeze()
+
+        blender_server = BlenderServer(num_slots=blender_slots, threads_per_slot=blender_threads)
+
+        try:
+            if stage_workers is not None:
+                self._process_tasks_pipelined(tasks=tasks, num_tasks=num_tasks, stage_workers=stage_workers,
+                                              queue_size=queue_size, verbose=verbose,
+                                              combined_render=combined_render, retry_budget=retry_budget,
+                                              on_finished=on_finished, autoscale=autoscale,
+                                              browser_backend=browser_backend)
+            elif num_workers > 0:
+                self._process_tasks_parallel(tasks=tasks, num_tasks=num_tasks, num_workers=num_workers,
+                                             max_pending=max_pending, verbose=verbose,
+                                             combined_render=combined_render, retry_budget=retry_budget,
+                                             on_finished=on_finished, autoscale=autoscale,
+                                             browser_backend=browser_backend)
+            else:
+                self._process_tasks_sequentially(tasks=tasks, verbose=verbose, combined_render=combined_render,
+                                                 retry_budget=retry_budget, on_finished=on_finished)
+        finally:
+            blender_server.stop()
+            gc.unfreeze()
+
+            if leases is not None:
+                leases.stop()
+
+            # completes the open shards such that their samples are not packed again (and removed if requested)
+            if shard_writers is not None:
+                for shard_writer in shard_writers.values():
+                    shard_writer.close()
+
+        if not cooperative:
+            self.sync_journal()
+        self.report_progress(cooperative)
+        self.report_failures(retry_budget.quarantine_after)
+        self.report_timings()
+
+    def _schedule_by_cost(self, tasks: Iterable[Task], num_tasks: int, tail_fraction: float) -> Iterator[Task]:
+        def features(task: Task) -> np.ndarray:
+            return CostModel.task_features(task, self.manifest.task_settings(task))
+
+        # the model is fitted to a bounded (random by rank) sample of the completed tasks
+        wall_times = recorded_wall_times(self.journal.entries(), self.STAGES)
+        done_tasks = (task for task in self.manifest.stream_done_tasks() if task.name in wall_times)
+        model = CostModel.fit(features={task.name: features(task)
+                                        for task in islice(done_tasks, CostModel.MAX_SAMPLES)},
+                              wall_times=wall_times)
+        print(f"INFO: Scheduling tasks with {model}")
+
+        return schedule_tasks(tasks, lambda task: model.predict(features(task)), num_tasks,
+                              tail_fraction=tail_fraction)
 
-        blender_server = BlenderServer()
+    @staticmethod
+    def _init_worker(manifest_file: Path, browser_backend: str = "selenium"):
+        # loads the read-only assets once per process instead of once per sample
+        BrowserPool.configure(browser_backend)
+        for split in Inv3DGenerator.RATIOS:
+            settings = TaskManifest.split_settings(str(manifest_file), split)
+            assets_dir = Path(settings["assets_dir"])
+            warm_up_invoice(assets_dir, [assets_dir / template_file for template_file in settings["template_files"]])
 
-        if num_workers > 0:
-            self._process_tasks_parallel(task_files=task_files, num_workers=num_workers, verbose=verbose)
-        else:
-            self._process_tasks_sequentially(task_files=task_files, verbose=verbose)
+    @staticmethod
+    def _node_name() -> str:
+        return f"{socket.gethostname()}-{os.getpid()}"
+
+    def _pack_samples(self, shard_writers: Dict[str, ShardWriter], tasks: Iterable[Task]):
+        layout = self.manifest.output_layout()
+
+        for task in tasks:
+            sample_dir = task.sample_dir(self.data_dir, layout)
+            if task.name not in shard_writers[task.split].packed_samples and not sample_dir.is_dir():
+                print(f"WARNING: Sample {task.name} is neither packed nor available as directory!")
+                continue
+            shard_writers[task.split].add(task.name, sample_dir)
+
+    def sync_journal(self):
+        # transfer all completions recorded by the workers into the manifest, the only place writing it
+        self.manifest.add_missing_ranks()
+        self.manifest.mark_done(self.journal.completed())
+
+    def report_timings(self):
+        # aggregate the timings of all completed samples
+        timings = defaultdict(lambda: defaultdict(list))
+        for entry in self.journal.entries():
+            for name, values in entry.get("timings", {}).items():
+                for key, value in values.items():
+                    timings[name][key].append(value)
+
+        def summarize(values: List[float]) -> Dict[str, float]:
+            return {
+                "total": float(np.sum(values)),
+                "mean": float(np.mean(values)),
+                "p50": float(np.percentile(values, 50)),
+                "p95": float(np.percentile(values, 95)),
+                "max": float(np.max(values)),
+            }
 
-        blender_server.stop()
+        report = {
+            name: {
+                "samples": len(values["wall_time"]),
+                "wall_time": summarize(values["wall_time"]),
+                "cpu_time": summarize(values["cpu_time"]),
+                "external_cpu_time": summarize(values["external_cpu_time"] or [0.0]),  # missing in older journals
+                "max_rss": int(np.max(values["max_rss"])),
+            }
+            for name, values in sorted(timings.items())
+        }
 
-    def _process_tasks_parallel(self, task_files: List[Path], num_workers: int, verbose: bool = False):
-        print("Starting parallel execution with {} workers!".format(num_workers))
+        save_json(self.output_dir / self.TIMINGS_FILE_NAME, report, exist=None)
+
+        for stage in self.STAGES:
+            if stage in report:
+                wall_time = report[stage]["wall_time"]
+                print(f"TIMING {stage}: mean {wall_time['mean']:.2f}s, p95 {wall_time['p95']:.2f}s")
+
+    def report_failures(self, quarantine_after: int = RetryBudget.quarantine_after):
+        quarantine = AssetQuarantine(self.output_dir / self.FAILURES_DIR_NAME, max_failures=quarantine_after)
+
+        wasted_time = defaultdict(float)
+        for entry in quarantine.entries():
+            wasted_time[entry["stage"]] += entry["wall_time"]
+
+        for stage, seconds in wasted_time.items():
+            print(f"FAILURES {stage}: {seconds:.1f}s spent on failed attempts")
+
+        for asset, details in sorted(quarantine.report().items()):
+            if details["quarantined"]:
+                print(f"QUARANTINED {details['kind']} {asset}: {details['failures']} failures in "
+                      f"{details['tasks']} tasks, {details['wasted_time']:.1f}s wasted")
+
+    def report_progress(self, cooperative: bool = False):
+        progress = self.manifest.progress()
+        for split in self.RATIOS:
+            counts = progress.get(split, {})
+            done = counts.get(TaskManifest.STATUS_DONE, 0)
+            total = sum(counts.values())
+            print(f"PROGRESS {split}: {done}/{total} samples completed")
+
+        if cooperative:
+            print(f"INFO: {len(set(self.journal.completed()))} samples journaled in total, the manifest is updated "
+                  f"by the next run without --cooperative")
+
+    def _process_tasks_parallel(self, tasks: Iterable[Task], num_tasks: int, num_workers: int,
+                                max_pending: int = 0, verbose: bool = False, combined_render: bool = False,
+                                retry_budget: RetryBudget = RetryBudget(),
+                                on_finished: Optional[Callable[[Task, bool], None]] = None,
+                                autoscale: Optional[AutoscalePolicy] = None, browser_backend: str = "selenium"):
+        max_pending = 2 * num_workers if max_pending <= 0 else max_pending
+
+        autoscaler = None
+        if autoscale is not None:
+            # num_workers is the upper bound, the pool is resized to the limit and twice as many tasks are submitted
+            def pressure(key: str) -> float:
+                return (executor.num_outstanding() - autoscaler.limit(key)) / autoscaler.limit(key)
+
+            autoscaler = Autoscaler(bounds={"workers": (min(autoscale.min_workers, num_workers), num_workers)},
+                                    pressure=pressure, policy=autoscale)
+
+            def max_pending() -> int:
+                return 2 * autoscaler.limit("workers")
+
+            executor = ScaledProcessPool(size=functools.partial(autoscaler.limit, "workers"),
+                                         initializer=self._init_worker, initargs=(self.manifest_file, browser_backend))
+            print("Starting parallel execution with up to {} autoscaled workers!".format(num_workers))
+        else:
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=num_workers, initializer=self._init_worker,
+                                                              initargs=(self.manifest_file, browser_backend))
+            print("Starting parallel execution with {} workers and up to {} pending tasks!".format(num_workers,
+                                                                                                   max_pending))
 
-        with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
-            futures = [executor.submit(self.process_task, task_file, verbose) for task_file in task_files]
+        with executor:
+            results = submit_windowed(executor, self.process_task, tasks, max_pending, self.output_dir, verbose,
+                                      combined_render, retry_budget,
+                                      poll_interval=None if autoscale is None else autoscale.interval)
 
-            print("Awaiting completion!".format(num_workers))
+            if autoscaler is not None:
+                autoscaler.start()
 
             try:
-                with tqdm.tqdm(desc="Creating dataset", total=len(futures), smoothing=0) as progress_bar:
-                    for f in concurrent.futures.as_completed(futures):
+                with tqdm.tqdm(desc="Creating dataset", total=num_tasks, smoothing=0) as progress_bar:
+                    for task, f in results:
                         try:
                             f.result()
+                            success = True
                         except Exception:
                             print("EXCEPTION: ", traceback.format_exc())
+                            success = False
+
+                        if on_finished is not None:
+                            on_finished(task, success)
                         progress_bar.update(1)
             except KeyboardInterrupt:
+                results.close()  # cancels all tasks which did not start yet
                 executor.shutdown(wait=False)
                 exit(-1)
+            finally:
+                if autoscaler is not None:
+                    autoscaler.stop()
+
+    def _process_tasks_pipelined(self, tasks: Iterable[Task], num_tasks: int, stage_workers: Dict[str, int],
+                                 queue_size: int, verbose: bool = False, combined_render: bool = False,
+                                 retry_budget: RetryBudget = RetryBudget(),
+                                 on_finished: Optional[Callable[[Task, bool], None]] = None,
+                                 autoscale: Optional[AutoscalePolicy] = None, browser_backend: str = "selenium"):
+        assert set(stage_workers.keys()) == set(self.STAGES), f"Worker counts required for stages {self.STAGES}"
+        assert all(num_workers > 0 for num_workers in stage_workers.values())
+        assert queue_size >= 0
+
+        if autoscale is None:
+            print("Starting pipelined execution with workers {}!".format(stage_workers))
+        else:
+            print("Starting pipelined execution with up to {} autoscaled workers!".format(stage_workers))
+
+        next_stages = dict(zip(self.STAGES, self.STAGES[1:]))
+
+        remaining_tasks = iter(tasks)
+        tasks_exhausted = False
+        queues = {stage: deque() for stage in self.STAGES}  # task states waiting for the given stage
+        running = {}  # future -> (stage, task)
+        num_running = {stage: 0 for stage in self.STAGES}
+
+        autoscaler = None
+        stage_limit = stage_workers.__getitem__
+        if autoscale is not None:
+            # the given worker counts are the upper bounds
+            def pressure(stage: str) -> float:
+                if stage == self.STAGES[0]:
+                    # the first stage is the bottleneck if the second stage runs out of work
+                    return float(not tasks_exhausted and len(queues[self.STAGES[1]]) == 0)
+                return len(queues[stage]) / autoscaler.limit(stage)
+
+            autoscaler = Autoscaler(bounds={stage: (min(autoscale.min_workers, num_workers), num_workers)
+                                            for stage, num_workers in stage_workers.items()},
+                                    pressure=pressure, policy=autoscale)
+            stage_limit = autoscaler.limit
+
+        # autoscaled pools are resized to the limit of their stage such that removed workers free their memory
+        executors = {stage: concurrent.futures.ProcessPoolExecutor(max_workers=stage_workers[stage],
+                                                                   initializer=self._init_worker,
+                                                                   initargs=(self.manifest_file, browser_backend))
+                     if autoscaler is None else
+                     ScaledProcessPool(size=functools.partial(stage_limit, stage), initializer=self._init_worker,
+                                       initargs=(self.manifest_file, browser_backend))
+                     for stage in self.STAGES}
+
+        def has_capacity(stage: str) -> bool:
+            if num_running[stage] >= stage_limit(stage):
+                return False
+
+            # bound the number of finished but unprocessed states in front of the next stage
+            next_stage = next_stages.get(stage)
+            return next_stage is None or num_running[stage] + len(queues[next_stage]) < stage_limit(stage) + queue_size
+
+        def submit(stage: str, state: Dict):
+            future = executors[stage].submit(self._run_stage, stage, state, verbose, combined_render)
+            running[future] = (stage, state["task"])
+            num_running[stage] += 1
+
+        if autoscaler is not None:
+            autoscaler.start()
+
+        try:
+            with tqdm.tqdm(desc="Creating dataset", total=num_tasks, smoothing=0) as progress_bar:
+                while True:
+                    # later stages first to drain the pipeline
+                    for stage in reversed(self.STAGES):
+                        while len(queues[stage]) > 0 and has_capacity(stage):
+                            submit(stage, queues[stage].popleft())
+
+                    first_stage = self.STAGES[0]
+                    while not tasks_exhausted and has_capacity(first_stage):
+                        task = next(remaining_tasks, None)
+                        if task is None:
+                            tasks_exhausted = True
+                            break
+                        submit(first_stage, self._prepare_task(task, self.output_dir, retry_budget))
+
+                    if len(running) == 0:
+                        break
+
+                    # changed worker limits are applied at the latest after one autoscaling interval
+                    done, _ = concurrent.futures.wait(running.keys(),
+                                                      timeout=None if autoscale is None else autoscale.interval,
+                                                      return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        stage, task = running.pop(future)
+                        num_running[stage] -= 1
+
+                        try:
+                            state = future.result()
+                        except Exception:
+                            print("EXCEPTION: ", traceback.format_exc())
+                            if on_finished is not None:
+                                on_finished(task, False)
+                            progress_bar.update(1)
+                            continue
+
+                        if stage in next_stages:
+                            queues[next_stages[stage]].append(state)
+                        else:
+                            if on_finished is not None:
+                                on_finished(task, True)
+                            progress_bar.update(1)
+        except KeyboardInterrupt:
+            for executor in executors.values():
+                executor.shutdown(wait=False)
+            exit(-1)
+        finally:
+            if autoscaler is not None:
+                autoscaler.stop()
+
+        for executor in executors.values():
+            executor.shutdown()
 
-    def _process_tasks_sequentially(self, task_files: List[Path], verbose: bool = False):
+    def _process_tasks_sequentially(self, tasks: Iterable[Task], verbose: bool = False,
+                                    combined_render: bool = False, retry_budget: RetryBudget = RetryBudget(),
+                                    on_finished: Optional[Callable[[Task, bool], None]] = None):
         print("Starting sequential dataset generation!")
-        for task_file in tqdm.tqdm(task_files, desc="Creating dataset", smoothing=0):
-            self.process_task(task_file, verbose=verbose)
+        for task in tqdm.tqdm(tasks, desc="Creating dataset", smoothing=0):
+            try:
+                self.process_task(task, self.output_dir, verbose=verbose, combined_render=combined_render,
+                                  retry_budget=retry_budget)
+            except Exception:
+                if on_finished is not None:
+                    on_finished(task, False)
+                raise
+
+            if on_finished is not None:
+                on_finished(task, True)
+
+    def regenerate(self, num_workers: int = 0, from_stage: str = STAGES[0], force: bool = False,
+                   verify: bool = False, settings: Optional[Dict] = None, max_pending: int = 0,
+                   verbose: bool = False, combined_render: bool = False, blender_slots: int = 1,
+                   blender_threads: int = 0, retry_budget: RetryBudget = RetryBudget(),
+                   browser_backend: str = "selenium"):
+        assert from_stage in self.STAGES, f"Unknown stage '{from_stage}'!"
+        assert browser_backend in BrowserPool.BACKENDS, f"Unknown browser backend '{browser_backend}'!"
+
+        if settings is not None and len(settings) > 0:
+            self.manifest.update_base_settings(settings)
+
+            all_settings = load_json(self.settings_file)
+            all_settings["base"].update(settings)
+            save_json(self.settings_file, all_settings, exist=True)
+
+        self.sync_journal()
+        tasks = self.manifest.done_tasks()
+        print(f"Checking {len(tasks)} completed samples for stale stages starting at stage '{from_stage}'!")
+
+        if (self.output_dir / self.SHARDS_DIR_NAME).is_dir():
+            print("WARNING: Regenerated samples are not packed into the existing shards again!")
+
+        self._init_worker(self.manifest_file, browser_backend)
+        gc.freeze()
+
+        blender_server = BlenderServer(num_slots=blender_slots, threads_per_slot=blender_threads)
+        counts = defaultdict(int)
+
+        def on_result(task: Task, get_stages: Callable[[], List[str]]):
+            try:
+                stages = get_stages()
+                counts[stages[0] if len(stages) > 0 else "up to date"] += 1
+            except Exception:
+                print(f"EXCEPTION in sample {task.name}: ", traceback.format_exc())
+                counts["failed"] += 1
+
+        args = (self.output_dir, from_stage, force, verify, verbose, combined_render, retry_budget)
+
+        try:
+            with tqdm.tqdm(desc="Regenerating dataset", total=len(tasks), smoothing=0) as progress_bar:
+                if num_workers > 0:
+                    max_pending = 2 * num_workers if max_pending <= 0 else max_pending
+                    with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers,
+                                                                initializer=self._init_worker,
+                                                                initargs=(self.manifest_file,
+                                                                          browser_backend)) as executor:
+                        for task, f in submit_windowed(executor, self.regenerate_task, tasks, max_pending, *args):
+                            on_result(task, f.result)
+                            progress_bar.update(1)
+                else:
+                    for task in tasks:
+                        on_result(task, lambda: self.regenerate_task(task, *args))
+                        progress_bar.update(1)
+        finally:
+            blender_server.stop()
+            gc.unfreeze()
+
+        for stage in self.STAGES:
+            print(f"REGENERATED from stage {stage}: {counts[stage]} samples")
+        print(f"REGENERATED up to date: {counts['up to date']} samples, failed: {counts['failed']} samples")
+
+    @staticmethod
+    def regenerate_task(task: Task, output_dir: Path, from_stage: str, force: bool = False, verify: bool = False,
+                        verbose: bool = False, combined_render: bool = False,
+                        retry_budget: RetryBudget = RetryBudget()) -> List[str]:
+        # reruns the stale stages of a completed sample, returns the stages which were run
+        manifest = TaskManifest(output_dir / Inv3DGenerator.MANIFEST_FILE_NAME)
+        settings = manifest.task_settings(task)
+        sample_dir = task.sample_dir(output_dir / "data", manifest.output_layout())
+
+        Inv3DGenerator._restore_previous(sample_dir)  # regeneration of an earlier run was interrupted
+
+        if not sample_dir.is_dir():
+            print(f"WARNING: Sample directory of task {task.name} does not exist! Skipping it!")
+            return []
+
+        stages = Inv3DGenerator.STAGES[Inv3DGenerator.STAGES.index(from_stage):]
+        if not force:
+            stages = SampleProvenance.stale_stages(sample_dir, settings, stages, verify=verify)
+
+        if len(stages) == 0:
+            return []
+
+        state = None
+        if stages[0] != Inv3DGenerator.STAGES[0]:
+            state = Inv3DGenerator._prepare_regeneration(task, output_dir, stages, retry_budget)
+
+        with Inv3DGenerator._keep_previous(sample_dir, stages):
+            if state is None:
+                # a new invoice requires the whole sample to be created again
+                state = Inv3DGenerator._prepare_task(task, output_dir, retry_budget)
+                state["journal"] = False
+
+            for stage in stages:
+                state = Inv3DGenerator._run_stage(stage, state, verbose=verbose, combined_render=combined_render)
+
+        return list(stages)
 
     @staticmethod
-    def process_task(task_file: Path, verbose: bool = False):
-        check_file(task_file, suffix=".json")
+    def _previous_dir(sample_dir: Path) -> Path:
+        return sample_dir.with_name(f".{sample_dir.name}.previous")
 
-        settings = load_json(task_file)
+    @staticmethod
+    @contextmanager
+    def _keep_previous(sample_dir: Path, stages: Sequence[str]):
+        # the files replaced by the given stages are kept until all stages finished and restored if one of them fails
+        previous_dir = Inv3DGenerator._previous_dir(sample_dir)
 
-        sample_dir = task_file.parent / str(settings["name"])
-        assets_dir = Path(settings["assets_dir"])
+        if stages[0] == Inv3DGenerator.STAGES[0]:
+            sample_dir.rename(previous_dir)
+        else:
+            previous_dir.mkdir()
+            for name in chain(*(SampleProvenance.STAGE_OUTPUTS[stage] for stage in stages),
+                              [SampleProvenance.SUMMARY_FILE_NAME]):
+                if (sample_dir / name).is_file():
+                    (sample_dir / name).rename(previous_dir / name)
+            if (sample_dir / SampleProvenance.FILE_NAME).is_file():
+                shutil.copy2(sample_dir / SampleProvenance.FILE_NAME, previous_dir / SampleProvenance.FILE_NAME)
+
+        save_json(previous_dir / "stages.json", list(stages), exist=None)
+
+        try:
+            yield
+        except BaseException:
+            Inv3DGenerator._restore_previous(sample_dir)
+            raise
+
+        shutil.rmtree(previous_dir)
+
+    @staticmethod
+    def _restore_previous(sample_dir: Path):
+        previous_dir = Inv3DGenerator._previous_dir(sample_dir)
+        if not previous_dir.is_dir():
+            return
+
+        stages_file = previous_dir / "stages.json"
+        stages = load_json(stages_file)
+        stages_file.unlink()
+
+        if stages[0] == Inv3DGenerator.STAGES[0]:
+            if sample_dir.is_dir():
+                shutil.rmtree(sample_dir)
+            previous_dir.rename(sample_dir)
+        else:
+            SampleProvenance.remove_outputs(sample_dir, stages)
+            for file in previous_dir.iterdir():
+                file.replace(sample_dir / file.name)
+            previous_dir.rmdir()
+
+        print(f"WARNING: Restored sample {sample_dir.name} after failed regeneration of stages {stages}")
+
+    @staticmethod
+    def process_task(task: Task, output_dir: Path, verbose: bool = False, combined_render: bool = False,
+                     retry_budget: RetryBudget = RetryBudget()):
+        state = Inv3DGenerator._prepare_task(task, output_dir, retry_budget)
+
+        for stage in Inv3DGenerator.STAGES:
+            state = Inv3DGenerator._run_stage(stage, state, verbose=verbose, combined_render=combined_render)
+
+    @staticmethod
+    def _prepare_task(task: Task, output_dir: Path, retry_budget: RetryBudget = RetryBudget()) -> Dict:
+        manifest = TaskManifest(output_dir / Inv3DGenerator.MANIFEST_FILE_NAME)
+        settings = manifest.task_settings(task)
+
+        sample_dir = task.sample_dir(output_dir / "data", manifest.output_layout())
 
         # recover from incomplete states
         if sample_dir.is_dir():
             shutil.rmtree(sample_dir)
 
-        sample_dir.mkdir()
+        sample_dir.mkdir(parents=True)
 
         random.seed(settings["seed"])
         np.random.seed(random.getrandbits(32))
 
-        # gather all settings used to create the sample
-        summary = {
-            "invoice": {},
-            "warping": {}
+        return {
+            "task": task,
+            "output_dir": output_dir,
+            "manifest_file": manifest.file,
+            "sample_dir": sample_dir,
+            "assets_dir": Path(settings["assets_dir"]),
+            "retry_budget": retry_budget,
+            "journal": True,
+            # gather all settings used to create the sample
+            "summary": {
+                "invoice": {},
+                "warping": {},
+                "supplementary": {}
+            },
+            "random_state": random.getstate(),
+            "np_random_state": np.random.get_state(),
         }
 
-        # create invoice
-        create_invoice(output_dir=sample_dir,
-                       assets_dir=assets_dir,
-                       template_file=assets_dir / random.choice(settings["template_files"]),
-                       logo_file=assets_dir / random.choice(settings["logo_files"]),
-                       font_file=assets_dir / random.choice(settings["font_files"]),
-                       dpi=settings["document_dpi"],
-                       summary=summary["invoice"],
-                       verbose=verbose)
-
-        # render warped version of given invoice
-        render_3d(output_dir=sample_dir,
-                  tex_file=sample_dir / "flat_document.png",
-                  assets_dir=assets_dir,
-                  rel_env_files=settings["env_files"],
-                  rel_obj_file=settings["obj_files"],
-                  resolution=settings["resolution_rendering"],
-                  summary=summary["warping"],
-                  verbose=verbose)
-
-        # create supplementary files using warped images
-        create_supplementary(output_dir=sample_dir,
-                             resolution_bm=settings["resolution_bm"],
-                             verbose=verbose)
-
-        # export sample summary
-        Inv3DGenerator._export_summary(data=summary, base_dir=assets_dir, output_file=sample_dir / "details.json")
-
-        # delete task file after successful execution
-        task_file.unlink()
+    @staticmethod
+    def _prepare_regeneration(task: Task, output_dir: Path, stages: Sequence[str],
+                              retry_budget: RetryBudget = RetryBudget()) -> Dict:
+        # continues an existing sample with the given stages, earlier stages are kept
+        manifest = TaskManifest(output_dir / Inv3DGenerator.MANIFEST_FILE_NAME)
+        settings = manifest.task_settings(task)
+        sample_dir = task.sample_dir(output_dir / "data", manifest.output_layout())
+
+        summary_file = sample_dir / SampleProvenance.SUMMARY_FILE_NAME
+        summary = load_json(summary_file) if summary_file.is_file() else {}
+        summary.setdefault("timings", {})
+        for stage in stages:
+            summary[Inv3DGenerator.SUMMARY_SECTIONS[stage]] = {}
+            summary["timings"].pop(stage, None)
+
+        # the first stage continues with the random state it started with when the sample was created
+        random_state = SampleProvenance.entry_random_state(sample_dir, stages[0])
+        if random_state is not None:
+            random.setstate(random_state[0])
+            np.random.set_state(random_state[1])
+        else:
+            # samples recorded by earlier versions: derive it from the sample seed and the stage
+            random.seed(f"{settings['seed']}-{stages[0]}")
+            np.random.seed(random.getrandbits(32))
+
+        return {
+            "task": task,
+            "output_dir": output_dir,
+            "manifest_file": manifest.file,
+            "sample_dir": sample_dir,
+            "assets_dir": Path(settings["assets_dir"]),
+            "retry_budget": retry_budget,
+            "journal": False,  # the sample was completed before
+            "summary": summary,
+            "random_state": random.getstate(),
+            "np_random_state": np.random.get_state(),
+        }
+
+    @staticmethod
+    def _run_stage(stage: str, state: Dict, verbose: bool = False, combined_render: bool = False) -> Dict:
+        # stages might run in different processes: continue with the random state of the previous stage
+        random.setstate(state["random_state"])
+        np.random.set_state(state["np_random_state"])
+
+        settings = TaskManifest(state["manifest_file"]).task_settings(state["task"])
+        sample_dir = state["sample_dir"]
+        assets_dir = state["assets_dir"]
+        summary = state["summary"]
+
+        retry_budget = state["retry_budget"]
+        quarantine = AssetQuarantine.get(state["output_dir"] / Inv3DGenerator.FAILURES_DIR_NAME,
+                                         max_failures=retry_budget.quarantine_after)
+
+        timer = StageTimer(summary.setdefault("timings", {}))
+        with timer(stage):
+            if stage == "invoice":
+                for attempt in range(retry_budget.invoice_attempts):
+                    assets = draw_invoice_assets(settings, quarantine)
+
+                    start_time = time.time()
+                    try:
+                        create_invoice(output_dir=sample_dir,
+                                       assets_dir=assets_dir,
+                                       template_file=assets_dir / assets["template"],
+                                       logo_file=assets_dir / assets["logo"],
+                                       font_file=assets_dir / assets["font"],
+                                       dpi=settings["document_dpi"],
+                                       summary=summary["invoice"],
+                                       verbose=verbose)
+                        break
+                    except Exception as e:
+                        quarantine.record_failure(stage=stage, task=state["task"].name, assets=assets,
+                                                  wall_time=time.time() - start_time, error=repr(e))
+
+                        if attempt + 1 == retry_budget.invoice_attempts:
+                            raise
+
+                        print(f"WARNING: Failed to create invoice in attempt {attempt + 1} of "
+                              f"{retry_budget.invoice_attempts}: {e!r}")
+
+                        # start over with an empty sample directory
+                        shutil.rmtree(sample_dir)
+                        sample_dir.mkdir()
+                        summary["invoice"] = {}
+
+            elif stage == "render":
+                # render warped version of given invoice
+                render_3d(output_dir=sample_dir,
+                          tex_file=sample_dir / "flat_document.png",
+                          assets_dir=assets_dir,
+                          rel_env_files=settings["env_files"],
+                          rel_obj_file=settings["obj_files"],
+                          resolution=settings["resolution_rendering"],
+                          summary=summary["warping"],
+                          combined_render=combined_render,
+                          max_attempts=retry_budget.render_attempts,
+                          quarantine=quarantine,
+                          task_name=state["task"].name,
+                          verbose=verbose)
+
+            elif stage == "supplementary":
+                # create supplementary files using warped images
+                create_supplementary(output_dir=sample_dir,
+                                     resolution_bm=settings["resolution_bm"],
+                                     summary=summary["supplementary"],
+                                     verbose=verbose)
+
+            else:
+                raise ValueError(f"Unknown stage '{stage}'!")
+
+        entry_random_state = (state["random_state"], state["np_random_state"])  # not yet updated by this stage
+        SampleProvenance.record(sample_dir, stage, settings, random_state=entry_random_state)
+
+        if stage == Inv3DGenerator.STAGES[-1]:
+            # export sample summary
+            Inv3DGenerator._export_summary(data=summary, base_dir=assets_dir,
+                                           output_file=sample_dir / SampleProvenance.SUMMARY_FILE_NAME)
+
+            # mark sample as completed
+            if state["journal"]:
+                journal = CompletionJournal(state["output_dir"] / Inv3DGenerator.JOURNAL_DIR_NAME)
+                journal.record(name=state["task"].name, split=state["task"].split,
+                               timings=Inv3DGenerator._collect_timings(summary))
+
+        state["random_state"] = random.getstate()
+        state["np_random_state"] = np.random.get_state()
+        return state
+
+    @staticmethod
+    def _collect_timings(summary: Dict) -> Dict[str, Dict]:
+        # flat view of the stage timings and the detailed timings of each stage
+        timings = dict(summary.get("timings", {}))
+        for section, data in summary.items():
+            if isinstance(data, dict):
+                for name, entry in data.get("timings", {}).items():
+                    timings[f"{section}/{name}"] = entry
+        return timings
 
     @staticmethod
     def _export_summary(data: Dict, base_dir: Path, output_file: Optional[Path]) -> Dict:
@@ -7,8 +7,9 @@ import re
 import types
 from collections import OrderedDict
 from datetime import timedelta
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict, Set, Any, Union
+from typing import List, Dict, Set, Any, Union, Optional, Tuple
 
 import dpath.util
 import pandas as pd
@@ -23,18 +24,14 @@ from ..util import check_file
 
 
 class InvoiceContent:
+    PROVIDERS = (phone_number, company, date_time, internet, bank)
 
     def __init__(self, assets_dir: Path, max_products: int, shipping_tag: bool, discount_tag: bool):
-        self.fake = Faker()
+        self.fake = InvoiceContent.create_faker(locale=None, providers=InvoiceContent.PROVIDERS)
         self.fake.seed_instance(random.getrandbits(32))
-        self.fake.add_provider(phone_number)
-        self.fake.add_provider(company)
-        self.fake.add_provider(date_time)
-        self.fake.add_provider(internet)
-        self.fake.add_provider(bank)
 
-        self.ecommerce_data = pd.read_csv(str(assets_dir / "ecommerce_data.csv"))
-        self.payment_terms_data = pd.read_csv(str(assets_dir / "payment_terms.csv"))
+        self.ecommerce_data = InvoiceContent.load_csv(assets_dir / "ecommerce_data.csv")
+        self.payment_terms_data = InvoiceContent.load_csv(assets_dir / "payment_terms.csv")
 
         style = random.choice(["capitalize", "title"])
 
@@ -93,6 +90,21 @@ class InvoiceContent:
 
         self.all_attributes = self.collapse_data()
 
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def load_csv(file: Path) -> pd.DataFrame:
+        # loaded once per process; callers must not modify the result
+        return pd.read_csv(str(check_file(file, suffix=".csv")))
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def create_faker(locale: Optional[str], providers: Tuple[types.ModuleType, ...]) -> Faker:
+        # created once per process and locale; callers must reseed the instance before using it
+        fake = Faker(locale)
+        for provider in providers:
+            fake.add_provider(provider)
+        return fake
+
     def subset_data(self, queries: Set[str], output_file: Path = None):
 
         # build subset of "self.complete_data" defined by the combination of all queries
@@ -212,9 +224,9 @@ class InvoiceContent:
         }
 
     def fake_phone_number(self):
-        international_fake = Faker(random.choice(AVAILABLE_LOCALES))
+        international_fake = InvoiceContent.create_faker(locale=random.choice(AVAILABLE_LOCALES),
+                                                         providers=(phone_number,))
         international_fake.seed_instance(random.getrandbits(32))
-        international_fake.add_provider(phone_number)
 
         for _ in range(100):
             try:
@@ -285,8 +297,10 @@ class InvoiceContent:
 
         parse_old = factory.parse  # save old parse method
         factory.parse = types.MethodType(parse_inject, factory)  # replace parse method
-        getattr(self.fake, method_name)()  # trigger method execution
-        factory.parse = parse_old  # restore old method
+        try:
+            getattr(self.fake, method_name)()  # trigger method execution
+        finally:
+            factory.parse = parse_old  # restore old method, the faker instance is shared within the process
 
         return collection[list(collection.keys())[-1]]
 
@@ -1,24 +1,45 @@
+import random
 import warnings
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Iterable
 
 from .fake_content import InvoiceContent
 from .template import Template
 from .web_renderer import WebRenderer
 from .word_locator import WordLocator
-from ..formats import load_image
-from ..util import check_file, check_dir, print_if
+from ..quarantine import AssetQuarantine
+from ..util import check_asset, check_dir, print_if, StageTimer
 
 warnings.filterwarnings("ignore")
 
 
+def warm_up_invoice(assets_dir: Path, template_files: Iterable[Path]):
+    # fills the per-process caches of all read-only assets used by create_invoice
+    InvoiceContent.load_csv(assets_dir / "ecommerce_data.csv")
+    InvoiceContent.load_csv(assets_dir / "payment_terms.csv")
+    InvoiceContent.create_faker(locale=None, providers=InvoiceContent.PROVIDERS)
+    WebRenderer.read_script(WebRenderer.JQUERY_FILE)
+
+    for template_file in template_files:
+        Template.read_template(template_file)
+
+
+def draw_invoice_assets(settings: Dict, quarantine: AssetQuarantine) -> Dict[str, str]:
+    # quarantined assets are only drawn if all candidates are quarantined
+    return {
+        "template": random.choice(quarantine.filter(settings["template_files"])),
+        "logo": random.choice(quarantine.filter(settings["logo_files"])),
+        "font": random.choice(quarantine.filter(settings["font_files"])),
+    }
+
+
 def create_invoice(output_dir: Path, assets_dir: Path, template_file: Path, logo_file: Path, font_file: Path, dpi: int,
                    summary: Dict, verbose: bool = False):
     check_dir(output_dir)
     check_dir(assets_dir)
-    check_file(template_file, suffix=".htm")
-    check_file(logo_file, suffix=".png")
-    check_file(font_file, suffix=".ttf")
+    check_asset(template_file, suffix=".htm")
+    check_asset(logo_file, suffix=".png")
+    check_asset(font_file, suffix=".ttf")
 
     summary["template"] = template_file
     summary["logo"] = logo_file
@@ -26,20 +47,24 @@ def create_invoice(output_dir: Path, assets_dir: Path, template_file: Path, logo
     summary["dpi"] = dpi
 
     print_if(verbose, "Start invoice generation")
+    timer = StageTimer(summary.setdefault("timings", {}))
 
-    template = Template(template_file=template_file, summary=summary)
-    content = InvoiceContent(assets_dir=assets_dir, max_products=template.num_products,
-                             shipping_tag=template.shipment_tag, discount_tag=template.discount_tag)
-    template.fill_content(content=content)
+    with timer("template_fill"):
+        template = Template(template_file=template_file, summary=summary)
+        content = InvoiceContent(assets_dir=assets_dir, max_products=template.num_products,
+                                 shipping_tag=template.shipment_tag, discount_tag=template.discount_tag)
+        template.fill_content(content=content)
 
     renderer = WebRenderer(output_dir=output_dir, template=template, logo_file=logo_file, font_file=font_file, dpi=dpi,
                            summary=summary)
     template_fields = renderer.render()
 
-    content.export_ground_truth(output_dir=output_dir, template_fields=template_fields)
+    with timer("ground_truth_export"):
+        content.export_ground_truth(output_dir=output_dir, template_fields=template_fields)
 
-    height, width, _ = load_image(output_dir / "flat_document.png").shape
-    locator = WordLocator(output_dir / "flat_document.pdf")
-    locator.export_json(output_dir / "ground_truth_words.json", height=height, width=width)
+    with timer("word_locator"):
+        height, width, _ = renderer.images["document"].shape
+        locator = WordLocator(output_dir / "flat_document.pdf")
+        locator.export_json(output_dir / "ground_truth_words.json", height=height, width=width)
 
     print_if(verbose, "Stop invoice generation")
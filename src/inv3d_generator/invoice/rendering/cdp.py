@@ -0,0 +1,147 @@
+import fcntl
+import json
+import os
+import select
+import shutil
+import signal
+import tempfile
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+
+class CdpError(Exception):
+    pass
+
+
+class CdpConnection:
+    # Chrome controlled through the DevTools protocol without chromedriver. With --remote-debugging-pipe the browser
+    # reads commands from its file descriptor 3 and writes responses and events to its file descriptor 4, all as JSON
+    # messages terminated by a null byte.
+
+    BINARIES = ("google-chrome", "google-chrome-stable", "chromium", "chromium-browser")
+
+    def __init__(self, arguments: List[str], binary: Optional[str] = None):
+        binary = CdpConnection.find_binary() if binary is None else binary
+
+        self.user_data_dir = tempfile.mkdtemp(prefix="inv3d-chrome-")  # concurrent browsers must not share profiles
+
+        command_read, self.command_write = (CdpConnection._high_fd(fd) for fd in os.pipe())
+        self.response_read, response_write = (CdpConnection._high_fd(fd) for fd in os.pipe())
+
+        # only the duplicated pipe ends are inherited by the browser, all others are closed on exec
+        self.pid = os.posix_spawn(binary, [binary, *arguments, "--remote-debugging-pipe",
+                                           f"--user-data-dir={self.user_data_dir}"], os.environ, file_actions=[
+            (os.POSIX_SPAWN_OPEN, 0, os.devnull, os.O_RDONLY, 0),
+            (os.POSIX_SPAWN_OPEN, 1, os.devnull, os.O_WRONLY, 0),
+            (os.POSIX_SPAWN_OPEN, 2, os.devnull, os.O_WRONLY, 0),
+            (os.POSIX_SPAWN_DUP2, command_read, 3),
+            (os.POSIX_SPAWN_DUP2, response_write, 4),
+        ])
+        os.close(command_read)
+        os.close(response_write)
+
+        self.next_id = 0
+        self.buffer = bytearray()
+        self.scanned = 0  # the buffer contains no message end before this position
+        self.events = deque(maxlen=1000)
+
+    @staticmethod
+    def find_binary() -> str:
+        for name in CdpConnection.BINARIES:
+            binary = shutil.which(name)
+            if binary is not None:
+                return binary
+        raise CdpError(f"Could not find a Chrome binary! Searched for {CdpConnection.BINARIES}")
+
+    def send(self, method: str, params: Optional[Dict[str, Any]] = None, session_id: Optional[str] = None,
+             timeout: Optional[float] = None) -> Dict[str, Any]:
+        # sends a command and waits for its result, events received meanwhile are kept for wait_event
+        self.next_id += 1
+        message_id = self.next_id
+
+        message = {"id": message_id, "method": method, "params": {} if params is None else params}
+        if session_id is not None:
+            message["sessionId"] = session_id
+
+        data = json.dumps(message).encode("utf-8") + b"\0"
+        while len(data) > 0:
+            data = data[os.write(self.command_write, data):]
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            response = self._receive(deadline)
+
+            if "id" not in response:
+                self.events.append(response)
+            elif response["id"] == message_id:
+                if "error" in response:
+                    raise CdpError(f"{method} failed: {response['error'].get('message')}")
+                return response.get("result", {})
+            # otherwise the response of a command which timed out before
+
+    def wait_event(self, method: str, session_id: Optional[str] = None,
+                   timeout: Optional[float] = None) -> Dict[str, Any]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            while len(self.events) > 0:
+                event = self.events.popleft()
+                if event.get("method") == method and event.get("sessionId") == session_id:
+                    return event.get("params", {})
+
+            message = self._receive(deadline)
+            if "id" not in message:
+                self.events.append(message)
+
+    def close(self):
+        try:
+            self.send("Browser.close", timeout=5)
+        except (CdpError, OSError, TimeoutError):
+            pass  # browser already gone
+
+        # the browser is given a bounded time to exit on its own before it is killed
+        deadline = time.monotonic() + 5
+        try:
+            while os.waitpid(self.pid, os.WNOHANG) == (0, 0):
+                if time.monotonic() > deadline:
+                    os.kill(self.pid, signal.SIGKILL)
+                    os.waitpid(self.pid, 0)
+                    break
+                time.sleep(0.05)
+        except ChildProcessError:
+            pass  # already reaped elsewhere, e.g. by a SIGCHLD handler
+
+        os.close(self.command_write)
+        os.close(self.response_read)
+        shutil.rmtree(self.user_data_dir, ignore_errors=True)
+
+    def _receive(self, deadline: Optional[float]) -> Dict[str, Any]:
+        while True:
+            end = self.buffer.find(b"\0", self.scanned)
+            if end >= 0:
+                break
+            self.scanned = len(self.buffer)
+
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            ready, _, _ = select.select([self.response_read], [], [], timeout)
+            if len(ready) == 0:
+                raise TimeoutError("No response from the browser!")
+
+            chunk = os.read(self.response_read, 2 ** 20)
+            if len(chunk) == 0:
+                raise CdpError("Browser closed the connection!")
+            self.buffer += chunk
+
+        message = bytes(self.buffer[:end])
+        del self.buffer[:end + 1]
+        self.scanned = 0
+
+        return json.loads(message)
+
+    @staticmethod
+    def _high_fd(fd: int) -> int:
+        # moves the file descriptor to 10 or above such that duplicating it to 3 or 4 cannot overwrite the other pipe
+        high_fd = fcntl.fcntl(fd, fcntl.F_DUPFD, 10)
+        os.set_inheritable(high_fd, False)
+        os.close(fd)
+        return high_fd
@@ -0,0 +1,49 @@
+// Resolves once the page is ready to be printed: all fonts and images are loaded and the layout did not change
+// during consecutive animation frames. Passes the waiting time in milliseconds to the selenium callback.
+var callback = arguments[arguments.length - 1];
+var start = performance.now();
+var stableFrames = 3;
+
+function layoutSignature() {
+    var root = document.documentElement;
+    return [root.scrollWidth, root.scrollHeight, document.body ? document.body.getBoundingClientRect().height : 0].join();
+}
+
+function imageLoaded(image) {
+    if (image.complete) {
+        return Promise.resolve();
+    }
+    return new Promise(function (resolve) {
+        image.addEventListener("load", resolve);
+        image.addEventListener("error", resolve);  // broken images do not block printing
+    });
+}
+
+function layoutStable() {
+    return new Promise(function (resolve) {
+        var last = layoutSignature();
+        var count = 0;
+
+        function check() {
+            var current = layoutSignature();
+            count = current === last ? count + 1 : 0;
+            last = current;
+
+            if (count >= stableFrames) {
+                resolve();
+            } else {
+                requestAnimationFrame(check);
+            }
+        }
+
+        requestAnimationFrame(check);
+    });
+}
+
+layoutSignature();  // forces a layout such that the fonts used by the injected styles start loading
+
+Promise.all([document.fonts.ready].concat(Array.prototype.map.call(document.images, imageLoaded)))
+    .then(layoutStable)
+    .then(function () {
+        callback(performance.now() - start);
+    });
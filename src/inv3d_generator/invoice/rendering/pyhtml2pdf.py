@@ -1,78 +1,169 @@
+import abc
+import atexit
 import base64
+import io
 import json
+import math
 import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
 from typing import *
 
+from PIL import Image
 from selenium import webdriver
-from selenium.common.exceptions import TimeoutException
+from selenium.common.exceptions import TimeoutException, WebDriverException
 from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.expected_conditions import staleness_of
-from selenium.webdriver.support.ui import WebDriverWait
 from webdriver_manager.chrome import ChromeDriverManager
 
+from .cdp import CdpConnection, CdpError
+from ...util import process_tree_cpu_time
+
 os.environ['WDM_LOG_LEVEL'] = '0'  # silence webdriver-manager
 
+READY_SCRIPT_FILE = Path(__file__).parent / "page_ready.js"
+
 
 def convert(source: str, target: str, timeout: int = 2, print_options: Dict[str, Any] = None,
-            install_driver: bool = True, script: Optional[str] = None):
+            install_driver: bool = True, script: Optional[str] = None) -> float:
     """
-    Convert a given html file or website into PDF
+    Convert a given html file or website into PDF. Returns the seconds spent waiting for the page to become ready
 
     :param script:
     :param install_driver:
     :param print_options:
     :param str source: source html file or website link
     :param str target: target location to save the PDF
-    :param int timeout: timeout in seconds. Default value is set to 2 seconds
+    :param int timeout: maximum seconds to wait for fonts, images and layout. Default value is set to 2 seconds
    """
 
     if print_options is None:
         print_options = {}
 
-    result = __get_pdf_from_html(source, timeout, install_driver, print_options=print_options, script=script)
+    with BrowserPool.get(install_driver).session() as session:
+        wait_time = session.load(source, timeout, script=script)
+        result = session.print_to_pdf(print_options=print_options)
 
     with open(target, 'wb') as file:
         file.write(result)
 
+    return wait_time
+
+
+def convert_variants(source: str, targets: Dict[str, str], timeout: int = 2, print_options: Dict[str, Any] = None,
+                     install_driver: bool = True, script: Optional[str] = None,
+                     dpi: int = 200) -> Tuple[Dict[str, Dict[str, float]], Dict[str, bytes]]:
+    """
+    Convert a given html file or website into one PDF or PNG per page variant. The page is loaded and laid out once,
+    each variant is printed while its class is set on the <html> element. PNG targets are captured from the browser
+    at the given dpi with the page geometry of the printed PDF (first page only). Returns the timings of waiting for
+    the page to become ready and of the browser (including the cpu time of its processes), and the content written to
+    each target
+
+    :param script:
+    :param install_driver:
+    :param print_options:
+    :param str source: source html file or website link
+    :param dict targets: class name of each variant and the target location to save its PDF or PNG
+    :param int timeout: maximum seconds to wait for fonts, images and layout. Default value is set to 2 seconds
+    :param int dpi: resolution of PNG targets
+   """
+
+    if print_options is None:
+        print_options = {}
+
+    with BrowserPool.get(install_driver).session() as session:
+        start_time = time.perf_counter()
+        start_cpu_time = session.cpu_time()
+
+        wait_time = session.load(source, timeout, script=script)
+        results = {variant: session.print_to_pdf(print_options=print_options, variant=variant)
+                   for variant, target in targets.items() if not target.endswith(".png")}
+
+        raster_variants = [variant for variant, target in targets.items() if target.endswith(".png")]
+        if len(raster_variants) > 0:
+            if len(results) > 0:
+                reference_pdf = next(iter(results.values()))
+            else:
+                reference_pdf = session.print_to_pdf(print_options=dict(print_options, pageRanges="1"))
+
+            page_size = pdf_page_size(reference_pdf)
+            for variant in raster_variants:
+                results[variant] = session.capture_png(page_size, print_options=print_options, dpi=dpi,
+                                                       variant=variant)
+
+        timings = {
+            "page_ready": {"wall_time": wait_time},
+            "browser": {"wall_time": time.perf_counter() - start_time,
+                        "external_cpu_time": session.cpu_time() - start_cpu_time},
+        }
+
+    for variant, target in targets.items():
+        with open(target, 'wb') as file:
+            file.write(results[variant])
+
+    return timings, results
+
 
-def __send_devtools(driver, cmd, params):
-    resource = "/session/%s/chromium/send_command_and_get_result" % driver.session_id
-    url = driver.command_executor._url + resource
-    body = json.dumps({'cmd': cmd, 'params': params})
-    response = driver.command_executor._request('POST', url, body)
+@lru_cache(maxsize=None)
+def install_chrome_driver() -> str:
+    # downloads or looks up the driver once per process
+    return ChromeDriverManager().install()
 
-    if not response:
-        raise Exception(response.get('value'))
 
-    return response.get('value')
+def pdf_page_size(data: bytes) -> Tuple[float, float]:
+    # width and height of the first page in inches
+    match = re.search(rb"/MediaBox\s*\[\s*([-\d.]+)\s+([-\d.]+)\s+([-\d.]+)\s+([-\d.]+)\s*\]", data)
+    assert match is not None, "Could not find the page size of the PDF!"
 
+    left, bottom, right, top = (float(value) for value in match.groups())
+    return (right - left) / 72, (top - bottom) / 72
 
-def __get_pdf_from_html(path: str, timeout: int, install_driver: bool, print_options: Dict[str, str],
-                        script: Optional[str] = None):
-    webdriver_options = Options()
-    webdriver_prefs = {}
 
-    webdriver_options.add_argument('--headless')
-    webdriver_options.add_argument('--disable-gpu')
-    webdriver_options.add_argument('--no-sandbox')
-    webdriver_options.add_argument('--disable-dev-shm-usage')
-    webdriver_options.experimental_options['prefs'] = webdriver_prefs
+@lru_cache(maxsize=None)
+def read_ready_script() -> str:
+    # read once per process
+    with READY_SCRIPT_FILE.open("r") as fp:
+        return fp.read()
 
-    webdriver_prefs['profile.default_content_settings'] = {'images': 2}
 
-    if install_driver:
-        driver = webdriver.Chrome(ChromeDriverManager().install(), options=webdriver_options)
-    else:
-        driver = webdriver.Chrome(options=webdriver_options)
+class BrowserSession(abc.ABC):
+    # Headless Chrome instance reused for many pages. The backends provide navigation, script execution (with
+    # selenium semantics: the script is a function body receiving the given arguments) and devtools commands.
 
-    driver.get(path)
+    def __init__(self):
+        self.num_uses = 0
 
-    if script is not None:
-        driver.execute_script(script)
+    def is_healthy(self) -> bool:
+        try:
+            return self._execute_script("return 1;") == 1
+        except Exception:
+            return False
+
+    def load(self, path: str, timeout: int, script: Optional[str] = None) -> float:
+        # returns the seconds spent waiting for fonts, images and a stable layout, at most timeout
+        self.num_uses += 1
+
+        self._navigate(path)
+
+        if script is not None:
+            self._execute_script(script)
+
+        start_time = time.perf_counter()
+        try:
+            self._execute_async_script(read_ready_script(), timeout)
+        except TimeoutError:
+            print(f"WARNING: Page {path} not ready after {timeout} seconds. Printing anyway!")
+        return time.perf_counter() - start_time
+
+    def print_to_pdf(self, print_options: Dict[str, Any], variant: Optional[str] = None) -> bytes:
+        # prints the loaded page, optionally while the class of the given variant is set on <html>
+        if variant is not None:
+            self._execute_script("document.documentElement.classList.add(arguments[0]);", variant)
 
-    try:
-        WebDriverWait(driver, timeout).until(staleness_of(driver.find_element_by_tag_name('html')))
-    except TimeoutException:
         calculated_print_options = {
             'landscape': False,
             'displayHeaderFooter': False,
@@ -80,6 +171,280 @@ def __get_pdf_from_html(path: str, timeout: int, install_driver: bool, print_opt
             'preferCSSPageSize': True,
         }
         calculated_print_options.update(print_options)
-        result = __send_devtools(driver, "Page.printToPDF", calculated_print_options)
-        driver.quit()
+        result = self._send_devtools("Page.printToPDF", calculated_print_options)
+
+        if variant is not None:
+            self._execute_script("document.documentElement.classList.remove(arguments[0]);", variant)
+
         return base64.b64decode(result['data'])
+
+    def capture_png(self, page_size: Tuple[float, float], print_options: Dict[str, Any], dpi: int,
+                    variant: Optional[str] = None) -> bytes:
+        # Captures the first page as printed by print_to_pdf: the page content is laid out for print media at the
+        # width of the printable area and placed within the margins of a white page of the given size (in inches).
+        # The page has the size of the PDF rasterized by pdftoppm at the same dpi.
+        page_width, page_height = page_size
+        top = print_options.get("marginTop", 0.4)  # defaults of Page.printToPDF
+        bottom = print_options.get("marginBottom", 0.4)
+        left = print_options.get("marginLeft", 0.4)
+        right = print_options.get("marginRight", 0.4)
+
+        content_width = (page_width - left - right) * 96  # css pixels
+        content_height = (page_height - top - bottom) * 96
+
+        if variant is not None:
+            self._execute_script("document.documentElement.classList.add(arguments[0]);", variant)
+
+        self._send_devtools("Emulation.setEmulatedMedia", {"media": "print"})
+        self._send_devtools("Emulation.setDeviceMetricsOverride", {
+            "width": int(math.ceil(content_width)),
+            "height": int(math.ceil(content_height)),
+            "deviceScaleFactor": dpi / 96,
+            "mobile": False,
+        })
+
+        try:
+            result = self._send_devtools("Page.captureScreenshot", {
+                "format": "png",
+                "clip": {"x": 0, "y": 0, "width": content_width, "height": content_height, "scale": 1},
+            })
+        finally:
+            self._send_devtools("Emulation.clearDeviceMetricsOverride", {})
+            self._send_devtools("Emulation.setEmulatedMedia", {"media": ""})
+
+            if variant is not None:
+                self._execute_script("document.documentElement.classList.remove(arguments[0]);", variant)
+
+        content = Image.open(io.BytesIO(base64.b64decode(result['data']))).convert("RGB")
+
+        page = Image.new("RGB", (math.ceil(page_width * dpi), math.ceil(page_height * dpi)), "white")
+        page.paste(content, (round(left * dpi), round(top * dpi)))
+
+        data = io.BytesIO()
+        page.save(data, format="png")
+        return data.getvalue()
+
+    def cpu_time(self) -> float:
+        # the browser processes do the layout and printing, their cpu time is not accounted to this process
+        return process_tree_cpu_time(self._browser_pid())
+
+    @abc.abstractmethod
+    def close(self):
+        pass
+
+    @abc.abstractmethod
+    def _browser_pid(self) -> int:
+        pass
+
+    @abc.abstractmethod
+    def _navigate(self, path: str):
+        pass
+
+    @abc.abstractmethod
+    def _execute_script(self, script: str, *args) -> Any:
+        pass
+
+    @abc.abstractmethod
+    def _execute_async_script(self, script: str, timeout: float) -> Any:
+        # the script signals completion by calling its last argument, raises TimeoutError after timeout seconds
+        pass
+
+    @abc.abstractmethod
+    def _send_devtools(self, cmd: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        pass
+
+
+class SeleniumSession(BrowserSession):
+    # Chrome controlled by chromedriver
+
+    def __init__(self, install_driver: bool):
+        super().__init__()
+
+        webdriver_options = Options()
+        webdriver_prefs = {}
+
+        webdriver_options.add_argument('--headless')
+        webdriver_options.add_argument('--disable-gpu')
+        webdriver_options.add_argument('--no-sandbox')
+        webdriver_options.add_argument('--disable-dev-shm-usage')
+        webdriver_options.experimental_options['prefs'] = webdriver_prefs
+
+        webdriver_prefs['profile.default_content_settings'] = {'images': 2}
+
+        if install_driver:
+            self.driver = webdriver.Chrome(install_chrome_driver(), options=webdriver_options)
+        else:
+            self.driver = webdriver.Chrome(options=webdriver_options)
+
+    def close(self):
+        try:
+            self.driver.quit()
+        except WebDriverException:
+            pass  # browser already gone
+
+    def _browser_pid(self) -> int:
+        return self.driver.service.process.pid  # chromedriver, the browser is started as its child
+
+    def _navigate(self, path: str):
+        self.driver.get(path)
+
+    def _execute_script(self, script: str, *args) -> Any:
+        return self.driver.execute_script(script, *args)
+
+    def _execute_async_script(self, script: str, timeout: float) -> Any:
+        self.driver.set_script_timeout(timeout)
+        try:
+            return self.driver.execute_async_script(script)
+        except TimeoutException:
+            raise TimeoutError(f"Script did not finish within {timeout} seconds!")
+
+    def _send_devtools(self, cmd, params):
+        resource = "/session/%s/chromium/send_command_and_get_result" % self.driver.session_id
+        url = self.driver.command_executor._url + resource
+        body = json.dumps({'cmd': cmd, 'params': params})
+        response = self.driver.command_executor._request('POST', url, body)
+
+        if not response:
+            raise Exception(response.get('value'))
+
+        return response.get('value')
+
+
+class CdpSession(BrowserSession):
+    # Chrome controlled directly through the DevTools protocol, neither chromedriver nor a driver download is needed
+
+    ARGUMENTS = ['--headless', '--disable-gpu', '--no-sandbox', '--disable-dev-shm-usage', '--no-first-run',
+                 '--no-default-browser-check']
+    COMMAND_TIMEOUT = 60  # seconds, protects against a hanging browser
+
+    def __init__(self):
+        super().__init__()
+
+        self.connection = CdpConnection(self.ARGUMENTS)
+        try:
+            target = self.connection.send("Target.createTarget", {"url": "about:blank"}, timeout=self.COMMAND_TIMEOUT)
+            self.session_id = self.connection.send("Target.attachToTarget",
+                                                   {"targetId": target["targetId"], "flatten": True},
+                                                   timeout=self.COMMAND_TIMEOUT)["sessionId"]
+            self._send_devtools("Page.enable", {})
+        except Exception:
+            self.connection.close()
+            raise
+
+    def close(self):
+        self.connection.close()
+
+    def _browser_pid(self) -> int:
+        return self.connection.pid
+
+    def _navigate(self, path: str):
+        self.connection.events.clear()  # load events of earlier pages
+        result = self._send_devtools("Page.navigate", {"url": path})
+        if "errorText" in result:
+            raise CdpError(f"Could not load {path}: {result['errorText']}")
+        self.connection.wait_event("Page.loadEventFired", session_id=self.session_id, timeout=self.COMMAND_TIMEOUT)
+
+    def _execute_script(self, script: str, *args) -> Any:
+        return self._evaluate("(function () {\n" + script + "\n}).apply(null, " + json.dumps(list(args)) + ")",
+                              timeout=self.COMMAND_TIMEOUT)
+
+    def _execute_async_script(self, script: str, timeout: float) -> Any:
+        return self._evaluate("new Promise(function (resolve) {\n(function () {\n" + script +
+                              "\n}).apply(null, [resolve]);\n})", timeout=timeout)
+
+    def _evaluate(self, expression: str, timeout: float) -> Any:
+        result = self.connection.send("Runtime.evaluate", {
+            "expression": expression,
+            "awaitPromise": True,
+            "returnByValue": True,
+        }, session_id=self.session_id, timeout=timeout)
+
+        if "exceptionDetails" in result:
+            details = result["exceptionDetails"]
+            raise CdpError(details.get("exception", {}).get("description", details.get("text")))
+
+        return result["result"].get("value")
+
+    def _send_devtools(self, cmd: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        return self.connection.send(cmd, params, session_id=self.session_id, timeout=self.COMMAND_TIMEOUT)
+
+
+class BrowserPool:
+    # Warm browser sessions of a worker process. Sessions are health checked before they are handed out, replaced after
+    # a failed render and recycled after max_uses pages to bound the memory growth of long running browsers.
+
+    MAX_USES = 100
+    BACKENDS = ("selenium", "cdp")
+    default_backend = "selenium"  # backend of the pools created by this process, see configure
+
+    def __init__(self, install_driver: bool, backend: str = "selenium", max_uses: int = MAX_USES):
+        assert backend in BrowserPool.BACKENDS, f"Unknown browser backend '{backend}'!"
+        assert max_uses > 0
+
+        self.install_driver = install_driver
+        self.backend = backend
+        self.max_uses = max_uses
+        self.pid = os.getpid()
+        self.idle = []
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def configure(backend: str):
+        assert backend in BrowserPool.BACKENDS, f"Unknown browser backend '{backend}'!"
+        BrowserPool.default_backend = backend
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _create(install_driver: bool, backend: str) -> "BrowserPool":
+        pool = BrowserPool(install_driver, backend)
+        atexit.register(pool.close)
+        return pool
+
+    @staticmethod
+    def get(install_driver: bool = True) -> "BrowserPool":
+        # one pool per process, pools inherited from the parent process are discarded as their browsers are not ours
+        pool = BrowserPool._create(install_driver, BrowserPool.default_backend)
+        if pool.pid != os.getpid():
+            BrowserPool._create.cache_clear()
+            pool = BrowserPool._create(install_driver, BrowserPool.default_backend)
+        return pool
+
+    @contextmanager
+    def session(self) -> Iterator[BrowserSession]:
+        session = self._acquire()
+        success = False
+        try:
+            yield session
+            success = True
+        finally:
+            # sessions are only reused after a successful render, also an interrupted render (e.g. a KeyboardInterrupt
+            # or a closed generator) may have left the page in any state
+            if not success or session.num_uses >= self.max_uses:
+                session.close()
+            else:
+                with self.lock:
+                    self.idle.append(session)
+
+    def close(self):
+        if self.pid != os.getpid():
+            return
+
+        with self.lock:
+            sessions, self.idle = self.idle, []
+
+        for session in sessions:
+            session.close()
+
+    def _acquire(self) -> BrowserSession:
+        while True:
+            with self.lock:
+                session = self.idle.pop() if len(self.idle) > 0 else None
+
+            if session is None:
+                return CdpSession() if self.backend == "cdp" else SeleniumSession(self.install_driver)
+
+            if session.is_healthy():
+                return session
+
+            print("WARNING: Replacing unresponsive browser session!")
+            session.close()
@@ -0,0 +1,32 @@
+import numpy as np
+from pdf2image import convert_from_bytes
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+
+def rasterize_pdf(data: bytes, dpi: int) -> np.ndarray:
+    """
+    Rasterize the first page of a PDF within the current process. Falls back to pdf2image (pdftoppm) if PyMuPDF is
+    not installed
+
+    :param bytes data: content of the PDF file
+    :param int dpi: resolution of the image
+    :return: image as uint8 array of shape (height, width, 3) in BGR order, like formats.load_image
+    """
+    if fitz is None:
+        return _rasterize_pdf2image(data, dpi)
+
+    with fitz.open(stream=data, filetype="pdf") as document:
+        assert document.page_count > 0, "PDF without pages!"
+        pixmap = document[0].get_pixmap(matrix=fitz.Matrix(dpi / 72, dpi / 72), alpha=False)
+
+    image = np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(pixmap.height, pixmap.width, pixmap.n)
+    return np.ascontiguousarray(image[:, :, 2::-1])
+
+
+def _rasterize_pdf2image(data: bytes, dpi: int) -> np.ndarray:
+    [image] = convert_from_bytes(data, dpi=dpi, last_page=1)
+    return np.ascontiguousarray(np.asarray(image.convert("RGB"))[:, :, ::-1])
@@ -1,6 +1,7 @@
 import random
 import re
 from collections import defaultdict
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, List, Any
 
@@ -31,7 +32,7 @@ class Template:
             return hash(self._xpath)
 
     def __init__(self, template_file: Path, summary: Dict):
-        template = template_file.read_text()
+        template = Template.read_template(template_file)
         template = Template._replace_colors_randomly(template=template, summary=summary)
         template = Template._replace_font_size_randomly(template=template, summary=summary)
 
@@ -62,6 +63,21 @@ class Template:
     def image_dir(self):
         return self.template_file.parent / (self.template_file.stem + "_files")
 
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def read_template(template_file: Path) -> str:
+        # read once per process
+        return check_file(template_file, suffix=".htm").read_text()
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def count_products(template_file: Path) -> int:
+        # number of product rows without parsing the template, e.g. to estimate the cost of a task
+        return max([int(subtag)
+                    for attribute in re.findall(Template.ATTRIBUTE_PATTERN, Template.read_template(template_file))
+                    if attribute.startswith("products.")
+                    for subtag in attribute.split(".") if subtag.isdigit()], default=-1) + 1
+
     @classmethod
     def _replace_colors_randomly(cls, template: str, summary: Dict) -> str:
         color_map = {}
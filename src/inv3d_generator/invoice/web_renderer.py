@@ -1,25 +1,43 @@
+import json
 import random
 import shutil
 import tempfile
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Optional, Dict
+from typing import Dict, Iterable, List, Optional
 
 from zipfile import BadZipfile
 import numpy as np
 from PIL import Image, UnidentifiedImageError
-from pdf2image import convert_from_path
+from selenium.common.exceptions import WebDriverException
 
 from .bbox import BoundingBox
-from .rendering.pyhtml2pdf import convert
+from .rendering.cdp import CdpError
+from .rendering.pyhtml2pdf import BrowserPool, convert_variants
+from .rendering.rasterize import rasterize_pdf
 from .template import Template
 from .util import map_colors
-from ..util import check_file
+from ..formats import load_image, save_image
+from ..util import check_file, StageTimer
 
 
 class WebRenderer:
     WEB_DIR = Path(__file__).parent / "web"
     JQUERY_FILE = WEB_DIR / "jquery-3.6.0.min.js"
 
+    # style rules (selector, declarations) of the page variants, active while the class "variant_<name>" is set on
+    # <html>; the rules are important to override inline styles of the templates
+    VARIANT_STYLES = {
+        "document": [],
+        "template": [(".template_text", "visibility: hidden")],
+        "information_delta": [("*", "visibility: hidden"),
+                              (".template_text, .template_text *", "visibility: visible; color: black")],
+        "text_mask": [("*", "color: black; background-color: transparent; border-color: transparent"),
+                      ("img", "visibility: hidden")],
+        "template_structure": [],  # highlighting is scripted, the blocker images require a separate page load
+    }
+    MAX_PAGE_DEVIATION = 1  # pixels between a browser capture and the rasterized pdf of the same page
+
     def __init__(self, output_dir: Path, template: Template, logo_file: Path, font_file: Path, dpi: int, summary: Dict):
         self.output_dir = output_dir
         self.template = template
@@ -28,12 +46,20 @@ class WebRenderer:
         self.dpi = dpi
         self.margin = random.randint(10, 20)
         summary["margin"] = self.margin
+        self.timer = StageTimer(summary.setdefault("timings", {}))
+        self.images = {}  # rasterized variants, available after rendering
 
-        with self.JQUERY_FILE.open("r") as jquery_js:
-            self.jquery_script = jquery_js.read()
+        self.jquery_script = WebRenderer.read_script(self.JQUERY_FILE)
 
         assert self.template.color_mapping is not None
 
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def read_script(script_file: Path) -> str:
+        # read once per process
+        with check_file(script_file, suffix=".js").open("r") as fp:
+            return fp.read()
+
     def render(self) -> List[BoundingBox]:
         with tempfile.TemporaryDirectory() as tmp_dir:
             tmp_dir = Path(tmp_dir)
@@ -43,24 +69,14 @@ class WebRenderer:
 
             self._prepare_image(html_file=html_file)
 
-            document_image = self.output_dir / "flat_document.png"
             document_pdf = self.output_dir / "flat_document.pdf"
-            self._render_a4_page(html_file, output_file=document_image, pdf_file=document_pdf)
-
-            template_image = self.output_dir / "flat_template.png"
-            self._render_a4_page(html_file, output_file=template_image,
-                                 scripts=["$('.template_text').css('visibility', 'hidden');"])
-
-            information_delta_image = self.output_dir / "flat_information_delta.png"
-            self._render_a4_page(html_file, output_file=information_delta_image,
-                                 scripts=["$('*').css('visibility', 'hidden');",
-                                          "$('.template_text, .template_text *').css({'visibility': 'visible', 'color': 'black'});"])
-
-            text_mask_image = self.output_dir / "flat_text_mask.png"
-            self._render_a4_page(html_file, output_file=text_mask_image,
-                                 scripts=[
-                                     "$('*').css({'color': 'black', 'background-color': 'transparent', 'border-color': 'transparent', 'box-shadow': 'transparent'});",
-                                     "$('img').css('visibility', 'hidden');"])
+            with self.timer("render_variants"):
+                self._render_a4_variants(html_file, outputs={
+                    "document": self.output_dir / "flat_document.png",
+                    "template": self.output_dir / "flat_template.png",
+                    "information_delta": self.output_dir / "flat_information_delta.png",
+                    "text_mask": self.output_dir / "flat_text_mask.png",
+                }, pdf_files={"document": document_pdf})
 
             # Note: replace images with blockers
             template_fields = self._extract_template_fields(html_file=html_file)
@@ -82,21 +98,25 @@ class WebRenderer:
             logo = logo.resize(Image.open(str(image_file)).size, Image.ANTIALIAS)
             logo.save(str(target_image_dir / image_file.name))
 
-    def _render_a4_page(self, html_file: Path, output_file: Path, scripts: Optional[List[str]] = None,
-                        pdf_file: Optional[Path] = None):
+    def _render_a4_variants(self, html_file: Path, outputs: Dict[str, Path], scripts: Optional[List[str]] = None,
+                            pdf_files: Optional[Dict[str, Path]] = None):
+        # loads and lays out the page once and renders all given variants (see VARIANT_STYLES) from the same page
+        # variants with a pdf file are printed and rasterized, all others are captured directly by the browser
+        if pdf_files is None:
+            pdf_files = {}
+
         def inner():
             nonlocal scripts
-            nonlocal pdf_file
 
             if scripts is None:
                 scripts = []
 
-            if pdf_file is None:
-                pdf_file = html_file.parent / output_file.with_suffix(".pdf").name
-
             check_file(html_file, suffix=[".htm", ".html"])
-            check_file(output_file, suffix=".png", exist=False)
-            check_file(pdf_file, suffix=".pdf", exist=False)
+            for name in outputs.keys():
+                check_file(outputs[name], suffix=".png", exist=False)
+            for name in pdf_files.keys():
+                assert name in outputs, f"Variant {name} has a pdf file but no output!"
+                check_file(pdf_files[name], suffix=".pdf", exist=False)
 
             base_scripts = [self.jquery_script,
                             "$('head').prepend(\"<style>@font-face {font-family: 'customFont';src: url('file:///" + str(
@@ -105,7 +125,8 @@ class WebRenderer:
                             "$('html').css('display', 'flex');",
                             "$('body').css({'margin': '0', 'width': '100%'});",
                             "$('table').css('width', '100%');",
-                            "$('.template_text').css({'display': 'inline-block', 'vertical-align': 'top', 'white-space': 'nowrap'});"]
+                            "$('.template_text').css({'display': 'inline-block', 'vertical-align': 'top', 'white-space': 'nowrap'});",
+                            "$('head').append(" + json.dumps(self._variant_stylesheet(outputs.keys())) + ");"]
 
             script = ";".join(base_scripts + scripts)
 
@@ -116,20 +137,67 @@ class WebRenderer:
                 "marginRight": self.margin / 25.4,
             }
 
-            convert(f'file:///{html_file.resolve()}', str(pdf_file.resolve()), print_options=print_options, script=script)
-
-            # convert pdf to image
-            [image] = convert_from_path(str(pdf_file), last_page=1, dpi=self.dpi)
-            image.save(str(output_file))
+            timings, results = convert_variants(f'file:///{html_file.resolve()}',
+                                                {f"variant_{name}": str(pdf_files.get(name, output_file).resolve())
+                                                 for name, output_file in outputs.items()},
+                                                print_options=print_options, script=script, dpi=self.dpi)
+            for name, values in timings.items():
+                self.timer.record(name, **values)
+
+            # rasterize the printed pdfs within the process
+            for name in pdf_files.keys():
+                self.images[name] = rasterize_pdf(results[f"variant_{name}"], dpi=self.dpi)
+                save_image(outputs[name], self.images[name])
+
+            # the browser captures are placed within the print margins of a page of the pdf size, they may differ
+            # from the rasterized pdf by rounding only and are snapped to its geometry
+            reference_name = next(iter(pdf_files.keys()), "document")
+            assert reference_name in self.images, "The browser captures require a rasterized pdf of the page!"
+            height, width, _ = self.images[reference_name].shape
+            for name in outputs.keys() - pdf_files.keys():
+                capture = self._snap_to_page(load_image(outputs[name]), height=height, width=width)
+                save_image(outputs[name], capture, override=True)
 
         for i in range(5):
             try:
                 inner()
                 return
-            except (IndexError, BadZipfile):
-                print("WARNING: Failed to render A4 page. Retrying!")
+            except (IndexError, BadZipfile, AssertionError, TimeoutError, OSError, CdpError,
+                    WebDriverException) as error:
+                print(f"WARNING: Failed to render A4 page ({type(error).__name__}: {error}). Retrying!")
+                BrowserPool.get().close()  # the idle browsers may be broken as well, the next attempt starts a new one
+                for file in list(outputs.values()) + list(pdf_files.values()):
+                    if file.is_file():
+                        file.unlink()
         raise ValueError("ERROR: Could not render A4 page")
 
+    @classmethod
+    def _snap_to_page(cls, image: np.ndarray, height: int, width: int) -> np.ndarray:
+        deviation = max(abs(image.shape[0] - height), abs(image.shape[1] - width))
+        assert deviation <= cls.MAX_PAGE_DEVIATION, \
+            f"Browser capture of {image.shape[1]}x{image.shape[0]} pixels does not match the page of {width}x{height}!"
+
+        page = np.full((height, width, 3), 255, dtype=np.uint8)
+        page[:image.shape[0], :image.shape[1]] = image[:height, :width]
+        return page
+
+    @classmethod
+    def _variant_stylesheet(cls, names: Iterable[str]) -> str:
+        def scoped(name: str, selector: str) -> str:
+            scope = f"html.variant_{name}"
+            return ", ".join(f"{scope}, {scope} *" if part.strip() == "*" else f"{scope} {part.strip()}"
+                             for part in selector.split(","))
+
+        def important(declarations: str) -> str:
+            return "; ".join(f"{declaration.strip()} !important"
+                             for declaration in declarations.split(";") if len(declaration.strip()) > 0)
+
+        rules = [f"{scoped(name, selector)} {{ {important(declarations)}; }}"
+                 for name in names
+                 for selector, declarations in cls.VARIANT_STYLES[name]]
+
+        return "<style>" + " ".join(rules) + "</style>"
+
     def _extract_template_fields(self, html_file: Path) -> List[BoundingBox]:
         # replaces images with blockers
         resource_folder = html_file.parent / self.template.image_dir.name
@@ -169,11 +237,16 @@ class WebRenderer:
 
         # render image containing colored bounding boxes
         flat_template_structure_file = html_file.parent / "flat_template_structure.png"
-        self._render_a4_page(html_file, output_file=flat_template_structure_file,
-                             scripts=["$('*').css('visibility', 'hidden');",
-                                      "$('img').css('visibility', 'visible');",
-                                      highlight_script])
+        with self.timer("render_template_structure"):
+            self._render_a4_variants(html_file, outputs={"template_structure": flat_template_structure_file},
+                                     scripts=["$('*').css('visibility', 'hidden');",
+                                              "$('img').css('visibility', 'visible');",
+                                              highlight_script])
+
+        with self.timer("bbox_extraction"):
+            return self._find_template_fields(flat_template_structure_file)
 
+    def _find_template_fields(self, flat_template_structure_file: Path) -> List[BoundingBox]:
         # extract bounding boxes from image
         input_image = Image.open(str(flat_template_structure_file))
         forms_image = np.asanyarray(input_image)  # format: (height, width, rgb)
@@ -0,0 +1,42 @@
+import json
+import os
+import socket
+import time
+from pathlib import Path
+from typing import Dict, Iterator
+
+from .util import check_dir
+
+
+class CompletionJournal:
+    # every process appends to its own file to avoid interleaved writes
+
+    def __init__(self, journal_dir: Path):
+        self.journal_dir = journal_dir
+        self.journal_dir.mkdir(exist_ok=True)
+
+    @property
+    def journal_file(self) -> Path:
+        return self.journal_dir / f"{socket.gethostname()}-{os.getpid()}.log"
+
+    def record(self, name: str, split: str, **details):
+        entry = json.dumps({"name": name, "split": split, "time": time.time(), **details})
+
+        with self.journal_file.open("a") as fp:
+            fp.write(entry + "\n")
+            fp.flush()
+            os.fsync(fp.fileno())
+
+    def entries(self) -> Iterator[Dict]:
+        check_dir(self.journal_dir, exist=True)
+
+        for journal_file in sorted(self.journal_dir.glob("*.log")):
+            with journal_file.open("r") as fp:
+                for line in fp:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        pass  # incomplete last line of a crashed process
+
+    def completed(self) -> Iterator[str]:
+        return (entry["name"] for entry in self.entries())
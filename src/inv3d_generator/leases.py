@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Set
+
+
+class LeaseManager:
+    # Coordinates several nodes working on a shared output directory.
+    # A task is claimed by exclusively creating its lease file. Held leases are refreshed by a heartbeat thread.
+    # Leases which were not refreshed within the timeout belong to crashed nodes and can be reclaimed.
+    # Finished tasks keep a done marker so that no other node processes them again.
+    # Lease and done files are spread over hashed subdirectories to keep directories small for millions of tasks.
+    # Expiry compares modification times set by the file server with the time of the server, which is obtained by
+    # touching a probe file, such that the clocks of the nodes need not be synchronized.
+
+    def __init__(self, lease_dir: Path, timeout: float = 300):
+        assert timeout > 0
+
+        self.lease_dir = lease_dir
+        self.lease_dir.mkdir(exist_ok=True)
+        self.timeout = timeout
+        self.owner = f"{socket.gethostname()}-{os.getpid()}"
+        self.probe_file = self.lease_dir / f"{self.owner}.probe"
+
+        self.held = set()  # type: Set[str]
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.heartbeat = threading.Thread(target=self._run_heartbeat, daemon=True)
+
+    def start(self):
+        self.heartbeat.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.heartbeat.join()
+
+        # unfinished tasks can be claimed immediately by other nodes
+        with self.lock:
+            for name in self.held:
+                self._remove(self._lease_file(name))
+            self.held.clear()
+
+        try:
+            self.probe_file.unlink()
+        except FileNotFoundError:
+            pass
+
+    def claim(self, name: str) -> bool:
+        if self._done_file(name).is_file():
+            return False
+
+        if not self._create(name):
+            if not self._reclaim_expired(name) or not self._create(name):
+                return False
+
+        # the task might have been finished after the done check
+        if self._done_file(name).is_file():
+            self.release(name)
+            return False
+
+        return True
+
+    def release(self, name: str):
+        with self.lock:
+            self.held.discard(name)
+            self._remove(self._lease_file(name))
+
+    def complete(self, name: str):
+        with self.lock:
+            self.held.discard(name)
+            self._done_file(name).parent.mkdir(parents=True, exist_ok=True)
+            self._done_file(name).touch()
+            self._remove(self._lease_file(name))
+
+    def _create(self, name: str) -> bool:
+        self._lease_file(name).parent.mkdir(parents=True, exist_ok=True)
+        try:
+            fd = os.open(str(self._lease_file(name)), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+
+        with os.fdopen(fd, "w") as fp:
+            json.dump({"owner": self.owner, "time": time.time()}, fp)
+
+        with self.lock:
+            self.held.add(name)
+        return True
+
+    def _reclaim_expired(self, name: str) -> bool:
+        lease_file = self._lease_file(name)
+
+        try:
+            if not self._is_expired(lease_file):
+                return False
+
+            # only a single node succeeds in moving the expired lease away
+            stale_file = lease_file.with_name(f"{lease_file.name}.{self.owner}.stale")
+            lease_file.rename(stale_file)
+        except FileNotFoundError:
+            return True  # released or reclaimed by another node in the meantime
+
+        if not self._is_expired(stale_file):
+            # another node reclaimed the lease between our check and the rename: give it back
+            try:
+                os.link(str(stale_file), str(lease_file))
+            except FileExistsError:
+                pass
+            stale_file.unlink()
+            return False
+
+        print(f"WARNING: Reclaimed expired lease of task {name}: {stale_file.read_text()}")
+        stale_file.unlink()
+        return True
+
+    def _is_expired(self, lease_file: Path) -> bool:
+        return self._server_time() - lease_file.stat().st_mtime > self.timeout
+
+    def _server_time(self) -> float:
+        # setting the current time without explicit timestamps lets the file server choose it (as for the heartbeat)
+        self.probe_file.touch()
+        os.utime(str(self.probe_file))
+        return self.probe_file.stat().st_mtime
+
+    def _run_heartbeat(self):
+        while not self.stopped.wait(timeout=self.timeout / 4):
+            with self.lock:
+                for name in self.held:
+                    try:
+                        os.utime(str(self._lease_file(name)))
+                    except FileNotFoundError:
+                        print(f"WARNING: Lease of task {name} was lost!")
+
+    def _remove(self, lease_file: Path):
+        try:
+            with lease_file.open("r") as fp:
+                owner = json.load(fp)["owner"]
+
+            # do not remove leases which were reclaimed by another node in the meantime
+            if owner == self.owner:
+                lease_file.unlink()
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+
+    def _lease_file(self, name: str) -> Path:
+        return self._task_dir(name) / f"{name}.lease"
+
+    def _done_file(self, name: str) -> Path:
+        return self._task_dir(name) / f"{name}.done"
+
+    def _task_dir(self, name: str) -> Path:
+        digest = hashlib.sha1(name.encode("utf-8")).hexdigest()
+        return self.lease_dir / digest[:2] / digest[2:4]
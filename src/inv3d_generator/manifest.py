@@ -0,0 +1,179 @@
+import hashlib
+import json
+import sqlite3
+from contextlib import closing
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List
+
+from .util import check_file
+
+
+@dataclass(frozen=True)
+class Task:
+    name: str
+    split: str
+    seed: int
+    env_disabled: bool
+
+    def sample_dir(self, data_dir: Path, layout: str = "flat") -> Path:
+        if layout == "flat":
+            return data_dir / self.split / self.name
+        elif layout == "hashed":
+            # two levels of 256 buckets each keep directories small for millions of samples
+            digest = hashlib.sha1(self.name.encode("utf-8")).hexdigest()
+            return data_dir / self.split / digest[:2] / digest[2:4] / self.name
+        else:
+            raise ValueError(f"Unknown output layout '{layout}'!")
+
+
+class TaskManifest:
+    # Pending tasks are streamed in batches in the order of a random rank, which is stored with each task. The rank is
+    # derived from the task name such that creating the manifest does not change the random state.
+
+    OUTPUT_LAYOUTS = ("flat", "hashed")
+    STATUS_PENDING = "pending"
+    STATUS_DONE = "done"
+    RANK_BITS = 62
+
+    def __init__(self, file: Path):
+        self.file = check_file(file, suffix=".sqlite", exist=True)
+
+    @classmethod
+    def create(cls, file: Path, settings: Dict, tasks: Iterable[Task]) -> "TaskManifest":
+        check_file(file, suffix=".sqlite", exist=False)
+
+        with closing(sqlite3.connect(str(file))) as connection, connection:
+            connection.execute("CREATE TABLE settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            connection.execute("CREATE TABLE tasks (name TEXT PRIMARY KEY, split TEXT NOT NULL, seed INTEGER NOT NULL, "
+                               "env_disabled INTEGER NOT NULL, status TEXT NOT NULL, rank INTEGER NOT NULL)")
+            connection.execute("CREATE INDEX tasks_by_rank ON tasks (status, rank, name)")
+
+            # shared settings are stored only once per split
+            connection.executemany("INSERT INTO settings VALUES (?, ?)",
+                                   [(key, json.dumps(value)) for key, value in settings.items()])
+            connection.executemany("INSERT INTO tasks VALUES (?, ?, ?, ?, ?, ?)",
+                                   ((task.name, task.split, task.seed, int(task.env_disabled), cls.STATUS_PENDING,
+                                     cls.task_rank(task.name))
+                                    for task in tasks))
+
+        return cls(file)
+
+    @classmethod
+    def task_rank(cls, name: str) -> int:
+        digest = hashlib.sha1(name.encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big") >> (64 - cls.RANK_BITS)
+
+    def num_tasks(self, status: str) -> int:
+        with closing(self._connect()) as connection:
+            [count] = connection.execute("SELECT COUNT(*) FROM tasks WHERE status = ?", (status,)).fetchone()
+            return count
+
+    def stream_pending_tasks(self, start_rank: int = 0, batch_size: int = 1000) -> Iterator[Task]:
+        # Yields the pending tasks by rank, starting at the given rank and wrapping around. Every batch is read by a
+        # short transaction, such that tasks completed meanwhile by other processes are skipped.
+        yield from self._stream_tasks(self.STATUS_PENDING, "rank >= ?", (start_rank,), batch_size)
+        yield from self._stream_tasks(self.STATUS_PENDING, "rank < ?", (start_rank,), batch_size)
+
+    def stream_done_tasks(self, batch_size: int = 1000) -> Iterator[Task]:
+        yield from self._stream_tasks(self.STATUS_DONE, "rank >= ?", (0,), batch_size)
+
+    def _stream_tasks(self, status: str, condition: str, parameters: tuple, batch_size: int) -> Iterator[Task]:
+        last = (-1, "")
+        while True:
+            with closing(self._connect()) as connection:
+                rows = connection.execute(f"SELECT name, split, seed, env_disabled, rank FROM tasks "
+                                          f"WHERE status = ? AND {condition} AND (rank, name) > (?, ?) "
+                                          f"ORDER BY rank, name LIMIT ?",
+                                          (status, *parameters, *last, batch_size)).fetchall()
+
+            for name, split, seed, env_disabled, _ in rows:
+                yield Task(name=name, split=split, seed=seed, env_disabled=bool(env_disabled))
+
+            if len(rows) < batch_size:
+                return
+
+            last = (rows[-1][4], rows[-1][0])
+
+    def has_ranks(self) -> bool:
+        # manifests created by earlier versions have no rank column
+        with closing(self._connect()) as connection:
+            return "rank" in [column for _, column, *_ in connection.execute("PRAGMA table_info(tasks)")]
+
+    def add_missing_ranks(self):
+        if self.has_ranks():
+            return
+
+        with closing(self._connect()) as connection, connection:
+            connection.execute("ALTER TABLE tasks ADD COLUMN rank INTEGER NOT NULL DEFAULT 0")
+            names = [name for name, in connection.execute("SELECT name FROM tasks")]
+            connection.executemany("UPDATE tasks SET rank = ? WHERE name = ?",
+                                   ((self.task_rank(name), name) for name in names))
+            connection.execute("CREATE INDEX tasks_by_rank ON tasks (status, rank, name)")
+
+    def done_tasks(self) -> List[Task]:
+        return self._tasks_with_status(self.STATUS_DONE)
+
+    def _tasks_with_status(self, status: str) -> List[Task]:
+        with closing(self._connect()) as connection:
+            rows = connection.execute("SELECT name, split, seed, env_disabled FROM tasks WHERE status = ? "
+                                      "ORDER BY name", (status,))
+            return [Task(name=name, split=split, seed=seed, env_disabled=bool(env_disabled))
+                    for name, split, seed, env_disabled in rows]
+
+    def mark_done(self, names: Iterable[str]):
+        with closing(self._connect()) as connection, connection:
+            connection.executemany("UPDATE tasks SET status = ? WHERE name = ?",
+                                   ((self.STATUS_DONE, name) for name in names))
+
+    def progress(self) -> Dict[str, Dict[str, int]]:
+        # number of tasks per split and status
+        result = {}
+        with closing(self._connect()) as connection:
+            for split, status, count in connection.execute("SELECT split, status, COUNT(*) FROM tasks "
+                                                           "GROUP BY split, status"):
+                result.setdefault(split, {})[status] = count
+        return result
+
+    def update_base_settings(self, values: Dict):
+        with closing(self._connect()) as connection, connection:
+            [base] = connection.execute("SELECT value FROM settings WHERE key = 'base'").fetchone()
+            connection.execute("UPDATE settings SET value = ? WHERE key = 'base'",
+                               (json.dumps({**json.loads(base), **values}),))
+
+        # settings cached by this process are outdated
+        TaskManifest.split_settings.cache_clear()
+
+    def output_layout(self) -> str:
+        # datasets created by earlier versions use the flat layout
+        return self.split_settings(str(self.file), "base").get("output_layout", "flat")
+
+    def task_settings(self, task: Task) -> Dict:
+        settings = self.split_settings(str(self.file), task.split)
+
+        task_settings = {
+            **settings,
+            "seed": task.seed,
+            "name": task.name
+        }
+
+        if task.env_disabled:
+            task_settings["env_files"] = None
+
+        return task_settings
+
+    @staticmethod
+    @lru_cache(maxsize=8)
+    def split_settings(file: str, split: str) -> Dict:
+        # loaded once per process and split; callers must not modify the result
+        with closing(sqlite3.connect(file)) as connection:
+            values = dict(connection.execute("SELECT key, value FROM settings WHERE key IN (?, 'base')", (split,)))
+
+        return {
+            **json.loads(values[split]),
+            **json.loads(values["base"])
+        }
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(str(self.file), timeout=60)
@@ -0,0 +1,207 @@
+import base64
+import hashlib
+import inspect
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .formats import load_json, save_json
+from .util import resize_image
+
+
+class SampleProvenance:
+    # Records for every stage of a sample the code version, settings and input files it used and the files it created.
+    # A stage is stale if its code or settings changed, if one of its outputs is missing or if one of its inputs was
+    # recreated by an earlier stage since. All stages following a stale stage are stale as well.
+    # Files are identified by their size and modification time, hashing the large arrays of every sample would cost
+    # more than some of the stages. Records of earlier versions contain SHA1 hashes instead.
+
+    FILE_NAME = "provenance.json"
+    SUMMARY_FILE_NAME = "details.json"
+
+    STAGE_SOURCES = {
+        "invoice": "invoice",
+        "render": "rendering",
+        "supplementary": "supplementary",
+    }
+    # modules of the stage packages which only transport jobs or schedule them, they do not influence the outputs
+    EXCLUDED_SOURCES = ("invoice/rendering/cdp.py", "rendering/blender_server.py", "rendering/blender_worker_pool.py",
+                        "rendering/priority_lock.py", "rendering/blender/blender_worker.py")
+    SHARED_SOURCES = ("formats.py",)
+    SHARED_FUNCTIONS = (resize_image,)  # helpers of modules otherwise concerned with orchestration
+    STAGE_SETTINGS = {
+        "invoice": ("document_dpi",),
+        "render": ("resolution_rendering",),
+        "supplementary": ("resolution_bm",),
+    }
+    STAGE_INPUTS = {
+        "invoice": (),
+        "render": ("flat_document.png",),
+        "supplementary": ("warped_UV.npz", "warped_WC.npz", "flat_text_mask.png"),
+    }
+    # the invoice stage creates all remaining files of a sample
+    STAGE_OUTPUTS = {
+        "render": ("warped_document.png", "warped_recon.png", "warped_albedo.png", "warped_UV.npz", "warped_WC.npz",
+                   "warped_depth.npz", "warped_normal.npz"),
+        "supplementary": ("warped_BM.npz", "warped_curvature.npz", "warped_angle.npz", "warped_text_mask.npz"),
+    }
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def code_version(stage: str) -> str:
+        # hash of all source files of the stage and the shared sources, computed once per process
+        package_dir = Path(__file__).parent
+        source_dir = package_dir / SampleProvenance.STAGE_SOURCES[stage]
+        excluded = {package_dir / name for name in SampleProvenance.EXCLUDED_SOURCES}
+
+        files = [package_dir / name for name in SampleProvenance.SHARED_SOURCES]
+        files.extend(file for file in sorted(source_dir.rglob("*"))
+                     if file.suffix in [".py", ".js"] and file not in excluded)
+
+        digest = hashlib.sha1()
+        for file in files:
+            digest.update(str(file.relative_to(package_dir)).encode("utf-8"))
+            digest.update(file.read_bytes())
+        for function in SampleProvenance.SHARED_FUNCTIONS:
+            digest.update(inspect.getsource(function).encode("utf-8"))
+        return digest.hexdigest()
+
+    @staticmethod
+    def file_fingerprint(file: Path) -> Dict[str, int]:
+        stat = file.stat()
+        return {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+    @staticmethod
+    def file_hash(file: Path) -> str:
+        digest = hashlib.sha1()
+        with file.open("rb") as fp:
+            for chunk in iter(lambda: fp.read(2 ** 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @classmethod
+    def stage_outputs(cls, sample_dir: Path, stage: str) -> List[str]:
+        if stage in cls.STAGE_OUTPUTS:
+            return [name for name in cls.STAGE_OUTPUTS[stage] if (sample_dir / name).is_file()]
+
+        excluded = {name for names in cls.STAGE_OUTPUTS.values() for name in names}
+        excluded.update([cls.FILE_NAME, cls.SUMMARY_FILE_NAME])
+        return sorted(file.name for file in sample_dir.iterdir() if file.is_file() and file.name not in excluded)
+
+    @classmethod
+    def stage_settings(cls, stage: str, settings: Dict) -> Dict:
+        return {key: settings[key] for key in cls.STAGE_SETTINGS[stage]}
+
+    @classmethod
+    def record(cls, sample_dir: Path, stage: str, settings: Dict, random_state: Optional[Tuple[Any, Any]] = None):
+        # random_state: python and numpy random state at the start of the stage, allows to rerun the stage identically
+        file = sample_dir / cls.FILE_NAME
+        records = load_json(file) if file.is_file() else {}
+
+        # inputs are identified like the outputs of their producing stage
+        records[stage] = {
+            "code": cls.code_version(stage),
+            "settings": cls.stage_settings(stage, settings),
+            "inputs": {name: cls.file_fingerprint(sample_dir / name) for name in cls.STAGE_INPUTS[stage]},
+            "outputs": {name: cls.file_fingerprint(sample_dir / name)
+                        for name in cls.stage_outputs(sample_dir, stage)},
+        }
+
+        if random_state is not None:
+            records[stage]["random_state"] = cls._encode_random_state(*random_state)
+
+        save_json(file, records, exist=None)
+
+    @classmethod
+    def entry_random_state(cls, sample_dir: Path, stage: str) -> Optional[Tuple[Any, Any]]:
+        # None for samples recorded by earlier versions
+        file = sample_dir / cls.FILE_NAME
+        records = load_json(file) if file.is_file() else {}
+
+        if "random_state" not in records.get(stage, {}):
+            return None
+
+        return cls._decode_random_state(records[stage]["random_state"])
+
+    @staticmethod
+    def _encode_random_state(random_state: Tuple, np_random_state: Tuple) -> Dict:
+        # the state words of both Mersenne Twisters are stored compactly as base64 encoded uint32 arrays
+        def encode(words) -> str:
+            return base64.b64encode(np.asarray(words, dtype=np.uint32).tobytes()).decode("ascii")
+
+        version, internal_state, gauss_next = random_state
+        algorithm, keys, pos, has_gauss, cached_gaussian = np_random_state
+        return {
+            "python": [version, encode(internal_state), gauss_next],
+            "numpy": [algorithm, encode(keys), int(pos), int(has_gauss), float(cached_gaussian)],
+        }
+
+    @staticmethod
+    def _decode_random_state(data: Dict) -> Tuple[Any, Any]:
+        def decode(words: str) -> np.ndarray:
+            return np.frombuffer(base64.b64decode(words), dtype=np.uint32)
+
+        version, internal_state, gauss_next = data["python"]
+        algorithm, keys, pos, has_gauss, cached_gaussian = data["numpy"]
+        return ((version, tuple(int(word) for word in decode(internal_state)), gauss_next),
+                (algorithm, decode(keys).copy(), pos, has_gauss, cached_gaussian))
+
+    @classmethod
+    def stale_stages(cls, sample_dir: Path, settings: Dict, stages: Sequence[str], verify: bool = False) -> List[str]:
+        # verify: compare the current files with the recorded ones instead of trusting the records
+        file = sample_dir / cls.FILE_NAME
+        records = load_json(file) if file.is_file() else {}  # samples created without provenance are stale
+
+        for idx, stage in enumerate(stages):
+            if cls._is_stale(sample_dir, stage, settings, records, verify):
+                return list(stages[idx:])
+
+        return []
+
+    @classmethod
+    def _is_stale(cls, sample_dir: Path, stage: str, settings: Dict, records: Dict, verify: bool) -> bool:
+        record = records.get(stage)
+
+        if record is None:
+            return True
+
+        if record["code"] != cls.code_version(stage) or record["settings"] != cls.stage_settings(stage, settings):
+            return True
+
+        for name, identity in record["outputs"].items():
+            if not (sample_dir / name).is_file():
+                return True
+            if verify and not cls._matches(sample_dir / name, identity):
+                return True
+
+        # inputs must still be the outputs recorded by the producing stages
+        produced = {name: identity
+                    for other_stage, other_record in records.items() if other_stage != stage
+                    for name, identity in other_record["outputs"].items()}
+
+        for name, identity in record["inputs"].items():
+            if name in produced and produced[name] != identity:
+                return True
+            if not (sample_dir / name).is_file():
+                return True
+            if verify and not cls._matches(sample_dir / name, identity):
+                return True
+
+        return False
+
+    @classmethod
+    def _matches(cls, file: Path, identity: Union[str, Dict[str, int]]) -> bool:
+        # files of records created by earlier versions are identified by their hash
+        if isinstance(identity, str):
+            return cls.file_hash(file) == identity
+        return cls.file_fingerprint(file) == identity
+
+    @classmethod
+    def remove_outputs(cls, sample_dir: Path, stages: Sequence[str]):
+        # removes the outputs of the given render or supplementary stages before they are created again
+        for stage in stages:
+            for name in cls.STAGE_OUTPUTS[stage]:
+                if (sample_dir / name).is_file():
+                    (sample_dir / name).unlink()
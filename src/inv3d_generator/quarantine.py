@@ -0,0 +1,117 @@
+import json
+import os
+import socket
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set
+
+
+@dataclass(frozen=True)
+class RetryBudget:
+    invoice_attempts: int = 3
+    render_attempts: int = 5
+    quarantine_after: int = 3  # failures after which an asset is skipped by later tasks
+
+
+class AssetQuarantine:
+    # Failures are shared between all processes and nodes through one append-only file per process. The quarantined
+    # assets are read again when a process adds its first failure file, after own failures and otherwise at most every
+    # REFRESH_INTERVAL seconds.
+
+    REFRESH_INTERVAL = 30.0
+
+    def __init__(self, failure_dir: Path, max_failures: int = 3):
+        assert max_failures > 0
+
+        self.failure_dir = failure_dir
+        self.failure_dir.mkdir(exist_ok=True)
+        self.max_failures = max_failures
+        self._quarantined = None  # type: Optional[Set[str]]
+        self._loaded = (0.0, 0)  # monotonic time and directory mtime of the quarantined assets
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def get(failure_dir: Path, max_failures: int = 3) -> "AssetQuarantine":
+        # one instance per process, shared by all its tasks
+        return AssetQuarantine(failure_dir, max_failures)
+
+    @property
+    def failure_file(self) -> Path:
+        return self.failure_dir / f"{socket.gethostname()}-{os.getpid()}.log"
+
+    def record_failure(self, stage: str, task: str, assets: Dict[str, Optional[str]], wall_time: float, error: str):
+        entry = json.dumps({
+            "stage": stage,
+            "task": task,
+            "assets": {kind: str(asset) for kind, asset in assets.items() if asset is not None},
+            "wall_time": wall_time,
+            "error": error,
+            "time": time.time()
+        })
+
+        with self.failure_file.open("a") as fp:
+            fp.write(entry + "\n")
+
+        self._quarantined = None
+
+    def entries(self) -> Iterator[Dict]:
+        for failure_file in sorted(self.failure_dir.glob("*.log")):
+            with failure_file.open("r") as fp:
+                for line in fp:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        pass  # incomplete last line of a crashed process
+
+    def quarantined(self) -> Set[str]:
+        # An asset is quarantined after failing in max_failures distinct tasks. Every failure is also recorded for
+        # the co-drawn assets, so an asset is only blamed if no single co-asset took part in all of its failures.
+        loaded_time, loaded_mtime = self._loaded
+        mtime = self.failure_dir.stat().st_mtime_ns
+        if self._quarantined is None or mtime != loaded_mtime or \
+                time.monotonic() - loaded_time > self.REFRESH_INTERVAL:
+            self._loaded = (time.monotonic(), mtime)
+
+            failed_tasks = defaultdict(set)
+            co_assets = {}
+            for entry in self.entries():
+                assets = set(entry["assets"].values())
+                for asset in assets:
+                    failed_tasks[asset].add(entry["task"])
+                    co_assets[asset] = co_assets.get(asset, assets - {asset}) & assets
+
+            self._quarantined = {asset for asset, tasks in failed_tasks.items()
+                                 if len(tasks) >= self.max_failures and len(co_assets[asset]) == 0}
+
+        return self._quarantined
+
+    def filter(self, candidates: List[str]) -> List[str]:
+        quarantined = self.quarantined()
+        remaining = [candidate for candidate in candidates if str(candidate) not in quarantined]
+
+        if len(remaining) == 0:
+            print("WARNING: All candidate assets are quarantined. Ignoring the quarantine!")
+            return candidates
+
+        return remaining
+
+    def report(self) -> Dict[str, Dict]:
+        quarantined = self.quarantined()
+
+        report = defaultdict(lambda: {"kind": None, "failures": 0, "tasks": set(), "wasted_time": 0.0,
+                                      "quarantined": False})
+        for entry in self.entries():
+            for kind, asset in entry["assets"].items():
+                report[asset]["kind"] = kind
+                report[asset]["failures"] += 1
+                report[asset]["tasks"].add(entry["task"])
+                report[asset]["wasted_time"] += entry["wall_time"]
+                report[asset]["quarantined"] = asset in quarantined
+
+        for details in report.values():
+            details["tasks"] = len(details["tasks"])
+
+        return dict(report)
@@ -0,0 +1,120 @@
+'''
+Long-lived Blender worker.
+
+This script is started once per worker with "blender --background -noaudio --python blender_worker.py".
+It reads one job per line from stdin. A job is a JSON object with a "code_file" and a "config_file" entry.
+Each job runs in a freshly reset scene as if it was started with
+"blender --background --python <code_file> -- <config_file>".
+After each job a single result line prefixed by RESULT_MARKER is written to stdout.
+The worker terminates as soon as stdin is closed.
+
+Note: Blender 2.79 ships with Python 3.5. Keep this file free of newer syntax (e.g. f-strings).
+'''
+import json
+import os
+import resource
+import runpy
+import sys
+import time
+import traceback
+
+import bpy
+
+RESULT_MARKER = "@@INV3D_BLENDER_RESULT@@"
+
+
+def reset_scene():
+    bpy.ops.wm.read_factory_settings()
+
+    # remove data blocks which are not part of the startup scene
+    for bpy_data_iter in (
+            bpy.data.meshes,
+            bpy.data.lamps,
+            bpy.data.images,
+            bpy.data.materials,
+            bpy.data.textures
+    ):
+        for id_data in bpy_data_iter:
+            if id_data.users == 0:
+                bpy_data_iter.remove(id_data, do_unlink=True)
+
+
+def cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def resident_set_size():
+    # current resident set size in bytes
+    with open("/proc/self/statm", "r") as fp:
+        return int(fp.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def reset_peak_rss():
+    # resets the high-water mark of the resident set size (VmHWM), requires Linux 4.0
+    try:
+        with open("/proc/self/clear_refs", "w") as fp:
+            fp.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss(resettable):
+    # the high-water mark is only meaningful for the job if it was reset before
+    if resettable:
+        with open("/proc/self/status", "r") as fp:
+            for line in fp:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+
+    return resident_set_size()
+
+
+def run_job(job):
+    start_time = time.time()
+    start_cpu_time = cpu_time()
+    start_rss = resident_set_size()
+    resettable = reset_peak_rss()
+    exit_code = 0
+
+    try:
+        reset_scene()
+
+        # scripts read their config file from the last command line argument
+        sys.argv = [sys.argv[0], "--", job["config_file"]]
+        runpy.run_path(job["code_file"], run_name="__main__")
+    except SystemExit as e:
+        exit_code = 0 if e.code is None else e.code if isinstance(e.code, int) else 1
+    except Exception:
+        traceback.print_exc()
+        exit_code = 1
+
+    return {
+        "exit_code": exit_code,
+        "wall_time": time.time() - start_time,
+        "cpu_time": cpu_time() - start_cpu_time,
+        # peak memory of the worker process during the job in bytes
+        "max_rss": max(start_rss, peak_rss(resettable))
+    }
+
+
+def send_result(result):
+    # start on a new line since blender might have left an unterminated line in stdout
+    sys.stdout.write("\n" + RESULT_MARKER + json.dumps(result) + "\n")
+    sys.stdout.flush()
+
+
+def main():
+    send_result({"exit_code": 0, "wall_time": 0.0, "ready": True})
+
+    for line in sys.stdin:
+        line = line.strip()
+        if len(line) == 0:
+            continue
+
+        send_result(run_job(json.loads(line)))
+
+
+if __name__ == "__main__":
+    main()
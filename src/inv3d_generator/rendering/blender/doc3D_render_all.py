@@ -0,0 +1,194 @@
+'''
+Renders all groundtruths of a sample within a single blender session.
+
+This combines doc3D_render_mesh.py with the passes of doc3D_render_recon.py, doc3D_render_alb.py,
+doc3D_render_dmap.py and doc3D_render_norm.py. The scene is built only once and all passes are rendered
+from the same in-memory scene. Hence, no .blend file needs to be saved and reopened in between.
+
+Note: Blender 2.79 ships with Python 3.5. Keep this file free of newer syntax (e.g. f-strings).
+'''
+import json
+import random
+import string
+import sys
+from pathlib import Path
+
+import bpy
+
+sys.path.append(str(Path(__file__).resolve().parent))
+
+import doc3D_render_mesh as mesh_pass  # noqa: E402
+
+
+def reset_compositor():
+    bpy.context.scene.use_nodes = True
+    tree = bpy.context.scene.node_tree
+
+    # clear default nodes
+    for n in tree.nodes:
+        tree.nodes.remove(n)
+
+    # create input render layer node
+    render_layers = tree.nodes.new('CompositorNodeRLayers')
+    return tree, render_layers
+
+
+def add_file_output(tree, socket, output_dir, img_name, file_format=None, composite=False):
+    file_output_node = tree.nodes.new('CompositorNodeOutputFile')
+    if file_format is not None:
+        file_output_node.format.file_format = file_format
+    file_output_node.base_path = str(output_dir)
+    file_output_node.file_slots[0].path = img_name
+    tree.links.new(socket, file_output_node.inputs[0])
+
+    if composite:
+        comp_node = tree.nodes.new('CompositorNodeComposite')
+        tree.links.new(socket, comp_node.inputs[0])
+
+
+def texture_material(obj, mat_name, texpath):
+    mesh_pass.select_object(obj)
+    mat = bpy.data.materials.new(mat_name)
+    obj.material_slots[0].material = mat
+    mat.use_nodes = True
+    nodes = mat.node_tree.nodes
+    links = mat.node_tree.links
+
+    # clear default nodes
+    for n in nodes:
+        nodes.remove(n)
+
+    out_node = nodes.new(type='ShaderNodeOutputMaterial')
+    bsdf_node = nodes.new(type='ShaderNodeBsdfDiffuse')
+    texture_node = nodes.new(type='ShaderNodeTexImage')
+    texture_node.image = bpy.data.images.load(texpath)
+    texture_node.extension = 'EXTEND'
+    texturecoord_node = nodes.new(type='ShaderNodeTexCoord')
+
+    links.new(bsdf_node.outputs[0], out_node.inputs[0])
+    links.new(texture_node.outputs[0], bsdf_node.inputs[0])
+    links.new(texture_node.inputs[0], texturecoord_node.outputs[2])
+
+
+def emission_material(obj, mat_name, geometry_output):
+    # geometry outputs: 0 = position (world coordinates), 3 = normal
+    mesh_pass.select_object(obj)
+    mat = bpy.data.materials.new(mat_name)
+    obj.material_slots[0].material = mat
+    mat.use_nodes = True
+    nodes = mat.node_tree.nodes
+    links = mat.node_tree.links
+
+    # clear default nodes
+    for n in nodes:
+        nodes.remove(n)
+
+    mat_node = nodes.new(type='ShaderNodeOutputMaterial')
+    em_node = nodes.new(type='ShaderNodeEmission')
+    geo_node = nodes.new(type='ShaderNodeNewGeometry')
+
+    links.new(geo_node.outputs[geometry_output], em_node.inputs[0])
+    links.new(em_node.outputs[0], mat_node.inputs[0])
+
+
+def set_samples(samples, square):
+    scene = bpy.data.scenes['Scene']
+    scene.cycles.samples = samples
+    scene.cycles.use_square_samples = square
+
+
+def render_passes(mesh, objpath, texpath, chesspath, output_paths):
+    # change output image name to obj file name + texture name + random three
+    # characters (upper lower alphabet and digits)
+    fn = objpath.split('/')[-1][:-4] + '-' + texpath.split('/')[-1][:-4] + '-' + \
+         ''.join(random.sample(string.ascii_letters + string.digits, 3))
+
+    scene = bpy.data.scenes['Scene']
+    scene.render.layers['RenderLayer'].use_pass_uv = True
+
+    # shaded image (render layer outputs: 0 = image, 2 = depth, 4 = uv, 21 = diffuse color)
+    tree, render_layers = reset_compositor()
+    add_file_output(tree, render_layers.outputs[0], output_paths["img"], fn, file_format='PNG')
+    set_samples(128, square=False)
+    bpy.ops.render.render(write_still=False)
+
+    # all remaining passes are rendered without environment
+    mesh_pass.prepare_no_env_render()
+
+    # albedo: the separate albedo pass kept the sample count of the shaded image
+    scene.render.layers['RenderLayer'].use_pass_diffuse_color = True
+    tree, render_layers = reset_compositor()
+    add_file_output(tree, render_layers.outputs[21], output_paths["alb"], fn, composite=True)
+    set_samples(128, square=False)
+    bpy.ops.render.render(write_still=False)
+
+    # uv and depth share a single render
+    tree, render_layers = reset_compositor()
+    add_file_output(tree, render_layers.outputs[4], output_paths["uv"], fn, file_format='OPEN_EXR')
+    add_file_output(tree, render_layers.outputs[2], output_paths["dmap"], fn, file_format='OPEN_EXR')
+    set_samples(1, square=True)
+    bpy.ops.render.render(write_still=False)
+
+    # world coordinates
+    emission_material(mesh, 'wcColor', geometry_output=0)
+    tree, render_layers = reset_compositor()
+    add_file_output(tree, render_layers.outputs[0], output_paths["wc"], fn, file_format='OPEN_EXR')
+    bpy.ops.render.render(write_still=False)
+
+    # normals
+    emission_material(mesh, 'nColor', geometry_output=3)
+    tree, render_layers = reset_compositor()
+    add_file_output(tree, render_layers.outputs[0], output_paths["norm"], fn, file_format='OPEN_EXR')
+    bpy.ops.render.render(write_still=False)
+
+    # checkerboard reconstruction
+    texture_material(mesh, 'reconColor', chesspath)
+    tree, render_layers = reset_compositor()
+    add_file_output(tree, render_layers.outputs[21], output_paths["recon"], fn, composite=True)
+    bpy.ops.render.render(write_still=False)
+
+    return fn
+
+
+def render_all(objpath, texpath, chesspath, envpath, resolution, output_paths):
+    mesh_pass.prepare_scene()
+    mesh_pass.prepare_rendersettings(resolution)
+    bpy.ops.import_scene.obj(filepath=objpath)
+    mesh_name = bpy.data.meshes[0].name
+    mesh = mesh_pass.position_object(mesh_name)
+
+    for f in bpy.data.meshes[0].polygons:
+        f.use_smooth = True
+
+    mesh_pass.add_lighting(envpath)
+    v = mesh_pass.reset_camera(mesh)
+    if not v:
+        return 1
+
+    # add texture
+    mesh_pass.page_texturing(mesh, texpath)
+    render_passes(mesh, objpath, texpath, chesspath, output_paths)
+
+
+def main():
+    config_file = Path(sys.argv[-1])
+
+    with config_file.open("r") as fp:
+        config = json.load(fp)
+
+    random.seed(config["seed"])
+
+    output_base_dir = Path(config["output_base_dir"]).resolve()
+
+    output_names = ["img", "uv", "wc", "recon", "alb", "dmap", "norm"]
+    output_paths = {output_path: output_base_dir / output_path for output_path in output_names}
+
+    for output_path in output_paths.values():
+        output_path.mkdir()
+
+    return render_all(config["obj_file"], config["tex_file"], config["chess_file"], config["env_file"],
+                      config["resolution"], output_paths)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -476,8 +476,8 @@ def main():
 
     # Note: ENV_PATH should be None with a probability of 30 % in order to keep original data generation settings
 
-    render_img(config["obj_file"], config["tex_file"], config["env_file"], config["resolution"], output_paths)
+    return render_img(config["obj_file"], config["tex_file"], config["env_file"], config["resolution"], output_paths)
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
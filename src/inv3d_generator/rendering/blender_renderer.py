@@ -3,15 +3,16 @@ import random
 import shutil
 import tempfile
 from pathlib import Path
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 
-from .blender_server import BlenderServer
+from .blender_server import BlenderServer, BlenderJobResult
 from ..formats import convert_exr_to_npz
-from ..util import check_dir, check_file, print_if
+from ..util import check_asset, check_dir, check_file, print_if, StageTimer
 
 
 class BlenderRenderer:
     BLENDER_DIR = check_dir(Path(__file__).parent / "blender")
+    BLENDER_ALL_FILE = check_file(BLENDER_DIR / "doc3D_render_all.py")
     BLENDER_MESH_FILE = check_file(BLENDER_DIR / "doc3D_render_mesh.py")
     BLENDER_RECON_FILE = check_file(BLENDER_DIR / "doc3D_render_recon.py")
     BLENDER_ALB_FILE = check_file(BLENDER_DIR / "doc3D_render_alb.py")
@@ -19,13 +20,13 @@ class BlenderRenderer:
     BLENDER_NORM_FILE = check_file(BLENDER_DIR / "doc3D_render_norm.py")
 
     def __init__(self, output_dir: Path, tex_file: Path, env_file: Optional[Path], obj_file: Path, chess_file: Path,
-                 resolution: int, summary: Dict, verbose: bool = False):
+                 resolution: int, summary: Dict, combined: bool = False, verbose: bool = False):
         check_dir(output_dir)
         check_file(tex_file, suffix=".png")
-        check_file(obj_file, suffix=".obj")
-        check_file(chess_file, suffix=".png")
+        check_asset(obj_file, suffix=".obj")
+        check_asset(chess_file, suffix=".png")
         if env_file is not None:
-            check_file(env_file, suffix=[".hdr", ".exr"])
+            check_asset(env_file, suffix=(".hdr", ".exr"))
 
         self.output_dir = output_dir
         self.tex_file = tex_file
@@ -34,7 +35,10 @@ class BlenderRenderer:
         self.chess_file = chess_file
         self.resolution = resolution
         self.summary = summary
+        self.combined = combined
         self.verbose = verbose
+        self.render_time = 0.0  # total wall time of all blender passes
+        self.timer = StageTimer(summary.setdefault("timings", {}))
 
     def render(self) -> bool:
         print_if(self.verbose, "Start blender rendering")
@@ -42,39 +46,84 @@ class BlenderRenderer:
         with tempfile.TemporaryDirectory() as tmp_dir:
             tmp_dir = Path(tmp_dir)
 
-            self._render_mesh(tmp_dir=tmp_dir)
+            if self.combined:
+                files = self._render_combined(tmp_dir=tmp_dir)
+            else:
+                files = self._render_separately(tmp_dir=tmp_dir)
 
-            img_file = self._search_file(tmp_dir / "img", suffix=".png")
-            uv_file = self._search_file(tmp_dir / "uv", suffix=".exr")
-            bld_file = self._search_file(tmp_dir / "bld", suffix=".blend")
-            wc_file = self._search_file(tmp_dir / "wc", suffix=".exr")
-
-            if any(file is None for file in (img_file, uv_file, bld_file, wc_file)):
-                print_if(self.verbose, "Abort blender rendering")
-                return False
-
-            recon_file = self._render_recon(tmp_dir=tmp_dir, blender_file=bld_file)
-            alb_file = self._render_alb(tmp_dir=tmp_dir, blender_file=bld_file)
-            dmap_file = self._render_dmap(tmp_dir=tmp_dir, blender_file=bld_file)
-            norm_file = self._render_norm(tmp_dir=tmp_dir, blender_file=bld_file)
-
-            if any(file is None for file in (recon_file, alb_file, dmap_file, norm_file)):
+            if files is None:
                 print_if(self.verbose, "Abort blender rendering")
                 return False
 
             # finalize
-            shutil.copyfile(str(img_file), str(self.output_dir / "warped_document.png"))
-            shutil.copyfile(str(recon_file), str(self.output_dir / "warped_recon.png"))
-            shutil.copyfile(str(alb_file), str(self.output_dir / "warped_albedo.png"))
-            convert_exr_to_npz(uv_file, self.output_dir / "warped_UV.npz")
-            convert_exr_to_npz(wc_file, self.output_dir / "warped_WC.npz")
-            convert_exr_to_npz(dmap_file, self.output_dir / "warped_depth.npz")
-            convert_exr_to_npz(norm_file, self.output_dir / "warped_normal.npz")
+            shutil.copyfile(str(files["img"]), str(self.output_dir / "warped_document.png"))
+            shutil.copyfile(str(files["recon"]), str(self.output_dir / "warped_recon.png"))
+            shutil.copyfile(str(files["alb"]), str(self.output_dir / "warped_albedo.png"))
+            with self.timer("exr_to_npz"):
+                convert_exr_to_npz(files["uv"], self.output_dir / "warped_UV.npz")
+                convert_exr_to_npz(files["wc"], self.output_dir / "warped_WC.npz")
+                convert_exr_to_npz(files["dmap"], self.output_dir / "warped_depth.npz")
+                convert_exr_to_npz(files["norm"], self.output_dir / "warped_normal.npz")
 
             print_if(self.verbose, "Stop blender rendering with success!")
             return True
 
-    def _render_mesh(self, tmp_dir: Path):
+    def _render_combined(self, tmp_dir: Path) -> Optional[Dict[str, Path]]:
+        result = self._render_mesh(tmp_dir=tmp_dir, code_file=self.BLENDER_ALL_FILE, config={
+            "chess_file": str(self.chess_file.resolve()),
+        })
+
+        if not self._check_result(result, name="all"):
+            return None
+
+        files = {
+            "img": self._search_file(result.output_files, tmp_dir / "img", suffix=".png"),
+            "uv": self._search_file(result.output_files, tmp_dir / "uv", suffix=".exr"),
+            "wc": self._search_file(result.output_files, tmp_dir / "wc", suffix=".exr"),
+            "recon": self._search_file(result.output_files, tmp_dir / "recon", suffix=""),
+            "alb": self._search_file(result.output_files, tmp_dir / "alb", suffix=""),
+            "dmap": self._search_file(result.output_files, tmp_dir / "dmap", suffix=""),
+            "norm": self._search_file(result.output_files, tmp_dir / "norm", suffix=""),
+        }
+
+        if any(file is None for file in files.values()):
+            return None
+
+        return files
+
+    def _render_separately(self, tmp_dir: Path) -> Optional[Dict[str, Path]]:
+        result = self._render_mesh(tmp_dir=tmp_dir, code_file=self.BLENDER_MESH_FILE)
+
+        if not self._check_result(result, name="mesh"):
+            return None
+
+        img_file = self._search_file(result.output_files, tmp_dir / "img", suffix=".png")
+        uv_file = self._search_file(result.output_files, tmp_dir / "uv", suffix=".exr")
+        bld_file = self._search_file(result.output_files, tmp_dir / "bld", suffix=".blend")
+        wc_file = self._search_file(result.output_files, tmp_dir / "wc", suffix=".exr")
+
+        if any(file is None for file in (img_file, uv_file, bld_file, wc_file)):
+            return None
+
+        recon_file = self._render_recon(tmp_dir=tmp_dir, blender_file=bld_file)
+        alb_file = self._render_alb(tmp_dir=tmp_dir, blender_file=bld_file)
+        dmap_file = self._render_dmap(tmp_dir=tmp_dir, blender_file=bld_file)
+        norm_file = self._render_norm(tmp_dir=tmp_dir, blender_file=bld_file)
+
+        if any(file is None for file in (recon_file, alb_file, dmap_file, norm_file)):
+            return None
+
+        return {
+            "img": img_file,
+            "uv": uv_file,
+            "wc": wc_file,
+            "recon": recon_file,
+            "alb": alb_file,
+            "dmap": dmap_file,
+            "norm": norm_file,
+        }
+
+    def _render_mesh(self, tmp_dir: Path, code_file: Path, config: Optional[Dict] = None) -> BlenderJobResult:
 
         config_file = tmp_dir / "blender_mesh_config.json"
         with config_file.open("w") as fp:
@@ -83,6 +132,7 @@ class BlenderRenderer:
             self.summary["resolution"] = self.resolution
 
             json.dump(fp=fp, indent=4, obj={
+                **({} if config is None else config),
                 "output_base_dir": str(tmp_dir),
                 "obj_file": str(self.obj_file.resolve()),
                 "tex_file": str(self.tex_file.resolve()),
@@ -91,7 +141,7 @@ class BlenderRenderer:
                 "seed": random.getrandbits(32)
             })
 
-        BlenderServer.execute_script(code_file=self.BLENDER_MESH_FILE, config_file=config_file)
+        return BlenderServer.execute_script(code_file=code_file, config_file=config_file, output_dir=tmp_dir)
 
     def _render_recon(self, tmp_dir: Path, blender_file: Path) -> Optional[Path]:
         return self._render_and_collect(tmp_dir=tmp_dir, blender_file=blender_file, name="recon", config={
@@ -122,17 +172,25 @@ class BlenderRenderer:
         with config_file.open("w") as fp:
             json.dump(fp=fp, indent=4, obj=config)
 
-        code_file = check_file(self.BLENDER_DIR / f"doc3D_render_{name}.py")
-        BlenderServer.execute_script(code_file=code_file, config_file=config_file)
-
-        return self._search_file(output_dir, suffix="")
+        code_file = check_asset(self.BLENDER_DIR / f"doc3D_render_{name}.py")
+        result = BlenderServer.execute_script(code_file=code_file, config_file=config_file, output_dir=output_dir)
 
-    @staticmethod
-    def _search_file(directory: Path, suffix: str) -> Optional[Path]:
-        if not directory.is_dir():
+        if not self._check_result(result, name=name):
             return None
 
-        files = list(directory.glob(f"*{suffix}"))
+        return self._search_file(result.output_files, output_dir, suffix="")
+
+    def _check_result(self, result: BlenderJobResult, name: str) -> bool:
+        self.render_time += result.wall_time
+        self.timer.record(f"blender_{name}", wall_time=result.wall_time, external_cpu_time=result.cpu_time,
+                          max_rss=result.max_rss)
+        print_if(self.verbose, f"Blender pass '{name}' finished with exit code {result.exit_code} "
+                               f"after {result.wall_time:.2f}s")
+        return result.success
+
+    @staticmethod
+    def _search_file(output_files: List[Path], directory: Path, suffix: str) -> Optional[Path]:
+        files = [file for file in output_files if file.parent == directory and file.name.endswith(suffix)]
         if len(files) == 0:
             return None
 
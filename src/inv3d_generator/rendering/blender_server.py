@@ -1,74 +1,102 @@
-import logging
 import os
-import subprocess
+import shutil
+import signal
 import sys
-from multiprocessing import Process
+import tempfile
+import threading
+from dataclasses import dataclass, field
+from multiprocessing import Process, Event
+from multiprocessing.connection import Listener, Client, Connection
 from pathlib import Path
-from time import sleep
+from typing import List, Optional
 
-import requests
-from flask import Flask, request
-
-from inv3d_generator.rendering.priority_lock import PriorityLock
+from inv3d_generator.rendering.blender_worker_pool import BlenderWorkerPool
+from inv3d_generator.rendering.priority_lock import PrioritySemaphore
 from inv3d_generator.util import check_file
 
-# prevent sever print messages
-cli = sys.modules['flask.cli']
-cli.show_server_banner = lambda *x: None
 
-log = logging.getLogger('werkzeug')
-log.disabled = True
+@dataclass
+class BlenderJobResult:
+    exit_code: int
+    wall_time: float
+    output_files: List[Path] = field(default_factory=list)
+    cpu_time: float = 0.0
+    max_rss: int = 0
+
+    @property
+    def success(self) -> bool:
+        return self.exit_code == 0
 
 
 class BlenderServer:
-    PORT = 1234
+    # the socket address is inherited by all worker processes started after the server
+    ADDRESS_ENV = "INV3D_BLENDER_SOCKET"
+
+    def __init__(self, num_slots: int = 1, threads_per_slot: int = 0, max_jobs_per_worker: int = 100):
+        self.socket_dir = Path(tempfile.mkdtemp(prefix="inv3d_blender_"))
+        self.address = str(self.socket_dir / "server.sock")
 
-    def __init__(self):
-        self.p = Process(target=BlenderServer._run, args=(self.PORT,))
+        ready = Event()
+        self.p = Process(target=BlenderServer._run,
+                         args=(self.address, ready, num_slots, threads_per_slot, max_jobs_per_worker))
         self.p.start()
-        self._wait_until_ready()
+        self._wait_until_ready(ready)
+
+        os.environ[self.ADDRESS_ENV] = self.address
 
     def stop(self):
         self.p.terminate()
+        self.p.join()
+        shutil.rmtree(str(self.socket_dir), ignore_errors=True)
 
     @classmethod
-    def execute_script(cls, code_file: Path, config_file: Path):
+    def execute_script(cls, code_file: Path, config_file: Path, output_dir: Optional[Path] = None) -> BlenderJobResult:
         check_file(code_file, suffix=".py")
         check_file(config_file, suffix=".json")
 
-        requests.post(f'http://0.0.0.0:{cls.PORT}/execute', data={
-            'code_file': str(code_file.expanduser().absolute()),
-            'config_file': str(config_file.expanduser().absolute()),
-            'priority': os.getpid()
-        })
+        with Client(os.environ[cls.ADDRESS_ENV], family="AF_UNIX") as conn:
+            conn.send({
+                "code_file": code_file.expanduser().absolute(),
+                "config_file": config_file.expanduser().absolute(),
+                "output_dir": None if output_dir is None else output_dir.expanduser().absolute(),
+                "priority": os.getpid()
+            })
+            return conn.recv()
 
-    @classmethod
-    def _wait_until_ready(cls):
-        while True:
-            try:
-                requests.get(f'http://0.0.0.0:{cls.PORT}/')
-                return
-            except requests.exceptions.ConnectionError:
-                sleep(0.05)
+    def _wait_until_ready(self, ready: Event):
+        while not ready.wait(timeout=1):
+            assert self.p.is_alive(), "Blender server died during startup!"
 
     @staticmethod
-    def _run(port: int):
-        app = Flask(__name__)
-        lock = PriorityLock()
-
-        @app.route('/')
-        def hello_world():
-            return 'Hello, World!'
-
-        @app.route('/execute', methods=['POST'])
-        def execute():
-            with lock(int(request.form["priority"])):
-                code_file = request.form["code_file"]
-                config_file = request.form["config_file"]
-                command = f"blender --background -noaudio --python {code_file} -- {config_file}"
-                process = subprocess.Popen(command, stdout=subprocess.DEVNULL, shell=True)
-                process.wait()
-
-                return "done"
-
-        app.run(host='0.0.0.0', port=port)
+    def _run(address: str, ready: Event, num_slots: int, threads_per_slot: int, max_jobs_per_worker: int):
+        # one blender worker per slot; lower priority values (older worker processes) are served first
+        slots = PrioritySemaphore(num_slots)
+        pool = BlenderWorkerPool(num_workers=num_slots, max_jobs_per_worker=max_jobs_per_worker,
+                                 threads_per_worker=threads_per_slot)
+        print(f"INFO: Blender server uses {num_slots} slot(s) with {pool.threads_per_worker or 'all'} thread(s) each")
+
+        def shutdown(signum, frame):
+            pool.stop()
+            sys.exit(0)
+
+        signal.signal(signal.SIGTERM, shutdown)
+
+        def handle(conn: Connection):
+            with conn:
+                job = conn.recv()
+                with slots(job["priority"]):
+                    result = pool.execute(code_file=job["code_file"], config_file=job["config_file"])
+
+                output_files = []
+                if job["output_dir"] is not None and job["output_dir"].is_dir():
+                    output_files = sorted(file for file in job["output_dir"].rglob("*") if file.is_file())
+
+                conn.send(BlenderJobResult(exit_code=result["exit_code"], wall_time=result["wall_time"],
+                                           output_files=output_files, cpu_time=result.get("cpu_time", 0.0),
+                                           max_rss=result.get("max_rss", 0)))
+
+        with Listener(address, family="AF_UNIX") as listener:
+            ready.set()
+            while True:
+                conn = listener.accept()
+                threading.Thread(target=handle, args=(conn,), daemon=True).start()
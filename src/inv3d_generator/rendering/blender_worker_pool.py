@@ -0,0 +1,153 @@
+import json
+import os
+import queue
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, TextIO
+
+from ..util import check_file
+
+
+class BlenderWorker:
+    WORKER_FILE = check_file(Path(__file__).parent / "blender" / "blender_worker.py")
+    RESULT_MARKER = "@@INV3D_BLENDER_RESULT@@"
+    STARTUP_TIMEOUT = 120  # seconds
+    JOB_TIMEOUT = 1800  # seconds, a hanging blender is killed and the worker restarted
+
+    def __init__(self, max_jobs: int = 100, threads: int = 0, job_timeout: float = JOB_TIMEOUT):
+        assert max_jobs > 0
+        assert threads >= 0
+        assert job_timeout > 0
+
+        self.max_jobs = max_jobs
+        self.threads = threads
+        self.job_timeout = job_timeout
+        self.num_jobs = 0
+        self.process = None
+        self.lines = None  # type: Optional[queue.Queue]
+
+        self._start()
+
+    def execute(self, code_file: Path, config_file: Path) -> Dict:
+        if self.process is None or self.process.poll() is not None:
+            self._start()
+
+        job = {
+            "code_file": str(code_file.expanduser().absolute()),
+            "config_file": str(config_file.expanduser().absolute()),
+        }
+
+        start_time = time.perf_counter()
+        error = "died unexpectedly"
+        try:
+            self.process.stdin.write(json.dumps(job) + "\n")
+            self.process.stdin.flush()
+            result = self._read_result(timeout=self.job_timeout)
+        except BrokenPipeError:
+            result = None
+        except TimeoutError:
+            result, error = None, f"exceeded the job timeout of {self.job_timeout} seconds"
+            self.process.kill()
+
+        if result is None:
+            # blender crashed or hangs: start over with a fresh process
+            print(f"WARNING: Blender worker {error}. Restarting!")
+            self.stop()
+            self._start()
+            return {"exit_code": -1, "wall_time": time.perf_counter() - start_time}
+
+        self.num_jobs += 1
+        if self.num_jobs >= self.max_jobs:
+            # recycle worker to get rid of leaked memory
+            self.stop()
+            self._start()
+
+        return result
+
+    def stop(self):
+        if self.process is None:
+            return
+
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=10)
+        except (BrokenPipeError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+
+        self.process = None
+
+    def _start(self):
+        command = ["blender", "--background", "-noaudio"]
+        if self.threads > 0:
+            command += ["--threads", str(self.threads)]  # fixed number of render threads
+        command += ["--python", str(self.WORKER_FILE)]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        universal_newlines=True, errors="replace", bufsize=1)
+        self.num_jobs = 0
+
+        # the output is read by a thread, such that results can be awaited with a timeout
+        self.lines = queue.Queue()
+        threading.Thread(target=BlenderWorker._forward_lines, args=(self.process.stdout, self.lines),
+                         daemon=True).start()
+
+        try:
+            result = self._read_result(timeout=self.STARTUP_TIMEOUT)
+        except TimeoutError:
+            self.process.kill()
+            result = None
+        assert result is not None and result.get("ready", False), "Could not start blender worker!"
+
+    @staticmethod
+    def _forward_lines(stdout: TextIO, lines: queue.Queue):
+        for line in stdout:
+            lines.put(line)
+        lines.put(None)  # blender exited
+
+    def _read_result(self, timeout: float) -> Optional[Dict]:
+        # skip all blender output until the worker reports the job result, None if blender exits before
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                line = self.lines.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                raise TimeoutError(f"No result from blender within {timeout} seconds!")
+
+            if line is None:
+                return None
+
+            idx = line.find(self.RESULT_MARKER)
+            if idx >= 0:
+                return json.loads(line[idx + len(self.RESULT_MARKER):])
+
+
+class BlenderWorkerPool:
+
+    def __init__(self, num_workers: int = 1, max_jobs_per_worker: int = 100, threads_per_worker: int = 0,
+                 job_timeout: float = BlenderWorker.JOB_TIMEOUT):
+        assert num_workers > 0
+
+        if threads_per_worker <= 0:
+            # split all cores evenly to avoid oversubscription of concurrent renders
+            threads_per_worker = 0 if num_workers == 1 else max(1, (os.cpu_count() or 1) // num_workers)
+
+        self.threads_per_worker = threads_per_worker
+        self.workers = [BlenderWorker(max_jobs=max_jobs_per_worker, threads=threads_per_worker, job_timeout=job_timeout)
+                        for _ in range(num_workers)]
+        self._idle_workers = queue.Queue()
+
+        for worker in self.workers:
+            self._idle_workers.put(worker)
+
+    def execute(self, code_file: Path, config_file: Path) -> Dict:
+        worker = self._idle_workers.get()
+        try:
+            return worker.execute(code_file=code_file, config_file=config_file)
+        finally:
+            self._idle_workers.put(worker)
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
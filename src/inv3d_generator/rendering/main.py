@@ -3,27 +3,44 @@ from pathlib import Path
 from typing import *
 
 from .blender_renderer import BlenderRenderer
+from ..quarantine import AssetQuarantine
 from ..util import check_dir, check_file
 
 
 def render_3d(output_dir: Path, tex_file: Path, assets_dir: Path, rel_env_files: Optional[List[str]],
-              rel_obj_file: List[str], resolution: int, summary: Dict, verbose: bool = False):
+              rel_obj_file: List[str], resolution: int, summary: Dict, combined_render: bool = False,
+              max_attempts: int = 5, quarantine: Optional[AssetQuarantine] = None, task_name: str = "",
+              verbose: bool = False):
     check_dir(output_dir)
     check_file(tex_file, suffix=".png")
     check_dir(assets_dir)
+    assert max_attempts > 0
 
-    success = False
-    while not success:
-        env_file = None if rel_env_files is None else assets_dir / random.choice(rel_env_files)
+    for attempt in range(max_attempts):
+        if quarantine is not None:
+            rel_env_files = None if rel_env_files is None else quarantine.filter(rel_env_files)
+            rel_obj_file = quarantine.filter(rel_obj_file)
+
+        rel_env_file = None if rel_env_files is None else random.choice(rel_env_files)
+        rel_obj = random.choice(rel_obj_file)
         blender_renderer = BlenderRenderer(output_dir=output_dir,
                                            tex_file=tex_file,
-                                           env_file=env_file,
-                                           obj_file=assets_dir / random.choice(rel_obj_file),
+                                           env_file=None if rel_env_file is None else assets_dir / rel_env_file,
+                                           obj_file=assets_dir / rel_obj,
                                            chess_file=assets_dir / "chess48.png",
                                            resolution=resolution,
                                            summary=summary,
+                                           combined=combined_render,
                                            verbose=verbose)
-        success = blender_renderer.render()
 
-        if not success:
-            print("WARNING: Failed to render 3D warping. Retrying!")
+        if blender_renderer.render():
+            return
+
+        print(f"WARNING: Failed to render 3D warping in attempt {attempt + 1} of {max_attempts}!")
+
+        if quarantine is not None:
+            quarantine.record_failure(stage="render", task=task_name,
+                                      assets={"mesh": rel_obj, "environment": rel_env_file},
+                                      wall_time=blender_renderer.render_time, error="blender rendering failed")
+
+    raise ValueError(f"ERROR: Could not render 3D warping within {max_attempts} attempts")
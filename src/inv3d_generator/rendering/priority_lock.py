@@ -1,10 +1,12 @@
 # Source: https://gist.github.com/timofurrer/db44ad05ffffd74f73384e2eb0bfb682
+# Extended to a semaphore with multiple slots.
 
+import itertools
 import queue
 import threading
 
 
-class PriorityLock:
+class PrioritySemaphore:
     class _Context:
         def __init__(self, lock, priority):
             self._lock = lock
@@ -16,30 +18,39 @@ class PriorityLock:
         def __exit__(self, exc_type, exc_val, exc_tb):
             self._lock.release()
 
-    def __init__(self):
+    def __init__(self, value: int = 1):
+        assert value > 0
+
         self._lock = threading.Lock()
         self._acquire_queue = queue.PriorityQueue()
-        self._need_to_wait = False
+        self._counter = itertools.count()  # keeps waiters with equal priority in FIFO order
+        self._free_slots = value
 
     def acquire(self, priority):
         with self._lock:
-            if not self._need_to_wait:
-                self._need_to_wait = True
+            if self._free_slots > 0:
+                self._free_slots -= 1
                 return True
 
             event = threading.Event()
-            self._acquire_queue.put((priority, event))
+            self._acquire_queue.put((priority, next(self._counter), event))
         event.wait()
         return True
 
     def release(self):
         with self._lock:
             try:
-                _, event = self._acquire_queue.get_nowait()
+                _, _, event = self._acquire_queue.get_nowait()
             except queue.Empty:
-                self._need_to_wait = False
+                self._free_slots += 1
             else:
-                event.set()
+                event.set()  # hand over the slot directly
 
     def __call__(self, priority):
         return self._Context(self, priority)
+
+
+class PriorityLock(PrioritySemaphore):
+
+    def __init__(self):
+        super().__init__(value=1)
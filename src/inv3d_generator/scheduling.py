@@ -0,0 +1,90 @@
+import heapq
+import random
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+from .invoice.template import Template
+from .manifest import Task
+
+
+class CostModel:
+    # Linear model of the wall time of a task, fitted to the stage timings recorded in the journal.
+    # Only features known before a task starts are used: the template is found by replaying the first random choice
+    # of the invoice stage, meshes are chosen later and are therefore unknown.
+
+    FEATURES = ("constant", "environment", "products")
+    PRIOR = np.array([1.0, 0.5, 0.05])  # relative costs used until enough timings are recorded
+    MIN_SAMPLES = 20
+    MAX_SAMPLES = 10000
+
+    def __init__(self, coefficients: np.ndarray, num_samples: int = 0):
+        self.coefficients = coefficients
+        self.num_samples = num_samples
+
+    @classmethod
+    def fit(cls, features: Dict[str, np.ndarray], wall_times: Dict[str, float]) -> "CostModel":
+        names = [name for name in wall_times if name in features]
+
+        if len(names) < cls.MIN_SAMPLES:
+            return cls(cls.PRIOR)
+
+        x = np.stack([features[name] for name in names])
+        y = np.array([wall_times[name] for name in names])
+        coefficients, _, _, _ = np.linalg.lstsq(x, y, rcond=None)
+
+        return cls(coefficients, num_samples=len(names))
+
+    @property
+    def fitted(self) -> bool:
+        return self.num_samples > 0
+
+    def predict(self, features: np.ndarray) -> float:
+        return float(features @ self.coefficients)
+
+    def __repr__(self):
+        terms = ", ".join(f"{name} {value:.3f}" for name, value in zip(self.FEATURES, self.coefficients))
+        source = f"fitted on {self.num_samples} samples" if self.fitted else "prior"
+        return f"CostModel({terms}; {source})"
+
+    @staticmethod
+    def task_features(task: Task, settings: Dict) -> np.ndarray:
+        # same random calls as Inv3DGenerator._prepare_task and the invoice stage (ignoring quarantined assets)
+        rng = random.Random(task.seed)
+        rng.getrandbits(32)
+        template_file = Path(settings["assets_dir"]) / rng.choice(settings["template_files"])
+
+        return np.array([1.0, 0.0 if task.env_disabled else 1.0, Template.count_products(template_file)])
+
+
+def schedule_tasks(tasks: Iterable[Task], cost: Callable[[Task], float], num_tasks: int,
+                   tail_fraction: float = 0.2, max_tail: int = 10000) -> Iterator[Task]:
+    # The given (shuffled) order is kept for most tasks. The cheapest tasks are moved to the end of the run and started
+    # longest first: expensive tasks finish while the cheap ones fill the remaining workers, so that all workers run
+    # out of work at nearly the same time.
+    # The tasks are streamed: only the tail, at most max_tail tasks, is kept in a heap whose most expensive task is
+    # yielded as soon as a cheaper one arrives.
+    assert 0 <= tail_fraction <= 1 and max_tail >= 0
+
+    num_tail = min(int(round(tail_fraction * num_tasks)), max_tail)
+    tail = []  # type: List[Tuple[float, int, Task]]
+
+    for index, task in enumerate(tasks):
+        item = (-cost(task), index, task)  # max-heap by cost, ties are broken by the stream order
+        if len(tail) < num_tail:
+            heapq.heappush(tail, item)
+        elif len(tail) > 0 and item > tail[0]:
+            yield heapq.heapreplace(tail, item)[2]
+        else:
+            yield task
+
+    yield from (task for _, _, task in sorted(tail))
+
+
+def recorded_wall_times(entries: Iterable[Dict], stages: Iterable[str]) -> Dict[str, float]:
+    # total wall time of all stages per sample, the last entry of a sample is used
+    stages = list(stages)
+    return {entry["name"]: sum(entry["timings"][stage]["wall_time"] for stage in stages)
+            for entry in entries
+            if all(stage in entry.get("timings", {}) for stage in stages)}
@@ -0,0 +1,134 @@
+import json
+import shutil
+import tarfile
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from .util import check_dir, check_file, list_files
+
+
+class ShardWriter:
+    # Packs finished samples into tar shards with a fixed number of samples each (WebDataset layout).
+    # Each tar member is named "<sample>.<file>". A shard is complete as soon as its sidecar index exists.
+    # The index stores the data offset and size of every member for random access without unpacking.
+    # With remove_packed, sample directories are removed once the index of their shard has been written.
+
+    def __init__(self, shard_dir: Path, samples_per_shard: int = 1000, prefix: str = "shard",
+                 remove_packed: bool = False):
+        assert samples_per_shard > 0
+
+        self.shard_dir = shard_dir
+        self.shard_dir.mkdir(parents=True, exist_ok=True)
+        self.samples_per_shard = samples_per_shard
+        self.prefix = prefix
+        self.remove_packed = remove_packed
+
+        self.packed_samples = self._load_packed_samples(sorted(self.shard_dir.glob("*.json")))
+        self.shard_idx = len(list(self.shard_dir.glob(f"{prefix}-[0-9]*.json")))
+
+        self.tar = None  # type: Optional[tarfile.TarFile]
+        self.index = {}  # type: Dict[str, Dict[str, Dict[str, int]]]
+        self.sample_dirs = []  # type: List[Path]  # samples of the open shard
+
+    @property
+    def shard_file(self) -> Path:
+        return self.shard_dir / f"{self.prefix}-{self.shard_idx:06d}.tar"
+
+    @property
+    def index_file(self) -> Path:
+        return self.shard_file.with_suffix(".json")
+
+    def add(self, sample: str, sample_dir: Path):
+        if sample in self.packed_samples:
+            return
+
+        check_dir(sample_dir, exist=True)
+
+        if self.tar is None:
+            # overrides incomplete shards of crashed runs
+            self.tar = tarfile.open(str(self.shard_file), "w")
+
+        members = {}
+        for file in sorted(list_files(sample_dir, recursive=True)):
+            info = self.tar.gettarinfo(str(file), arcname=f"{sample}.{file.relative_to(sample_dir).as_posix()}")
+            with file.open("rb") as fp:
+                self.tar.addfile(info, fp)
+
+            # data blocks are padded to full records and directly precede the current offset
+            padded_size = -(-info.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+            members[info.name] = {"offset": self.tar.offset - padded_size, "size": info.size}
+
+        self.index[sample] = members
+        self.sample_dirs.append(sample_dir)
+        self.packed_samples.add(sample)
+
+        if len(self.index) >= self.samples_per_shard:
+            self._finish_shard()
+
+    def close(self):
+        if self.tar is not None:
+            self._finish_shard()
+
+    def _finish_shard(self):
+        self.tar.close()
+
+        # the index is written last and atomically since it marks the shard as complete
+        tmp_file = self.index_file.with_suffix(".tmp")
+        with tmp_file.open("w") as fp:
+            json.dump({"shard": self.shard_file.name, "samples": self.index}, fp)
+        tmp_file.replace(self.index_file)
+
+        # samples are only removed once they are recoverable from a complete shard
+        if self.remove_packed:
+            for sample_dir in self.sample_dirs:
+                if sample_dir.is_dir():
+                    shutil.rmtree(sample_dir)
+
+        self.tar = None
+        self.index = {}
+        self.sample_dirs = []
+        self.shard_idx += 1
+
+    @staticmethod
+    def _load_packed_samples(index_files: List[Path]) -> Set[str]:
+        samples = set()
+        for index_file in index_files:
+            with index_file.open("r") as fp:
+                samples.update(json.load(fp)["samples"].keys())
+        return samples
+
+    def __enter__(self) -> "ShardWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ShardReader:
+
+    def __init__(self, shard_dir: Path):
+        check_dir(shard_dir, exist=True)
+
+        # sample -> (shard file, members)
+        self.samples = {}
+        for index_file in sorted(shard_dir.glob("*.json")):
+            with index_file.open("r") as fp:
+                index = json.load(fp)
+            for sample, members in index["samples"].items():
+                self.samples[sample] = (shard_dir / index["shard"], members)
+
+    def sample_names(self) -> List[str]:
+        return sorted(self.samples.keys())
+
+    def file_names(self, sample: str) -> List[str]:
+        _, members = self.samples[sample]
+        return [name[len(sample) + 1:] for name in members.keys()]
+
+    def read(self, sample: str, file_name: str) -> bytes:
+        shard_file, members = self.samples[sample]
+        member = members[f"{sample}.{file_name}"]
+
+        with check_file(shard_file, suffix=".tar", exist=True).open("rb") as fp:
+            fp.seek(member["offset"])
+            return fp.read(member["size"])
+
@@ -1,7 +1,13 @@
+import concurrent.futures
 import os
+import resource
 import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Union, Dict, Optional
+from typing import List, Union, Dict, Optional, Iterable, Iterator, Callable, Tuple, Any
 
 import cv2
 import numpy as np
@@ -59,6 +65,12 @@ def check_file(file: Union[str, Path], suffix: Union[None, str, List[str]] = Non
     return file
 
 
+@lru_cache(maxsize=None)
+def check_asset(file: Union[str, Path], suffix: Union[None, str, Tuple[str, ...]] = None) -> Path:
+    # assets do not change during a run: checked once per process, failed checks are not cached
+    return check_file(file, suffix=suffix)
+
+
 def list_files(search_dir: Path, suffixes: List[str] = None, recursive: bool = False, as_string: bool = False):
     assert search_dir.is_dir()
 
@@ -115,3 +127,190 @@ def resize_image(image: np.ndarray, size: int) -> np.ndarray:
 def print_if(verbose: bool, message: str):
     if verbose:
         print(f"PID {os.getpid()}: {message}")
+
+
+def submit_windowed(executor: concurrent.futures.Executor, fn: Callable, items: Iterable,
+                    max_pending: Union[int, Callable[[], int]], *args,
+                    poll_interval: Optional[float] = None) -> Iterator[Tuple[Any, concurrent.futures.Future]]:
+    # submits fn(item, *args) for each item while keeping at most max_pending futures in flight
+    # yields (item, future) pairs in order of completion
+    # max_pending may be a function returning the current limit; it is checked again at least every poll_interval
+    get_max_pending = max_pending if callable(max_pending) else lambda: max_pending
+    assert get_max_pending() > 0
+
+    remaining_items = iter(items)
+    pending = {}
+    exhausted = False
+
+    try:
+        while True:
+            while not exhausted and len(pending) < get_max_pending():
+                item = next(remaining_items, None)
+                if item is None:
+                    exhausted = True
+                    break
+                pending[executor.submit(fn, item, *args)] = item
+
+            if len(pending) == 0:
+                return
+
+            done, _ = concurrent.futures.wait(pending.keys(), timeout=poll_interval,
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future
+    finally:
+        # only relevant if the consumer stops early (e.g. KeyboardInterrupt)
+        for future in pending:
+            future.cancel()
+
+
+class StageTimer:
+    # collects wall time, cpu time and peak memory of named sections into the given dictionary
+    # the cpu time of long-lived helper processes (blender server, browser) is recorded explicitly as external cpu time
+    # the peak memory of a section is the high-water mark of the resident set size within the section, nested sections
+    # of the same process are supported
+    # repeated sections (e.g. retries) are accumulated
+
+    _open_peaks = []  # type: List[int]  # peak rss of the open sections of this process, innermost last
+
+    def __init__(self, timings: Dict[str, Dict]):
+        self.timings = timings
+
+    @contextmanager
+    def __call__(self, name: str):
+        StageTimer._update_peaks()
+        StageTimer._open_peaks.append(resident_set_size())
+        reset_peak_rss()
+
+        start_time = time.perf_counter()
+        start_cpu_time = StageTimer._cpu_time()
+
+        try:
+            yield
+        finally:
+            StageTimer._update_peaks()
+
+            self.record(name,
+                        wall_time=time.perf_counter() - start_time,
+                        cpu_time=StageTimer._cpu_time() - start_cpu_time,
+                        max_rss=StageTimer._open_peaks.pop())
+
+    def record(self, name: str, wall_time: float, cpu_time: float = 0.0, external_cpu_time: float = 0.0,
+               max_rss: int = 0):
+        entry = self.timings.setdefault(name, {
+            "count": 0,
+            "wall_time": 0.0,
+            "cpu_time": 0.0,
+            "external_cpu_time": 0.0,
+            "max_rss": 0
+        })
+
+        entry["count"] += 1
+        entry["wall_time"] += wall_time
+        entry["cpu_time"] += cpu_time
+        entry["external_cpu_time"] += external_cpu_time
+        entry["max_rss"] = max(entry["max_rss"], max_rss)  # in bytes
+
+    @staticmethod
+    def _update_peaks():
+        # the high-water mark is reset at the start of every section, the open sections keep the peaks seen so far
+        peak = peak_rss()
+        StageTimer._open_peaks[:] = [max(open_peak, peak) for open_peak in StageTimer._open_peaks]
+
+    @staticmethod
+    def _cpu_time() -> float:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_utime + usage.ru_stime
+
+
+def resident_set_size() -> int:
+    # current resident set size of this process in bytes
+    with open("/proc/self/statm", "r") as fp:
+        return int(fp.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def process_tree_cpu_time(pid: int) -> float:
+    # cpu time of a process and all its descendants in seconds, including terminated descendants which were waited for
+    if not proc_children_available():
+        return _scanned_process_tree_cpu_time(pid)
+
+    # the tree is walked along the children lists of the threads of each process
+    ticks = 0
+    remaining = [pid]
+    while len(remaining) > 0:
+        process = remaining.pop()
+        try:
+            ticks += _read_process_stat(Path(f"/proc/{process}/stat"))[1]
+            for thread in os.listdir(f"/proc/{process}/task"):
+                with open(f"/proc/{process}/task/{thread}/children", "r") as fp:
+                    remaining.extend(int(child) for child in fp.read().split())
+        except OSError:
+            continue  # process terminated meanwhile
+
+    return ticks / os.sysconf("SC_CLK_TCK")
+
+
+@lru_cache(maxsize=None)
+def proc_children_available() -> bool:
+    # /proc/<pid>/task/<tid>/children requires a kernel with CONFIG_PROC_CHILDREN, checked once per process
+    return Path(f"/proc/self/task/{os.getpid()}/children").is_file()
+
+
+def _scanned_process_tree_cpu_time(pid: int) -> float:
+    # without children lists, the parents of all processes are read
+    parents = {}
+    cpu_times = {}
+    for stat_file in Path("/proc").glob("[0-9]*/stat"):
+        try:
+            parents[int(stat_file.parent.name)], cpu_times[int(stat_file.parent.name)] = _read_process_stat(stat_file)
+        except OSError:
+            continue  # process terminated meanwhile
+
+    children = defaultdict(list)
+    for child, parent in parents.items():
+        children[parent].append(child)
+
+    ticks = 0
+    remaining = [pid]
+    while len(remaining) > 0:
+        process = remaining.pop()
+        ticks += cpu_times.get(process, 0)
+        remaining.extend(children[process])
+
+    return ticks / os.sysconf("SC_CLK_TCK")
+
+
+def _read_process_stat(stat_file: Path) -> Tuple[int, int]:
+    # parent pid and cpu ticks of the process and its waited for children
+    with stat_file.open("r") as fp:
+        fields = fp.read().rsplit(")", 1)[1].split()
+
+    # ppid, utime, stime, cutime and cstime are the 4th, 14th, 15th, 16th and 17th field of the stat file
+    return int(fields[1]), sum(int(value) for value in fields[11:15])
+
+
+@lru_cache(maxsize=None)
+def peak_rss_resettable() -> bool:
+    # resetting the high-water mark of the resident set size (VmHWM) requires Linux 4.0, checked once per process
+    return reset_peak_rss()
+
+
+def reset_peak_rss() -> bool:
+    try:
+        with open("/proc/self/clear_refs", "w") as fp:
+            fp.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss() -> int:
+    # high-water mark of the resident set size in bytes since the last reset_peak_rss
+    # without support for resetting, only the current resident set size is meaningful
+    if peak_rss_resettable():
+        with open("/proc/self/status", "r") as fp:
+            for line in fp:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+
+    return resident_set_size()
@@ -0,0 +1,68 @@
+import argparse
+from pathlib import Path
+
+from inv3d_generator.generator import Inv3DGenerator
+from inv3d_generator.invoice.rendering.pyhtml2pdf import BrowserPool
+from inv3d_generator.quarantine import RetryBudget
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output_dir', nargs='?', type=str, default='./out/inv3d',
+                        help='Path of the generated dataset')
+    parser.add_argument('--from_stage', nargs='?', type=str, default='invoice', choices=Inv3DGenerator.STAGES,
+                        help='First stage checked for changes. Earlier stages are considered up to date')
+    parser.add_argument('--force', nargs='?', type=bool, default=False,
+                        help='Rerun all stages starting at from_stage, even if they are up to date')
+    parser.add_argument('--verify_hashes', nargs='?', type=bool, default=False,
+                        help='Compare the size and modification time of all sample files with the recorded ones '
+                             'to detect modifications. Samples recorded by earlier versions are hashed')
+    parser.add_argument('--document_dpi', nargs='?', type=int, default=0,
+                        help='New Y-resolution of the flat documents (0: unchanged)')
+    parser.add_argument('--resolution_rendering', nargs='?', type=int, default=0,
+                        help='New X and Y-resolution for warped image rendering (0: unchanged)')
+    parser.add_argument('--resolution_bm', nargs='?', type=int, default=0,
+                        help='New X and Y-resolution for backward mapping (0: unchanged)')
+    parser.add_argument('--num_workers', nargs='?', type=int, default=0,
+                        help='Number of processes working in parallel to regenerate samples')
+    parser.add_argument('--max_pending', nargs='?', type=int, default=0,
+                        help='Maximum number of submitted but unfinished samples (0: twice the number of workers)')
+    parser.add_argument('--verbose', nargs='?', type=bool, default=False,
+                        help='Display detailed information. Only applicable for sequential regeneration')
+    parser.add_argument('--combined_render', nargs='?', type=bool, default=False,
+                        help='Render all Blender passes of a sample within a single Blender session')
+    parser.add_argument('--blender_slots', nargs='?', type=int, default=1,
+                        help='Number of Blender renders running concurrently')
+    parser.add_argument('--blender_threads', nargs='?', type=int, default=0,
+                        help='Render threads per Blender slot (0: split all cores evenly between slots)')
+    parser.add_argument('--browser_backend', nargs='?', type=str, default='selenium', choices=BrowserPool.BACKENDS,
+                        help='Control Chrome through chromedriver ("selenium") or directly through the DevTools '
+                             'protocol ("cdp", no driver download required)')
+    parser.add_argument('--invoice_attempts', nargs='?', type=int, default=3,
+                        help='Maximum number of attempts to create the flat invoice of a sample')
+    parser.add_argument('--render_attempts', nargs='?', type=int, default=5,
+                        help='Maximum number of attempts to render the warped document of a sample')
+    parser.add_argument('--quarantine_after', nargs='?', type=int, default=3,
+                        help='Number of failures after which an asset is no longer used by later tasks')
+    args = parser.parse_args()
+
+    for key, value in args.__dict__.items():
+        print(f"SETTING {key}: {value}")
+
+    settings = {key: getattr(args, key)
+                for key in ["document_dpi", "resolution_rendering", "resolution_bm"]
+                if getattr(args, key) > 0}
+
+    gen = Inv3DGenerator(Path(args.output_dir), resume=True)
+    gen.regenerate(num_workers=args.num_workers, from_stage=args.from_stage, force=args.force,
+                   verify=args.verify_hashes, settings=settings, max_pending=args.max_pending, verbose=args.verbose,
+                   combined_render=args.combined_render, blender_slots=args.blender_slots,
+                   blender_threads=args.blender_threads,
+                   retry_budget=RetryBudget(invoice_attempts=args.invoice_attempts,
+                                            render_attempts=args.render_attempts,
+                                            quarantine_after=args.quarantine_after),
+                   browser_backend=args.browser_backend)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 import argparse
 from pathlib import Path
 
+from inv3d_generator.cli import add_processing_arguments, process_tasks
 from inv3d_generator.generator import Inv3DGenerator
 
 
@@ -8,10 +9,9 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--output_dir', nargs='?', type=str, default='./out/inv3d',
                         help='Path to store generated dataset')
-    parser.add_argument('--num_workers', nargs='?', type=int, default=0,
-                        help='Number of processes working in parallel to generate dataset')
-    parser.add_argument('--verbose', nargs='?', type=bool, default=False,
-                        help='Display detailed information. Only applicable for sequential task generation')
+    parser.add_argument('--progress_only', nargs='?', type=bool, default=False,
+                        help='Only report the progress of the dataset generation')
+    add_processing_arguments(parser)
     args = parser.parse_args()
     output_dir = Path(args.output_dir)
 
@@ -19,7 +19,15 @@ def main():
         print(f"SETTING {key}: {value}")
 
     gen = Inv3DGenerator(output_dir, resume=True)
-    gen.process_tasks(num_workers=args.num_workers, verbose=args.verbose)
+
+    if args.progress_only:
+        gen.sync_journal()
+        gen.report_progress()
+        gen.report_failures(args.quarantine_after)
+        gen.report_timings()
+        return
+
+    process_tasks(gen, args)
 
 
 if __name__ == "__main__":
@@ -2,6 +2,7 @@ import argparse
 import shutil
 from pathlib import Path
 
+from inv3d_generator.cli import add_processing_arguments, process_tasks
 from inv3d_generator.generator import Inv3DGenerator
 
 
@@ -9,12 +10,11 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--output_dir', nargs='?', type=str, default='./out/inv3d',
                         help='Path to store generated dataset')
-    parser.add_argument('--num_workers', nargs='?', type=int, default=0,
-                        help='Number of processes working in parallel to generate dataset')
     parser.add_argument('--num_samples', nargs='?', type=int, default=100,
                         help='Path to store generated dataset')
-    parser.add_argument('--verbose', nargs='?', type=bool, default=False,
-                        help='Display detailed information. Only applicable for sequential task generation')
+    parser.add_argument('--output_layout', nargs='?', type=str, default='flat', choices=['flat', 'hashed'],
+                        help='Directory layout of the samples. "hashed" spreads samples over hashed subdirectories')
+    add_processing_arguments(parser)
     parser.add_argument('--override', nargs='?', type=bool, default=False,
                         help='CAUTION: clears existing output_path!')
     subparsers = parser.add_subparsers()
@@ -45,7 +45,7 @@ def main():
             shutil.rmtree(str(output_dir))
 
     gen = Inv3DGenerator(output_dir, resume=False, args=args)
-    gen.process_tasks(num_workers=args.num_workers, verbose=args.verbose)
+    process_tasks(gen, args)
 
 
 if __name__ == "__main__":